@@ -0,0 +1 @@
+"""Benchmarks for json-flattener."""
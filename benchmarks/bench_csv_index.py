@@ -0,0 +1,92 @@
+"""
+Compare reading a range of rows through an index with reading up to it.
+
+Without an index, the rows in front of a range must be read (and parsed)
+to reach it. With a CSVIndex, only the bytes of the range are decoded.
+This script writes a TSV, checks that both give the same objects, then
+times building the index, loading the saved index, and reading ranges at
+the start and end of the file each way.
+
+Usage:
+
+    python -m benchmarks.bench_csv_index
+"""
+
+import os
+import tempfile
+import timeit
+from itertools import islice
+
+from json_flattener import (
+    CSVIndex,
+    GlobalConfig,
+    KeyConfig,
+    flatten_to_csv,
+    iter_unflatten_from_csv,
+)
+
+N_OBJECTS = 200000
+N_ROWS = 1000
+
+
+def make_config() -> GlobalConfig:
+    """Flatten the nested values into columns."""
+    return GlobalConfig(
+        key_configs={
+            "creator": KeyConfig(delete=True, flatten=True),
+            "books": KeyConfig(delete=True, is_list=True, flatten=True),
+        }
+    )
+
+
+def main():
+    """Run benchmark."""
+    config = make_config()
+    objs = [
+        {
+            "id": f"X:{i}",
+            "name": f"series {i}",
+            "creator": {"name": f"creator {i}", "born": 1900 + i % 100},
+            "books": [
+                {"id": f"X:{i}.{j}", "name": f"book {j}", "price": j + 0.99}
+                for j in range(3)
+            ],
+        }
+        for i in range(N_OBJECTS)
+    ]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "objects.tsv")
+        with open(path, "w") as stream:
+            flatten_to_csv(objs, stream, config)
+        t_build = timeit.timeit(
+            lambda: CSVIndex(path, config).close(), number=1
+        )
+        t_load = timeit.timeit(lambda: CSVIndex(path, config).close(), number=1)
+        size = os.path.getsize(path)
+        print(f"{N_OBJECTS} rows, {size / 1e6:.1f} MB")
+        print(f"build index: {t_build:.3f}s, load index: {t_load:.4f}s")
+        with CSVIndex(path, config) as index:
+            for start in (0, N_OBJECTS - N_ROWS):
+                stop = start + N_ROWS
+
+                def sequential():
+                    return list(
+                        islice(
+                            iter_unflatten_from_csv(path, config), start, stop
+                        )
+                    )
+
+                def indexed():
+                    return index.unflatten(start, stop)
+
+                assert sequential() == indexed()
+                t_sequential = timeit.timeit(sequential, number=1)
+                t_indexed = timeit.timeit(indexed, number=1)
+                print(
+                    f"rows {start}-{stop}: sequential {t_sequential:.3f}s"
+                    f" indexed {t_indexed:.4f}s"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Compare decoding CSV rows with per-column decoders and per-cell checks.
+
+The original reader looked up the configuration of each cell's column,
+unescaped it, and checked it for list markers, and then guessed its type
+by trying int() and float(). The current reader decides how to decode
+each column once, from the header, and guesses types only for cells that
+could be numbers. This script checks that both give identical rows, then
+times them against csv.reader alone on a wide TSV.
+
+Usage:
+
+    python -m benchmarks.bench_csv_reader
+"""
+
+import csv
+import io
+import timeit
+from typing import Any, Dict, Iterator, List, Optional
+
+from json_flattener import GlobalConfig, KeyConfig, Serializer, flatten_to_csv
+from json_flattener.flattener import (
+    MissingColumnError,
+    _column_parser,
+    _iter_csv_rows,
+    _serialized_fields,
+)
+
+N_OBJECTS = 5000
+N_COLUMNS = 50
+
+
+def guess_value(x: str) -> Optional[Any]:
+    """Original type guessing, kept as a reference."""
+    if x == "":
+        return None
+    else:
+        try:
+            return int(x)
+        except ValueError:
+            try:
+                return float(x)
+            except ValueError:
+                return x
+
+
+def per_cell_rows(instream, config: GlobalConfig) -> Iterator[Dict]:
+    """Original per-cell implementation, kept as a reference."""
+    internal_delimiter = config.csv_inner_delimiter
+    r = csv.DictReader(
+        instream,
+        delimiter=config.csv_delimiter,
+        quoting=csv.QUOTE_NONE,
+        escapechar="\\",
+    )
+    lo, lc = config.csv_list_markers
+    column_types = config.get_column_types()
+    parsers = {}
+    serialized_fields = _serialized_fields(config)
+    for row in r:
+        nu_obj = {}
+        for k, v in row.items():
+            if k is None:
+                raise MissingColumnError(row, v)
+            parse = parsers.get(k, None)
+            if parse is None:
+                parse = parsers[k] = _column_parser(
+                    k, column_types, guess_value
+                )
+            key_config = config.key_configs.get(k, None)
+            v = v.replace("\\n", "\n").replace("\\t", "\t")
+            is_direct_list = False
+            if key_config is not None and key_config.is_list:
+                is_direct_list = True
+            if not is_direct_list:
+                if (
+                    lo != ""
+                    and lc != ""
+                    and v.startswith(lo)
+                    and v.endswith(lc)
+                ):
+                    is_direct_list = True
+            if k in serialized_fields:
+                is_direct_list = False
+            if is_direct_list:
+                if lo != "":
+                    v = v.replace(lo, "", 1)
+                if lc != "":
+                    v = v[0 : -len(lc)]
+                v = [parse(x) for x in v.split(internal_delimiter)]
+            else:
+                v = parse(v)
+            if v is not None:
+                nu_obj[k] = v
+        yield nu_obj
+
+
+def make_objects() -> List[Dict]:
+    """Objects with list, text, int, float and empty columns."""
+    objs = []
+    for i in range(N_OBJECTS):
+        obj = {"id": f"X:{i}", "creator": {"name": f"creator {i}", "n": i}}
+        for c in range(N_COLUMNS):
+            kind = c % 5
+            if kind == 0:
+                obj[f"c{c}"] = [i, c]
+            elif kind == 1:
+                obj[f"c{c}"] = f"text {i}\twith tab"
+            elif kind == 2:
+                obj[f"c{c}"] = i * c
+            elif kind == 3:
+                obj[f"c{c}"] = i + 0.5
+        objs.append(obj)
+    return objs
+
+
+def make_config() -> GlobalConfig:
+    """Serialize one nested value."""
+    return GlobalConfig(
+        key_configs={
+            "creator": KeyConfig(delete=True, serializers=[Serializer.json])
+        }
+    )
+
+
+def main():
+    """Run benchmark."""
+    config = make_config()
+    output = io.StringIO()
+    flatten_to_csv(make_objects(), output, config)
+    tsv = output.getvalue()
+
+    def csv_reader():
+        return list(
+            csv.reader(
+                io.StringIO(tsv),
+                delimiter="\t",
+                quoting=csv.QUOTE_NONE,
+                escapechar="\\",
+            )
+        )
+
+    def per_cell():
+        return list(per_cell_rows(io.StringIO(tsv), config))
+
+    def per_column():
+        return list(_iter_csv_rows(io.StringIO(tsv), config))
+
+    assert per_cell() == per_column()
+    number = 3
+    times = {
+        label: min(timeit.repeat(f, number=number, repeat=3))
+        for label, f in [
+            ("csv.reader alone", csv_reader),
+            ("per-cell (original)", per_cell),
+            ("per-column decoders", per_column),
+        ]
+    }
+    print(f"{N_OBJECTS} rows x {N_COLUMNS + 2} columns, best of 3 x {number}")
+    t_reader = times["csv.reader alone"]
+    for label, t in times.items():
+        print(f"{label:20} {t:.3f}s ({t / t_reader:.1f}x csv.reader)")
+    speedup = times["per-cell (original)"] / times["per-column decoders"]
+    print(f"speedup: {speedup:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
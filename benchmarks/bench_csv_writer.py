@@ -0,0 +1,127 @@
+"""
+Compare the batched CSV writer with the original per-row DictWriter.
+
+The original writer encoded each row as a dict, one cell at a time, and
+wrote it with csv.DictWriter. The current writer encodes rows as lists in
+column order, and writes them with csv.writer.writerows in batches. This
+script checks that both produce identical output, then times them on
+flattened rows with string, numeric, empty and list cells.
+
+Usage:
+
+    python -m benchmarks.bench_csv_writer
+"""
+
+import csv
+import io
+import timeit
+from typing import Dict, List
+
+from json_flattener import (
+    ColumnSchema,
+    GlobalConfig,
+    KeyConfig,
+    flatten,
+    flatten_to_csv,
+)
+from json_flattener.flattener import _csv_rows_writer
+
+N_OBJECTS = 20000
+
+
+def dict_writer_to_csv(rows: List[Dict], outstream, config: GlobalConfig):
+    """Original per-row implementation, kept as a reference."""
+    internal_delimiter = config.csv_inner_delimiter
+    internal_delimiter_esc = f"\\{internal_delimiter}"
+    lo, lc = config.csv_list_markers
+
+    def _serialize_as_str(x):
+        if x is None:
+            return ""
+        else:
+            return (
+                str(x)
+                .replace("\\", "\\\\")
+                .replace(internal_delimiter, internal_delimiter_esc)
+            )
+
+    w = csv.DictWriter(
+        outstream,
+        delimiter=config.csv_delimiter,
+        fieldnames=ColumnSchema.from_rows(rows).columns,
+        quoting=csv.QUOTE_NONE,
+        escapechar="\\",
+        lineterminator="\n",
+        extrasaction="raise" if config.strict else "ignore",
+    )
+    w.writeheader()
+    for obj in rows:
+        nu_obj = {}
+        for k, v in obj.items():
+            if isinstance(v, list):
+                v = internal_delimiter.join([_serialize_as_str(x) for x in v])
+                v = f"{lo}{v}{lc}"
+            else:
+                v = _serialize_as_str(v)
+            nu_obj[k] = v
+        w.writerow(nu_obj)
+
+
+def make_objects() -> List[Dict]:
+    """Objects with a nested dict, a nested list, and scalars."""
+    return [
+        {
+            "id": f"X:{i}",
+            "name": f"name {i}" if i % 7 else "a|b\\",
+            "score": i * 0.5,
+            "count": i,
+            "flag": bool(i % 2),
+            "note": None if i % 3 else "note\twith tab",
+            "creator": {"name": f"creator {i}", "born": 1900 + i % 100},
+            "books": [
+                {"id": f"X:{i}.{j}", "name": f"book {j}", "price": j + 0.99}
+                for j in range(4)
+            ],
+        }
+        for i in range(N_OBJECTS)
+    ]
+
+
+def make_config() -> GlobalConfig:
+    """Flatten the nested values into columns, some holding lists."""
+    return GlobalConfig(
+        key_configs={
+            "creator": KeyConfig(delete=True, flatten=True),
+            "books": KeyConfig(delete=True, is_list=True, flatten=True),
+        }
+    )
+
+
+def main():
+    """Run benchmark."""
+    objs = make_objects()
+    config = make_config()
+    plan = config.compile()
+    rows = flatten(objs, plan)
+    schema = ColumnSchema.from_rows(rows)
+    expected = io.StringIO()
+    dict_writer_to_csv(rows, expected, config)
+    output = io.StringIO()
+    flatten_to_csv(objs, output, plan, schema)
+    assert output.getvalue() == expected.getvalue()
+    number = 5
+    t_dict_writer = timeit.timeit(
+        lambda: dict_writer_to_csv(rows, io.StringIO(), config), number=number
+    )
+    t_batched = timeit.timeit(
+        lambda: _csv_rows_writer(io.StringIO(), schema, config)(rows),
+        number=number,
+    )
+    print(f"{N_OBJECTS} rows x {len(schema)} columns, {number} runs")
+    print(f"DictWriter (original): {t_dict_writer:.3f}s")
+    print(f"writerows (batched):   {t_batched:.3f}s")
+    print(f"speedup: {t_dict_writer / t_batched:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
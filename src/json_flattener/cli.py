@@ -1,30 +1,58 @@
 """Command line interface."""
-import json
 import logging
 import os
 import sys
-from typing import List, TextIO, Union
+from contextlib import ExitStack
+from typing import BinaryIO, Dict, Iterable, List, Optional, TextIO, Union
 
 import click
 import yaml
 
-from json_flattener import GlobalConfig, KeyConfig, Serializer, flatten_to_csv, unflatten_from_csv
+from json_flattener import (
+    GlobalConfig,
+    KeyConfig,
+    flatten_to_csv,
+    infer_column_types,
+    iter_flatten,
+    iter_unflatten_from_csv,
+)
+from json_flattener.columnar import flatten_to_parquet, iter_unflatten_from_parquet
+from json_flattener.flattener import SERIALIZERS, YAML_LOADER, as_serializer
+from json_flattener.formats import (
+    JsonLinesFile,
+    ObjectFile,
+    write_json_array,
+    write_jsonl,
+    write_yaml_documents,
+    write_yaml_list,
+)
+from json_flattener.json_backends import (
+    AUTO_JSON_BACKEND,
+    DEFAULT_JSON_BACKEND,
+    JSON_BACKENDS,
+    get_json_backend,
+)
+from json_flattener.sqlite import (
+    DEFAULT_TABLE,
+    flatten_to_sqlite,
+    iter_unflatten_from_sqlite,
+)
 
 
 def _get_format(
-    input: str,
-    input_format: Union[str, TextIO] = None,
-    default_format: str = None,
+    input: Union[str, TextIO],
+    input_format: Optional[str] = None,
+    default_format: Optional[str] = None,
 ) -> str:
-    if input and not isinstance(input, str):
-        input = input.name
+    # streams, e.g. output files, are named after their path
+    path = input if isinstance(input, str) else getattr(input, "name", None)
     if input_format is None:
-        if input is None:
+        if path is None:
             if default_format is not None:
                 return default_format
             else:
                 raise Exception("Must pass file or default format")
-        _, ext = os.path.splitext(input)
+        _, ext = os.path.splitext(path)
         if ext is not None:
             input_format = ext.replace(".", "")
         else:
@@ -32,9 +60,10 @@ def _get_format(
                 return default_format
             else:
                 raise Exception(
-                    f"Must pass format  OR use known suffix: {input}"
+                    f"Must pass format  OR use known suffix: {path}"
                 )
-    return input_format.lower()
+    input_format = input_format.lower()
+    return FORMAT_ALIASES.get(input_format, input_format)
 
 
 def _is_xsv(fmt: str) -> bool:
@@ -61,7 +90,7 @@ def _get_config(
     for k in serialized_keys:
         if k not in kcs:
             kcs[k] = KeyConfig()
-        kcs[k].serializers = [Serializer(serializer)]
+        kcs[k].serializers = [as_serializer(serializer)]
     for k in multivalued_keys:
         if k not in kcs:
             kcs[k] = KeyConfig()
@@ -77,23 +106,94 @@ def _get_config(
         kc = kcs[k]
         kc.delete = True
         for v in v.split(","):
-            if v == "json":
-                kc.serializers = [Serializer("json")]
-            elif v == "yaml":
-                kc.serializers = [Serializer("yaml")]
-            elif v == "preserve":
+            if v == "preserve":
                 kc.delete = False
             elif v == "flat":
                 kc.flatten = True
             elif v == "multivalued":
                 kc.is_list = True
                 kc.flatten = True
+            elif v == "child":
+                kc.child_table = True
+            elif v in SERIALIZERS:
+                kc.serializers = [as_serializer(v)]
             else:
                 raise Exception(f"Unknown config val = {v}")
     return config
 
 
-FORMATS = ["tsv", "csv", "yaml", "json"]
+def _binary_output(output: TextIO) -> Union[str, BinaryIO]:
+    # output files are opened lazily by click, so can be reopened as binary
+    if isinstance(output, click.utils.LazyFile):
+        return output.name
+    return output.buffer
+
+
+def _output_path(output: TextIO) -> str:
+    where = _binary_output(output)
+    if not isinstance(where, str):
+        # child tables are named after the output file
+        raise click.UsageError(
+            "sqlite output, and child tables, must be written to a file"
+        )
+    return where
+
+
+def _child_paths(path: str, keys: List[str]) -> Dict[str, str]:
+    # child tables are written next to the parent, e.g. out_books.tsv
+    base, ext = os.path.splitext(path)
+    return {k: f"{base}_{k}{ext}" for k in keys}
+
+
+def _write_objects(
+    objs: Iterable[dict],
+    output: TextIO,
+    output_format: str,
+    key: Optional[str] = None,
+    multi_document: bool = False,
+    json_backend: Optional[str] = None,
+):
+    if output_format == "jsonl":
+        write_jsonl(objs, output, get_json_backend(json_backend))
+    elif output_format == "yaml" and multi_document:
+        write_yaml_documents(objs, output)
+    elif output_format == "yaml":
+        write_yaml_list(objs, output, key)
+    else:
+        write_json_array(objs, output, get_json_backend(json_backend), key)
+
+
+def _load_objects(
+    input: str,
+    input_format: str,
+    key: Optional[str] = None,
+    json_backend: Optional[str] = None,
+) -> List[dict]:
+    with open(input) as stream:
+        if input_format == "yaml":
+            obj = yaml.load(stream, Loader=YAML_LOADER)  # noqa: S506
+        elif input_format == "json":
+            obj = get_json_backend(json_backend).load_document(stream)
+    if isinstance(obj, list):
+        objs = obj
+    elif key is not None:
+        objs = obj[key]
+    elif isinstance(obj, dict) and len(obj.keys()) == 1:
+        key = list(obj.keys())[0]
+        logging.warning(
+            f"Selecting key automatically. Better to be explicit and pass in --key {key}"
+        )
+        objs = obj[key]
+    else:
+        objs = [obj]
+    logging.debug(f"INPUT={objs}")
+    if not isinstance(objs, list):
+        raise Exception(f"Obj must be a list")
+    return objs
+
+
+FORMATS = ["tsv", "csv", "yaml", "json", "jsonl", "parquet", "sqlite"]
+FORMAT_ALIASES = {"ndjson": "jsonl", "db": "sqlite", "sqlite3": "sqlite"}
 
 # Click input options common across commands
 input_option = click.option(
@@ -131,7 +231,7 @@ key_option = click.option(
 serializer_option = click.option(
     "-s",
     "--serializer",
-    help="Serializer to use for complex keys",
+    help=f'Serializer to use for complex keys, e.g. {",".join(SERIALIZERS)}',
 )
 serialized_keys_option = click.option(
     "-S",
@@ -155,13 +255,58 @@ config_option = click.option(
     "-C",
     "--config-key",
     multiple=True,
-    help="Key configuration. Must be of form KEY={yaml,json,flat,multivalued}*",
+    help="Key configuration. Must be of form KEY={SERIALIZER,flat,multivalued,child,preserve}*, where SERIALIZER is e.g. json or yaml."
+    " List elements of child keys are written to a child table, e.g. my_books.tsv for my.tsv",
 )
 load_config_option = click.option(
     "-c",
     "--load-config",
     help="Path to global configuration file to be loaded",
 )
+json_backend_option = click.option(
+    "--json-backend",
+    type=click.Choice(list(JSON_BACKENDS) + [AUTO_JSON_BACKEND]),
+    help=f"JSON implementation to use for files and json cells; default is {DEFAULT_JSON_BACKEND}",
+)
+incremental_option = click.option(
+    "--incremental/--no-incremental",
+    default=False,
+    show_default=True,
+    help="Parse json/yaml input one object at a time, rather than loading the whole file."
+    " Objects are taken from the list under --key, or from the root list or YAML documents.",
+)
+multi_document_option = click.option(
+    "--multi-document/--single-document",
+    default=False,
+    show_default=True,
+    help="For yaml output, write each object as a separate YAML document.",
+)
+infer_types_option = click.option(
+    "--infer-types/--no-infer-types",
+    default=False,
+    show_default=True,
+    help="Infer column types from a sample of objects, and save them with --save-config."
+    " Typed columns are parsed directly when unflattening.",
+)
+batch_size_option = click.option(
+    "--batch-size",
+    type=int,
+    help="Parse this many rows at a time, converting each column as a whole."
+    " Faster for numeric tables, especially if numpy is installed.",
+)
+jobs_option = click.option(
+    "-j",
+    "--jobs",
+    type=int,
+    help="Number of processes flattening or unflattening objects in parallel."
+    " Output is in the same order as the input.",
+)
+table_option = click.option(
+    "--table",
+    default=DEFAULT_TABLE,
+    show_default=True,
+    help="Table to write or read, for sqlite.",
+)
 save_config_option = click.option(
     "-O",
     "--save-config",
@@ -199,10 +344,15 @@ def main(verbose: int, quiet: bool):
 @config_option
 @load_config_option
 @save_config_option
+@infer_types_option
+@json_backend_option
+@incremental_option
+@jobs_option
+@table_option
 @key_option
 def flatten(
     input: str,
-    output: str,
+    output: TextIO,
     input_format: str,
     output_format: str,
     key: str,
@@ -212,6 +362,11 @@ def flatten(
     flatten_keys=[],
     save_config: str = None,
     load_config: str = None,
+    infer_types: bool = False,
+    json_backend: Optional[str] = None,
+    incremental: bool = False,
+    jobs: Optional[int] = None,
+    table: str = DEFAULT_TABLE,
     config_key=[],
 ):
     """Flatten a file to TSV/CSV
@@ -219,29 +374,34 @@ def flatten(
     Example:
 
         jfl flatten --input my.yaml --output my.tsv
+
+    Large documents can be flattened without loading them into memory:
+
+        jfl flatten --incremental --key books --input my.json --output my.tsv
+
+    Parquet output requires pyarrow:
+
+        jfl flatten --input my.yaml --output my.parquet
+
+    Objects can be flattened by several processes:
+
+        jfl flatten --jobs 8 --input my.yaml --output my.tsv
     """
     input_format = _get_format(input, input_format)
     output_format = _get_format(output, output_format, default_format="tsv")
-    with open(input) as stream:
-        if input_format == "yaml":
-            obj = yaml.safe_load(stream)
-        elif input_format == "json":
-            obj = json.load(stream)
-    if isinstance(obj, list):
-        objs = obj
-    elif key is not None:
-        objs = obj[key]
-    elif isinstance(obj, dict) and len(obj.keys()) == 1:
-        key = list(obj.keys())[0]
-        logging.warning(
-            f"Selecting key automatically. Better to be explicit and pass in --key {key}"
+    if input_format == "jsonl":
+        # objects are read one at a time, in two passes over the file:
+        # the first to find the columns, the second to write the rows
+        if key is not None:
+            logging.warning(f"Ignoring --key {key} for jsonl input")
+        objs: Iterable[dict] = JsonLinesFile(
+            input, get_json_backend(json_backend)
         )
-        objs = obj[key]
+    elif incremental:
+        # as above, objects are read one at a time in two passes
+        objs = ObjectFile(input, input_format, key)
     else:
-        objs = [obj]
-    logging.debug(f"INPUT={objs}")
-    if not isinstance(objs, list):
-        raise Exception(f"Obj must be a list")
+        objs = _load_objects(input, input_format, key, json_backend)
     config = _get_config(
         serializer=serializer,
         serialized_keys=serialized_keys,
@@ -249,8 +409,56 @@ def flatten(
         flatten_keys=flatten_keys,
         config_keys=config_key,
     )
+    if json_backend is not None:
+        config.json_backend = json_backend
     logging.debug(f"CONFIG={config}")
-    flatten_to_csv(objs, output, config=config)
+    two_pass = isinstance(objs, ObjectFile)
+    child_keys = [k for k, kc in config.key_configs.items() if kc.child_table]
+    if output_format == "parquet":
+        child_wheres = None
+        if child_keys:
+            child_wheres = _child_paths(_output_path(output), child_keys)
+        flatten_to_parquet(
+            objs,
+            _binary_output(output),
+            config=config,
+            two_pass=two_pass,
+            child_wheres=child_wheres,
+            workers=jobs,
+        )
+    elif output_format == "sqlite":
+        flatten_to_sqlite(
+            objs,
+            _output_path(output),
+            table,
+            config=config,
+            two_pass=two_pass,
+            workers=jobs,
+        )
+    elif child_keys:
+        child_paths = _child_paths(_output_path(output), child_keys)
+        with ExitStack() as stack:
+            child_outstreams = {
+                k: stack.enter_context(open(path, "w"))
+                for k, path in child_paths.items()
+            }
+            flatten_to_csv(
+                objs,
+                output,
+                config=config,
+                two_pass=two_pass,
+                child_outstreams=child_outstreams,
+                workers=jobs,
+            )
+    else:
+        flatten_to_csv(
+            objs, output, config=config, two_pass=two_pass, workers=jobs
+        )
+    if infer_types and save_config is None:
+        logging.warning("--infer-types has no effect without --save-config")
+    elif infer_types:
+        column_types = infer_column_types(iter_flatten(objs, config))
+        config.column_types.update(column_types)
     if save_config is not None:
         with open(save_config, "w") as stream:
             yaml.dump(config.as_dict(), stream)
@@ -267,10 +475,15 @@ def flatten(
 @serialized_keys_option
 @config_option
 @load_config_option
+@json_backend_option
+@multi_document_option
+@batch_size_option
+@jobs_option
+@table_option
 @key_option
 def unflatten(
     input: str,
-    output: str,
+    output: TextIO,
     input_format: str,
     output_format: str,
     key: str,
@@ -279,6 +492,11 @@ def unflatten(
     multivalued_keys=[],
     flatten_keys=[],
     load_config: str = None,
+    json_backend: Optional[str] = None,
+    multi_document: bool = False,
+    batch_size: Optional[int] = None,
+    jobs: Optional[int] = None,
+    table: str = DEFAULT_TABLE,
     config_key=[],
 ):
     """Unflatten a file from TSV/CSV
@@ -300,7 +518,23 @@ def unflatten(
     if load_config is not None:
         with open(load_config) as stream:
             config = GlobalConfig.from_dict(**yaml.safe_load(stream))
+    if json_backend is not None:
+        config.json_backend = json_backend
     logging.debug(f"CONFIG={config}")
+    child_keys = [k for k, kc in config.key_configs.items() if kc.child_table]
+    child_sources = _child_paths(input, child_keys) if child_keys else None
+    # objects are written as each row (or row group) is read
+    if input_format in ("parquet", "sqlite"):
+        if input_format == "parquet":
+            objs = iter_unflatten_from_parquet(
+                input, config, child_sources, workers=jobs
+            )
+        else:
+            objs = iter_unflatten_from_sqlite(input, table, config, workers=jobs)
+        _write_objects(
+            objs, output, output_format, key, multi_document, config.json_backend
+        )
+        return
     with open(input) as stream:
         if input_format == "tsv":
             sep = "\t"
@@ -309,16 +543,16 @@ def unflatten(
         else:
             sep = "\t"
             logging.warning(f"Guessing separator: {sep}")
-        objs = unflatten_from_csv(stream, config)
-    logging.debug(f"INPUT={objs}")
-    if key is not None:
-        obj = {key: objs}
-    else:
-        obj = objs
-    if output_format == "yaml":
-        yaml.safe_dump(obj, stream=output)
-    else:
-        json.dump(obj, output, indent=4, sort_keys=True)
+        objs = iter_unflatten_from_csv(
+            stream,
+            config,
+            batch_size=batch_size,
+            child_sources=child_sources,
+            workers=jobs,
+        )
+        _write_objects(
+            objs, output, output_format, key, multi_document, config.json_backend
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,471 @@
+"""
+Column-major output, for loading flattened objects into analytic engines.
+
+Rather than serializing rows as text, columns are returned as python lists,
+:class:`array.array` for numeric columns, or Apache Arrow tables if pyarrow
+is installed. List values (e.g. from ``is_list`` keys) are kept as lists,
+rather than joined into ``[a|b]`` strings.
+
+Arrow tables can also be written to and read from Parquet files.
+"""
+
+from array import array
+from itertools import islice
+from typing import (
+    Any,
+    BinaryIO,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Union,
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+from json_flattener.flattener import (
+    KEYNAME,
+    OBJECT,
+    ROW,
+    ColumnSchema,
+    FlattenPlan,
+    GlobalConfig,
+    _as_plan,
+    _flattened_tables,
+    infer_column_types,
+    iter_flatten,
+    iter_unflatten,
+    iter_unflatten_tables,
+)
+
+COLUMN = Union[List[Any], array]
+COLUMNS = Dict[KEYNAME, COLUMN]
+
+ARRAY_TYPECODES = {"int": "q", "float": "d"}
+"""array.array typecodes for numeric column types"""
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError(
+            "pyarrow is required for Arrow and Parquet; install with pip install pyarrow"
+        )
+
+
+def rows_to_columns(
+    rows: Sequence[ROW], fieldnames: Optional[Iterable[KEYNAME]] = None
+) -> Dict[KEYNAME, List[Any]]:
+    """
+    Transpose flattened rows into lists, one per column.
+
+    :param rows: flattened rows
+    :param fieldnames: columns, in order; defaults to all columns in rows
+    :return: mapping between column names and values, None where missing
+    """
+    if fieldnames is None:
+        fieldnames = ColumnSchema.from_rows(rows)
+    return {k: [row.get(k, None) for row in rows] for k in fieldnames}
+
+
+def flatten_to_columns(
+    objs: Iterable[OBJECT],
+    config: Optional[Union[GlobalConfig, FlattenPlan]] = None,
+    fieldnames: Optional[Iterable[KEYNAME]] = None,
+    typed_arrays: bool = True,
+) -> COLUMNS:
+    """
+    Flatten objects to columns.
+
+    If typed_arrays is set, columns of ints or floats without missing values
+    are returned as :class:`array.array`; the type of a column is taken
+    from the configuration's column types if declared, or else inferred.
+
+    :param objs:
+    :param config: mapping configuration, or a plan compiled from one
+    :param fieldnames: columns, in order; defaults to all discovered columns
+    :param typed_arrays: use array.array for numeric columns
+    :raises ValueError: if any keys are written to child tables
+    :return: mapping between column names and values, None where missing
+    """
+    plan = _as_plan(config)
+    rows = list(iter_flatten(objs, plan))
+    columns: COLUMNS = dict(rows_to_columns(rows, fieldnames))
+    if typed_arrays:
+        column_types = infer_column_types(rows, sample_size=len(rows))
+        column_types.update(plan.config.get_column_types())
+        for k, values in columns.items():
+            typecode = ARRAY_TYPECODES.get(column_types.get(k, ""), None)
+            if typecode is not None and None not in values:
+                try:
+                    columns[k] = array(typecode, values)
+                except (TypeError, OverflowError):
+                    # e.g. floats declared as int, or ints beyond 64 bits
+                    pass
+    return columns
+
+
+def _as_str(x: Any, keep_lists: bool) -> Any:
+    if x is None:
+        return None
+    if keep_lists and isinstance(x, list):
+        return [_as_str(v, False) for v in x]
+    return str(x)
+
+
+def _arrow_array(values: List[Any]) -> "pa.Array":
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        pass
+    # mixed types; use strings, as in a CSV, keeping lists if possible
+    try:
+        return pa.array([_as_str(v, True) for v in values])
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array([_as_str(v, False) for v in values])
+
+
+def columns_to_arrow(columns: Mapping[KEYNAME, Sequence[Any]]) -> "pa.Table":
+    """
+    Convert columns to an Arrow table.
+
+    Arrow types are inferred from the values; list values become list
+    arrays. Columns mixing incompatible types are converted to strings.
+
+    :param columns: mapping between column names and values
+    :return:
+    """
+    _require_pyarrow()
+    arrays = [_arrow_array(list(values)) for values in columns.values()]
+    return pa.Table.from_arrays(arrays, names=list(columns))
+
+
+def flatten_to_arrow(
+    objs: Iterable[OBJECT],
+    config: Optional[Union[GlobalConfig, FlattenPlan]] = None,
+    fieldnames: Optional[Iterable[KEYNAME]] = None,
+) -> "pa.Table":
+    """
+    Flatten objects to an Arrow table.
+
+    Requires pyarrow. Use :meth:`pyarrow.Table.to_batches` for record batches.
+
+    :param objs:
+    :param config: mapping configuration, or a plan compiled from one
+    :param fieldnames: columns, in order; defaults to all discovered columns
+    :raises ValueError: if any keys are written to child tables
+    :return:
+    """
+    _require_pyarrow()
+    rows = list(iter_flatten(objs, _as_plan(config)))
+    return columns_to_arrow(rows_to_columns(rows, fieldnames))
+
+
+def iter_unflatten_from_columns(
+    columns: Union[
+        Mapping[KEYNAME, Sequence[Any]], "pa.Table", "pa.RecordBatch"
+    ],
+    config: Optional[Union[GlobalConfig, FlattenPlan]] = None,
+) -> Iterator[OBJECT]:
+    """
+    Unflatten objects from columns, such as those from flatten_to_columns.
+
+    :param columns: mapping between column names and values, or an Arrow
+        table or record batch
+    :param config: mapping configuration, or a plan compiled from one
+    :return: iterator over unflattened objects
+    """
+    if pa is not None and isinstance(columns, (pa.Table, pa.RecordBatch)):
+        columns = columns.to_pydict()
+    keys = list(columns)
+    rows = (
+        {k: v for k, v in zip(keys, values) if v is not None}
+        for values in zip(*columns.values())
+    )
+    yield from iter_unflatten(rows, config)
+
+
+def _arrow_types() -> Dict[str, "pa.DataType"]:
+    # arrow types for names in COLUMN_TYPES
+    return {
+        "str": pa.string(),
+        "int": pa.int64(),
+        "float": pa.float64(),
+        "bool": pa.bool_(),
+        "date": pa.date32(),
+        "datetime": pa.timestamp("us"),
+    }
+
+
+def _unify_types(t1: "pa.DataType", t2: "pa.DataType") -> "pa.DataType":
+    if t1 == t2 or pa.types.is_null(t2):
+        return t1
+    if pa.types.is_null(t1):
+        return t2
+    try:
+        schema = pa.unify_schemas(
+            [pa.schema([("x", t1)]), pa.schema([("x", t2)])],
+            promote_options="permissive",
+        )
+        return schema.field("x").type
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.string()
+
+
+def _arrow_schema(
+    columns: Iterable[KEYNAME],
+    types: Dict[KEYNAME, "pa.DataType"],
+    config: GlobalConfig,
+) -> "pa.Schema":
+    # declared column types take precedence; columns with no values are strings
+    arrow_types = _arrow_types()
+    column_types = config.get_column_types()
+    fields = []
+    for k in columns:
+        t = types.get(k, pa.null())
+        declared = column_types.get(k, None)
+        if declared in arrow_types:
+            if pa.types.is_list(t):
+                t = pa.list_(arrow_types[declared])
+            else:
+                t = arrow_types[declared]
+        elif pa.types.is_null(t):
+            t = pa.string()
+        fields.append(pa.field(k, t))
+    return pa.schema(fields)
+
+
+def _iter_batches(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    items = iter(items)
+    while True:
+        batch = list(islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _cast(table: "pa.Table", schema: "pa.Schema") -> "pa.Table":
+    try:
+        return table.cast(schema)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+        raise ValueError(
+            f"Rows do not match the types of earlier rows ({e}); "
+            "declare column types, or discover them in a first pass"
+        )
+
+
+class _ArrowTypeDiscovery:
+    """Unifies the Arrow types of each table, one batch of rows at a time."""
+
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        self.buffers: Dict[Optional[KEYNAME], List[ROW]] = {}
+        self.types: Dict[Optional[KEYNAME], Dict[KEYNAME, "pa.DataType"]] = {}
+
+    def observe(self, table_key: Optional[KEYNAME], rows: List[ROW]):
+        buffer = self.buffers.setdefault(table_key, [])
+        buffer.extend(rows)
+        if len(buffer) >= self.batch_size:
+            self._flush(table_key)
+
+    def _flush(self, table_key: Optional[KEYNAME]):
+        buffer = self.buffers[table_key]
+        types = self.types.setdefault(table_key, {})
+        if buffer:
+            table = columns_to_arrow(rows_to_columns(buffer))
+            for f in table.schema:
+                types[f.name] = _unify_types(
+                    types.get(f.name, pa.null()), f.type
+                )
+        buffer.clear()
+
+    def finish(self) -> Dict[Optional[KEYNAME], Dict[KEYNAME, "pa.DataType"]]:
+        for table_key in self.buffers:
+            self._flush(table_key)
+        return self.types
+
+
+class _ParquetTableWriter:
+    """Writes batches of rows of a single table as row groups."""
+
+    def __init__(
+        self,
+        where: Union[str, BinaryIO],
+        schema: ColumnSchema,
+        types: Optional[Dict[KEYNAME, "pa.DataType"]],
+        config: GlobalConfig,
+    ):
+        self.where = where
+        self.schema = schema
+        self.config = config
+        self.arrow_schema = None
+        if types is not None:
+            self.arrow_schema = _arrow_schema(schema, types, config)
+        self.writer: Optional["pq.ParquetWriter"] = None
+
+    def write(self, rows: List[ROW]):
+        if not rows:
+            return
+        table = columns_to_arrow(rows_to_columns(rows, self.schema))
+        if self.arrow_schema is None:
+            # types are inferred from the first row group
+            types = {f.name: f.type for f in table.schema}
+            self.arrow_schema = _arrow_schema(self.schema, types, self.config)
+        table = _cast(table, self.arrow_schema)
+        self._open().write_table(
+            table, row_group_size=self.config.parquet_row_group_size
+        )
+
+    def _open(self) -> "pq.ParquetWriter":
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(
+                self.where,
+                self.arrow_schema,
+                compression=self.config.parquet_compression,
+            )
+        return self.writer
+
+    def close(self):
+        if self.writer is None:
+            # no rows; write the columns only
+            if self.arrow_schema is None:
+                self.arrow_schema = _arrow_schema(self.schema, {}, self.config)
+            self._open()
+        self.writer.close()
+
+
+def flatten_to_parquet(
+    objs: Iterable[OBJECT],
+    where: Union[str, BinaryIO],
+    config: Optional[Union[GlobalConfig, FlattenPlan]] = None,
+    fieldnames: Optional[Iterable[KEYNAME]] = None,
+    two_pass: bool = False,
+    child_wheres: Optional[Mapping[KEYNAME, Union[str, BinaryIO]]] = None,
+    workers: Optional[int] = None,
+) -> ColumnSchema:
+    """
+    Flatten objects to a Parquet file, one row group at a time.
+
+    Requires pyarrow. Compression and row group size are set on the
+    configuration. As with flatten_to_csv, rows are only written as they
+    are produced if the columns are known in advance (from ``fieldnames``,
+    ``config.csv_fieldnames`` or a first pass if ``two_pass`` is set);
+    otherwise all rows are flattened first. List elements of
+    ``child_table`` keys are written to separate files, one per key.
+
+    Column types are inferred from the values, unless declared in the
+    configuration. When streaming with ``fieldnames``, types are inferred
+    from the first row group.
+
+    :param objs:
+    :param where: path or binary stream to write to
+    :param config: mapping configuration, or a plan compiled from one
+    :param fieldnames: columns to write, in order
+    :param two_pass: discover columns and types in a separate pass over objs
+    :param child_wheres: path or binary stream for the child table of each
+        child key
+    :param workers: number of processes flattening objects, if more than one
+    :raises ValueError: if two_pass is set and objs is a one-shot iterator,
+        if values do not match the types of a column, or if a child key has
+        nowhere to be written
+    :return: the columns written
+    """
+    _require_pyarrow()
+    plan = _as_plan(config)
+    config = plan.config
+    row_group_size = config.parquet_row_group_size
+    if child_wheres is None:
+        child_wheres = {}
+    missing = [k for k in plan.child_keys if k not in child_wheres]
+    if missing:
+        raise ValueError(f"No output for child tables of {missing}")
+    discovery = _ArrowTypeDiscovery(row_group_size)
+    tables, schema, child_schemas = _flattened_tables(
+        objs, plan, fieldnames, two_pass, discovery.observe, workers
+    )
+    types = discovery.finish()
+    writers: Dict[Optional[KEYNAME], _ParquetTableWriter] = {
+        None: _ParquetTableWriter(where, schema, types.get(None), config)
+    }
+    for k in plan.child_keys:
+        writers[k] = _ParquetTableWriter(
+            child_wheres[k], child_schemas[k], types.get(k), config
+        )
+    try:
+        for batch in _iter_batches(tables, row_group_size):
+            writers[None].write([row for row, _ in batch])
+            for k in plan.child_keys:
+                child_rows = [
+                    r for _, children in batch for r in children.get(k, ())
+                ]
+                writers[k].write(child_rows)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return schema
+
+
+def _iter_parquet_rows(source: Union[str, BinaryIO]) -> Iterator[ROW]:
+    parquet_file = pq.ParquetFile(source)
+    for i in range(parquet_file.num_row_groups):
+        columns = parquet_file.read_row_group(i).to_pydict()
+        keys = list(columns)
+        for values in zip(*columns.values()):
+            yield {k: v for k, v in zip(keys, values) if v is not None}
+
+
+def iter_unflatten_from_parquet(
+    source: Union[str, BinaryIO],
+    config: Optional[Union[GlobalConfig, FlattenPlan]] = None,
+    child_sources: Optional[Mapping[KEYNAME, Union[str, BinaryIO]]] = None,
+    workers: Optional[int] = None,
+) -> Iterator[OBJECT]:
+    """
+    Read objects from a Parquet file, one row group at a time.
+
+    Requires pyarrow.
+
+    :param source: path or binary stream to read
+    :param config: mapping configuration, or a plan compiled from one
+    :param child_sources: child tables written for each child key; these
+        are merged into their parent objects as they are read
+    :param workers: number of processes unflattening rows, if more than one
+    :raises ValueError: if workers is set, and there are child tables
+    :return: iterator over unflattened objects
+    """
+    _require_pyarrow()
+    plan = _as_plan(config)
+    if workers is not None and workers > 1 and plan.child_keys:
+        raise ValueError("Child tables cannot be read by worker processes")
+    rows = _iter_parquet_rows(source)
+    if plan.child_keys:
+        child_tables = {
+            k: _iter_parquet_rows(src)
+            for k, src in (child_sources or {}).items()
+        }
+        yield from iter_unflatten_tables(rows, child_tables, plan)
+    else:
+        yield from iter_unflatten(rows, plan, workers)
+
+
+def unflatten_from_parquet(
+    source: Union[str, BinaryIO],
+    config: Optional[Union[GlobalConfig, FlattenPlan]] = None,
+    child_sources: Optional[Mapping[KEYNAME, Union[str, BinaryIO]]] = None,
+) -> List[OBJECT]:
+    """
+    Read objects from a Parquet file.
+
+    :param source: path or binary stream to read
+    :param config: mapping configuration, or a plan compiled from one
+    :param child_sources: child tables written for each child key
+    :return:
+    """
+    return list(iter_unflatten_from_parquet(source, config, child_sources))
@@ -0,0 +1,410 @@
+"""
+Random access to the rows of a flattened CSV, through a memory map.
+
+The offset of each record is found once, and saved in a sidecar index
+file (by default the path of the CSV with ``.idx`` appended), which is
+reused as long as the CSV is unchanged. Any range of rows can then be
+unflattened by decoding only its own bytes, with the header in front,
+so a range near the end of a large file costs no more than one near the
+start. Ranges can also be split into chunks for worker processes, each
+of which reads its own chunk from the file.
+"""
+
+import csv
+import io
+import logging
+import mmap
+import os
+import struct
+import sys
+from array import array
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from json_flattener.flattener import (
+    DEFAULT_CHUNK_SIZE,
+    KEYNAME,
+    OBJECT,
+    ColumnSchema,
+    FlattenPlan,
+    GlobalConfig,
+    _as_plan,
+    _get_worker_plan,
+    _iter_parallel,
+    _unflatten_csv_text,
+)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # type: ignore[assignment]
+
+INDEX_SUFFIX = ".idx"
+"""Suffix added to the path of a CSV for its index file"""
+
+# magic, then the size and modification time (ns) of the indexed CSV and
+# the number of offsets, followed by the offsets; all little-endian
+INDEX_MAGIC = b"JFLIDX1\n"
+INDEX_HEADER = struct.Struct("<8sQQQ")
+
+# bytes scanned for newlines at a time, when using numpy
+SCAN_BLOCK_SIZE = 1 << 26
+
+ENCODING = "utf-8"
+
+_NEWLINE = ord("\n")
+_BACKSLASH = ord("\\")
+_CR = ord("\r")
+
+
+def _is_escaped(buf: Union[bytes, mmap.mmap], pos: int) -> bool:
+    # as _escapes_newline: a newline is escaped if preceded by an odd
+    # number of backslashes
+    n = 0
+    while pos - n > 0 and buf[pos - n - 1] == _BACKSLASH:
+        n += 1
+    return n % 2 == 1
+
+
+def _record_offsets(mm: Union[bytes, mmap.mmap]) -> array:
+    """
+    Find where each record of a CSV starts.
+
+    Records end at newlines that are not escaped. Blank lines are skipped,
+    as they are when reading, so that the nth offset after the header is
+    that of the nth row. Newlines are found with numpy, if it is installed.
+
+    :param mm: memory map of the whole file
+    :return: the offset of each record, including the header, followed by
+        the size of the file
+    """
+    size = len(mm)
+    offsets = array("Q")
+    if size == 0:
+        offsets.append(0)
+        return offsets
+    if np is not None:
+        return _record_offsets_numpy(mm)
+    start = 0
+    pos = mm.find(b"\n")
+    while pos >= 0:
+        if not (mm[pos - 1] == _BACKSLASH and _is_escaped(mm, pos)):
+            n = pos - start
+            if n > 1 or (n == 1 and mm[start] != _CR):
+                offsets.append(start)
+            start = pos + 1
+        pos = mm.find(b"\n", pos + 1)
+    n = size - start
+    if n > 1 or (n == 1 and mm[start] != _CR):
+        offsets.append(start)
+    offsets.append(size)
+    return offsets
+
+
+def _record_offsets_numpy(mm: Union[bytes, mmap.mmap]) -> array:
+    # as _record_offsets, scanning a block at a time
+    size = len(mm)
+    buf = np.frombuffer(mm, dtype=np.uint8)
+    newlines = np.concatenate(
+        [
+            np.flatnonzero(buf[i : i + SCAN_BLOCK_SIZE] == _NEWLINE) + i
+            for i in range(0, size, SCAN_BLOCK_SIZE)
+        ]
+    )
+    # newlines after a backslash are rare, so are checked one at a time
+    after_backslash = newlines[newlines > 0]
+    after_backslash = after_backslash[buf[after_backslash - 1] == _BACKSLASH]
+    escaped = [p for p in after_backslash.tolist() if _is_escaped(mm, p)]
+    if escaped:
+        newlines = newlines[~np.isin(newlines, escaped)]
+    starts = np.concatenate(([0], newlines + 1))
+    lengths = np.concatenate((newlines, [size])) - starts
+    first = buf[np.minimum(starts, size - 1)]
+    non_blank = (lengths > 1) | ((lengths == 1) & (first != _CR))
+    offsets = array("Q")
+    offsets.frombytes(starts[non_blank].astype(np.uint64).tobytes())
+    offsets.append(size)
+    return offsets
+
+
+def _file_stamp(path: str) -> Tuple[int, int]:
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def _load_index(index_path: str, stamp: Tuple[int, int]) -> Optional[array]:
+    # the saved offsets, if the index exists and matches the CSV
+    try:
+        with open(index_path, "rb") as stream:
+            header = stream.read(INDEX_HEADER.size)
+            if len(header) != INDEX_HEADER.size:
+                return None
+            magic, size, mtime_ns, n = INDEX_HEADER.unpack(header)
+            if magic != INDEX_MAGIC or (size, mtime_ns) != stamp:
+                return None
+            offsets = array("Q")
+            offsets.frombytes(stream.read())
+    except (OSError, ValueError):
+        return None
+    if len(offsets) != n:
+        return None
+    if sys.byteorder != "little":
+        offsets.byteswap()
+    return offsets
+
+
+def _save_index(index_path: str, stamp: Tuple[int, int], offsets: array):
+    data = array("Q", offsets)
+    if sys.byteorder != "little":
+        data.byteswap()
+    with open(index_path, "wb") as stream:
+        stream.write(INDEX_HEADER.pack(INDEX_MAGIC, *stamp, len(data)))
+        data.tofile(stream)
+
+
+def _unflatten_csv_range(
+    chunk: Tuple[str, int, int, int, Optional[int]],
+) -> List[OBJECT]:
+    # runs in a worker, reading the header and one range of records; the
+    # plan is set when the worker starts, by _init_worker
+    path, header_end, start, end, batch_size = chunk
+    with open(path, "rb") as stream:
+        with mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            text = (mm[:header_end] + mm[start:end]).decode(ENCODING)
+    return _unflatten_csv_text(_get_worker_plan(), text, batch_size)
+
+
+class CSVIndex:
+    """
+    Index of the rows of a flattened CSV file, for random access.
+
+    The file is memory-mapped, and rows are numbered from 0, after the
+    header, in the order they are read by unflatten_from_csv:
+
+    >>> with CSVIndex("books.tsv", config) as index:  # doctest: +SKIP
+    ...     objs = index.unflatten(1_000_000, 1_010_000)
+
+    The file must be UTF-8, and must not change while it is open.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        config: Optional[Union[GlobalConfig, FlattenPlan]] = None,
+        index_path: Optional[str] = None,
+        save: bool = True,
+    ):
+        """
+        Open a CSV, loading its index, or building it if needed.
+
+        :param path: path to the CSV file
+        :param config: mapping configuration, or a plan compiled from one
+        :param index_path: where the index is kept; by default the path
+            of the CSV with ``.idx`` appended
+        :param save: save the index if it was built
+        """
+        self.path = path
+        self.plan = _as_plan(config)
+        if index_path is None:
+            index_path = f"{path}{INDEX_SUFFIX}"
+        self.index_path = index_path
+        stamp = _file_stamp(path)
+        self._stream = open(path, "rb")
+        self._mm: Union[bytes, mmap.mmap]
+        if stamp[0] == 0:
+            # empty files can't be mapped
+            self._mm = b""
+        else:
+            self._mm = mmap.mmap(
+                self._stream.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        offsets = _load_index(index_path, stamp)
+        if offsets is None:
+            offsets = _record_offsets(self._mm)
+            if save:
+                try:
+                    _save_index(index_path, stamp, offsets)
+                except OSError as e:
+                    logging.warning(f"Could not save index {index_path}: {e}")
+        self.offsets = offsets
+        self._key_indexes: Dict[KEYNAME, Dict[str, List[int]]] = {}
+
+    def close(self):
+        """Unmap and close the file."""
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._stream.close()
+
+    def __enter__(self) -> "CSVIndex":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self) -> int:
+        return max(len(self.offsets) - 2, 0)
+
+    @property
+    def columns(self) -> ColumnSchema:
+        """Columns of the header."""
+        header = self._header_text()
+        if not header:
+            return ColumnSchema()
+        reader = csv.reader(
+            io.StringIO(header),
+            delimiter=self.plan.config.csv_delimiter,
+            quoting=csv.QUOTE_NONE,
+            escapechar="\\",
+        )
+        return ColumnSchema(next(reader, []))
+
+    def _header_end(self) -> int:
+        if len(self.offsets) < 2:
+            return 0
+        return self.offsets[1]
+
+    def _header_text(self) -> str:
+        return self._mm[: self._header_end()].decode(ENCODING)
+
+    def _span(self, start: int, stop: int) -> Tuple[int, int]:
+        # byte offsets of rows start to stop, excluding stop
+        return self.offsets[start + 1], self.offsets[stop + 1]
+
+    def _range(self, start: int, stop: Optional[int]) -> range:
+        return range(*slice(start, stop).indices(len(self)))
+
+    def iter_unflatten(
+        self,
+        start: int = 0,
+        stop: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        workers: Optional[int] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> Iterator[OBJECT]:
+        """
+        Unflatten a range of rows, reading only the bytes of those rows.
+
+        Negative row numbers count from the end, as in slices.
+
+        :param start: first row
+        :param stop: row after the last, or None for the end of the file
+        :param batch_size: number of rows to parse at a time, if set; see
+            iter_unflatten_from_csv
+        :param workers: number of worker processes, if more than one; each
+            reads its chunks of rows from the file itself
+        :param chunk_size: number of rows read and unflattened at a time
+        :raises ValueError: if the config has child tables
+        :return: iterator over unflattened objects, in order
+        """
+        plan = self.plan
+        if plan.child_keys:
+            raise ValueError(
+                f"Child tables are not supported: {plan.child_keys}"
+            )
+        rows = self._range(start, stop)
+        chunks = [
+            (i, min(i + chunk_size, rows.stop))
+            for i in range(rows.start, rows.stop, chunk_size)
+        ]
+        if workers is not None and workers > 1:
+            header_end = self._header_end()
+            ranges = (
+                (self.path, header_end, *self._span(i, j), batch_size)
+                for i, j in chunks
+            )
+            for objs in _iter_parallel(
+                _unflatten_csv_range, ranges, plan, workers
+            ):
+                yield from objs
+            return
+        header = self._header_text()
+        for i, j in chunks:
+            begin, end = self._span(i, j)
+            text = header + self._mm[begin:end].decode(ENCODING)
+            yield from _unflatten_csv_text(plan, text, batch_size)
+
+    def unflatten(
+        self, start: int = 0, stop: Optional[int] = None, **params
+    ) -> List[OBJECT]:
+        """
+        Unflatten a range of rows.
+
+        :param start: first row
+        :param stop: row after the last, or None for the end of the file
+        :param params: e.g. workers; see iter_unflatten
+        :return: unflattened objects, in order
+        """
+        return list(self.iter_unflatten(start, stop, **params))
+
+    def iter_unflatten_rows(
+        self,
+        rows: Iterable[int],
+        batch_size: Optional[int] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> Iterator[OBJECT]:
+        """
+        Unflatten the given rows, in the order given.
+
+        :param rows: row numbers, e.g. from find
+        :param batch_size: number of rows to parse at a time, if set
+        :param chunk_size: number of rows read and unflattened at a time
+        :raises IndexError: if a row is out of range
+        :return: iterator over unflattened objects
+        """
+        plan = self.plan
+        header = self._header_text()
+        n = len(self)
+        rows = iter(rows)
+        chunk = list(islice(rows, chunk_size))
+        while chunk:
+            parts = [header]
+            for i in chunk:
+                if not -n <= i < n:
+                    raise IndexError(f"Row {i} out of range for {n} rows")
+                i %= n
+                begin, end = self._span(i, i + 1)
+                parts.append(self._mm[begin:end].decode(ENCODING))
+                if not parts[-1].endswith("\n"):
+                    # the last row need not end with a newline
+                    parts[-1] += "\n"
+            yield from _unflatten_csv_text(plan, "".join(parts), batch_size)
+            chunk = list(islice(rows, chunk_size))
+
+    def find(self, column: KEYNAME, value: str) -> List[int]:
+        """
+        Find the rows with a given value in a column, e.g. an id.
+
+        Values are compared as text, as written to the CSV. The first call
+        for each column reads the whole column once; later calls only look
+        the value up.
+
+        :param column: name of the column
+        :param value: text of the cell
+        :raises ValueError: if there is no such column
+        :return: numbers of the matching rows, in order
+        """
+        key_index = self._key_indexes.get(column, None)
+        if key_index is None:
+            key_index = self._key_indexes[column] = self._index_column(column)
+        return list(key_index.get(value, []))
+
+    def _index_column(self, column: KEYNAME) -> Dict[str, List[int]]:
+        columns = self.columns.columns
+        if column not in columns:
+            raise ValueError(f"No column {column} in {self.path}")
+        pos = columns.index(column)
+        key_index: Dict[str, List[int]] = {}
+        with open(self.path, encoding=ENCODING, newline="") as stream:
+            reader = csv.reader(
+                stream,
+                delimiter=self.plan.config.csv_delimiter,
+                quoting=csv.QUOTE_NONE,
+                escapechar="\\",
+            )
+            # blank lines are skipped, as in the index
+            rows = (row for row in reader if row)
+            next(rows, None)
+            for i, row in enumerate(rows):
+                value = row[pos] if pos < len(row) else ""
+                key_index.setdefault(value, []).append(i)
+        return key_index
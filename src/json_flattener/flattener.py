@@ -4,15 +4,60 @@ Procedures for flattening and unflattening dicts to tables.
 See README.md for full details
 """
 
+import base64
 import csv
+import io
 import json
 import logging
+import pickle  # noqa: S403
+import re
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import ExitStack
+from copy import copy, deepcopy
 from dataclasses import dataclass, field
+from datetime import date, datetime
 from enum import Enum, unique
-from typing import Any, Dict, List, Optional, Set, TextIO, Tuple, Union
+from functools import partial
+from itertools import islice, zip_longest
+from operator import methodcaller
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    TextIO,
+    Tuple,
+    Union,
+)
 
 import yaml
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+try:
+    import numpy as np
+except ImportError:
+    np = None  # type: ignore[assignment]
+
+from json_flattener.json_backends import (
+    DEFAULT_JSON_BACKEND,
+    JSONBackend,
+    get_json_backend,
+)
+
 DEFAULT_LIST_PARENS = ("[", "]")
 KEYNAME = str
 ATOM = Union[str, int, float]
@@ -20,6 +65,13 @@ CELL_VALUE = Union[ATOM, List[ATOM]]
 ROW = Dict[KEYNAME, CELL_VALUE]
 OBJECT = Dict[KEYNAME, Any]
 
+# use the libyaml bindings when available; these are many times faster
+# than the pure python loader and dumper
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+# the largest line width accepted by libyaml, i.e. never wrap lines
+YAML_FLOW_WIDTH = 2**31 - 1
+
 
 class MissingColumnError(ValueError):
     """Exception raised when a column is missing from a row."""
@@ -34,6 +86,7 @@ class Serializer(Enum):
     """Vocabulary of methods to use for serialization objects."""
 
     yaml = "yaml"
+    yaml_flow = "yaml_flow"
     json = "json"
     pickle = "pickle"
     as_str = "as_str"
@@ -44,6 +97,9 @@ class Serializer(Enum):
         return list(map(lambda c: c.value, Serializer))
 
 
+SERIALIZER = Union[Serializer, str]
+
+
 @dataclass
 class ConfigEntity:
     """Base class for configurations."""
@@ -76,8 +132,8 @@ class KeyConfig(ConfigEntity):
     delete: bool = False
     """for nested columns, if denormalized into other columns"""
 
-    serializers: List[Serializer] = None
-    """all serializers to apply"""
+    serializers: List[SERIALIZER] = None
+    """all serializers to apply; either a Serializer or the name of a registered serializer"""
 
     flatten: bool = False
     """Flatten this field"""
@@ -92,10 +148,19 @@ class KeyConfig(ConfigEntity):
     """All distinct values (unused)"""
 
     mappings: Dict[KEYNAME, KEYNAME] = None
-    """maps normalized keys to denormalized"""
+    """maps normalized keys to denormalized; learned when flattening, unless compiled with a FlattenState"""
+
+    paths: Dict[KEYNAME, List[KEYNAME]] = field(default_factory=dict)
+    """maps denormalized keys to the path of keys nested below the field"""
+
+    max_depth: Optional[int] = None
+    """Levels of nested objects to flatten; 0 for no limit, None to use the global setting"""
 
     typemap: Dict[KEYNAME, str] = None
-    """Mapping of types"""
+    """Types of the columns derived from this key, e.g. {"books_price": "float"}; see COLUMN_TYPES"""
+
+    child_table: bool = False
+    """Write list elements as rows of a separate child table, rather than as parallel lists"""
 
     def __post_init__(self):
         if self.serializers is None:
@@ -103,12 +168,11 @@ class KeyConfig(ConfigEntity):
         if self.serializers is not None:
             if not isinstance(self.serializers, List):
                 self.serializers = [self.serializers]
-            self.serializers = [
-                Serializer(x) if isinstance(x, str) else x
-                for x in self.serializers
-            ]
+            self.serializers = [as_serializer(x) for x in self.serializers]
         if self.mappings is None:
             self.mappings = {}
+        if self.paths is None:
+            self.paths = {}
 
     @staticmethod
     def from_dict(**obj: Dict[str, Any]):
@@ -119,7 +183,7 @@ class KeyConfig(ConfigEntity):
         :return:
         """
         nu = KeyConfig(**obj)
-        nu.serializers = [Serializer(s) for s in nu.serializers]
+        nu.serializers = [as_serializer(s) for s in nu.serializers]
         return nu
 
     def _type_map(self):
@@ -137,11 +201,31 @@ class GlobalConfig(ConfigEntity):
     csv_list_markers: Tuple[str, str] = field(
         default_factory=lambda: DEFAULT_LIST_PARENS
     )
+    csv_fieldnames: Optional[List[KEYNAME]] = None
+    """Columns to write; if set, rows are streamed without a discovery pass"""
     strict: bool = field(default_factory=lambda: True)
+    max_depth: int = field(default_factory=lambda: 1)
+    """Levels of nested objects to flatten, unless set on the key; 0 for no limit"""
+    json_backend: str = field(default_factory=lambda: DEFAULT_JSON_BACKEND)
+    """JSON implementation used by the json serializer, e.g. json, orjson, ujson, auto"""
+    binary_encoding: str = field(default_factory=lambda: "base64")
+    """Text encoding for binary serializers such as pickle; a key in BINARY_ENCODINGS"""
+    column_types: Dict[KEYNAME, str] = field(default_factory=dict)
+    """Types of columns when reading a CSV; see COLUMN_TYPES. Other columns are guessed"""
+    parquet_compression: str = field(default_factory=lambda: "snappy")
+    """Compression codec for Parquet files, e.g. snappy, zstd, gzip, none"""
+    parquet_row_group_size: int = field(default_factory=lambda: 65536)
+    """Maximum number of rows in each Parquet row group"""
+    row_column: str = field(default_factory=lambda: "_row")
+    """Column numbering parent rows, and referencing them from child tables"""
+    position_column: str = field(default_factory=lambda: "_position")
+    """Column in child tables holding the position of the element in its list"""
 
     def __post_init__(self):
         if self.key_configs is None:
             self.key_configs = {}
+        if self.column_types is None:
+            self.column_types = {}
         # for k, v in self.key_configs.items():
         #    self.key_configs[k] = KeyConfig(v)
 
@@ -161,279 +245,1573 @@ class GlobalConfig(ConfigEntity):
     def _type_map(self):
         return {"key_configs": KeyConfig}
 
+    def get_column_types(self) -> Dict[KEYNAME, str]:
+        """
+        Get the declared types of all columns.
+
+        Types declared in a key's typemap take precedence over column_types.
+
+        :return: mapping between column names and names in COLUMN_TYPES
+        """
+        column_types = dict(self.column_types)
+        for key_config in self.key_configs.values():
+            if key_config.typemap:
+                column_types.update(key_config.typemap)
+        return column_types
+
+    def compile(self, state: Optional["FlattenState"] = None) -> "FlattenPlan":
+        """
+        Compile into a plan that can be applied repeatedly to records.
+
+        :param state: where columns learned while flattening are recorded;
+            by default, in this configuration
+        :return:
+        """
+        return FlattenPlan(self, state)
+
 
 CONFIGMAP = Dict[KEYNAME, KeyConfig]
 
 
+@dataclass
+class KeyState:
+    """Columns and values learned while flattening a single key."""
+
+    mappings: Dict[KEYNAME, KEYNAME] = field(default_factory=dict)
+    """maps normalized keys to denormalized, as in KeyConfig.mappings"""
+
+    paths: Dict[KEYNAME, List[KEYNAME]] = field(default_factory=dict)
+    """maps denormalized keys to paths of nested keys, as in KeyConfig.paths"""
+
+    distinct_values: Optional[Set[Any]] = field(default_factory=set)
+    """melted list elements, as in KeyConfig.distinct_values"""
+
+
+class FlattenState:
+    """
+    State accumulated while flattening, kept apart from the configuration.
+
+    A configuration compiled with a state is only read while flattening;
+    the columns injected for each key are recorded in the state instead.
+    Each run (e.g. each thread, task or worker process) can then share one
+    configuration, with a state of its own. States can be merged, and
+    applied to a copy of the configuration, e.g. to unflatten or save it.
+    """
+
+    def __init__(self):
+        """Create an empty state."""
+        self.key_states: Dict[KEYNAME, KeyState] = {}
+
+    @staticmethod
+    def _of_config(config: GlobalConfig) -> "FlattenState":
+        # a view of the mappings held in the configuration itself, which
+        # is updated in place, as when flattening without a state
+        state = FlattenState()
+        for k, key_config in config.key_configs.items():
+            if key_config.melt_list_elements and key_config.distinct_values is None:
+                key_config.distinct_values = set()
+            state.key_states[k] = KeyState(
+                key_config.mappings, key_config.paths, key_config.distinct_values
+            )
+        return state
+
+    def _seed(self, config: GlobalConfig):
+        # columns already known to the configuration, e.g. loaded from a file
+        for k, key_config in config.key_configs.items():
+            key_state = self.key_states.setdefault(k, KeyState())
+            key_state.mappings.update(key_config.mappings)
+            key_state.paths.update(key_config.paths)
+            if key_config.distinct_values:
+                if key_state.distinct_values is None:
+                    key_state.distinct_values = set()
+                key_state.distinct_values.update(key_config.distinct_values)
+
+    def merge(self, other: "FlattenState"):
+        """
+        Add the columns and values learned in another state.
+
+        New columns are added after those already known, so merging the
+        states of consecutive chunks of objects in order gives the same
+        columns as flattening them in a single run.
+
+        :param other: state of another run
+        :return:
+        """
+        for k, other_state in other.key_states.items():
+            key_state = self.key_states.setdefault(k, KeyState())
+            key_state.mappings.update(other_state.mappings)
+            key_state.paths.update(other_state.paths)
+            if other_state.distinct_values:
+                if key_state.distinct_values is None:
+                    key_state.distinct_values = set()
+                key_state.distinct_values.update(other_state.distinct_values)
+
+    def to_config(self, config: GlobalConfig) -> GlobalConfig:
+        """
+        Apply this state to a copy of a configuration.
+
+        :param config: configuration used to flatten
+        :return: copy of config, with the mappings learned in this state
+        """
+        config = deepcopy(config)
+        FlattenState._of_config(config).merge(self)
+        return config
+
+
+class ColumnSchema:
+    """
+    Insertion-ordered set of the columns of a flattened table.
+
+    Columns are kept in the order they are first seen. Discovery is linear
+    in the number of cells, and a schema discovered in one export can be
+    passed as the ``fieldnames`` of later exports to skip discovery.
+    """
+
+    def __init__(self, columns: Iterable[KEYNAME] = ()):
+        """Initialize schema, optionally with known columns."""
+        self._columns: Dict[KEYNAME, None] = dict.fromkeys(columns)
+
+    @staticmethod
+    def from_rows(rows: Iterable[ROW]) -> "ColumnSchema":
+        """
+        Discover the columns used in a collection of rows.
+
+        :param rows:
+        :return:
+        """
+        schema = ColumnSchema()
+        schema.update(rows)
+        return schema
+
+    def add_row(self, row: ROW):
+        """
+        Add any columns in a row not yet seen.
+
+        :param row:
+        :return:
+        """
+        self._columns.update(dict.fromkeys(row))
+
+    def update(self, rows: Iterable[ROW]):
+        """
+        Add any columns in rows not yet seen.
+
+        :param rows:
+        :return:
+        """
+        columns = self._columns
+        for row in rows:
+            columns.update(dict.fromkeys(row))
+
+    @property
+    def columns(self) -> List[KEYNAME]:
+        """All columns, in order."""
+        return list(self._columns)
+
+    def __iter__(self) -> Iterator[KEYNAME]:
+        return iter(self._columns)
+
+    def __len__(self) -> int:
+        return len(self._columns)
+
+    def __contains__(self, column: KEYNAME) -> bool:
+        return column in self._columns
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, ColumnSchema):
+            return self.columns == other.columns
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"ColumnSchema({self.columns})"
+
+
+def _parse_bool(x: str) -> bool:
+    if x in ("True", "true"):
+        return True
+    if x in ("False", "false"):
+        return False
+    raise ValueError(f"Not a boolean: {x}")
+
+
+COLUMN_TYPES: Dict[str, Callable[[str], Any]] = {
+    "str": str,
+    "int": int,
+    "float": float,
+    "bool": _parse_bool,
+    "date": date.fromisoformat,
+    "datetime": datetime.fromisoformat,
+}
+"""Parsers for declared column types, keyed by type name"""
+
+
+def _infer_type(v: Any) -> Optional[str]:
+    # bool is a subclass of int, and datetime of date, so check these first
+    if isinstance(v, bool):
+        return "bool"
+    if isinstance(v, int):
+        return "int"
+    if isinstance(v, float):
+        return "float"
+    if isinstance(v, datetime):
+        return "datetime"
+    if isinstance(v, date):
+        return "date"
+    if isinstance(v, str):
+        return "str"
+    return None
+
+
+def infer_column_types(
+    rows: Iterable[ROW], sample_size: int = 1000
+) -> Dict[KEYNAME, str]:
+    """
+    Infer column types from a sample of flattened rows.
+
+    A column is typed only if all sampled values (or list elements) have the
+    same type; ints and floats together are typed as float. Other columns
+    are left undeclared, and are guessed when read.
+
+    :param rows: flattened rows, e.g. from iter_flatten
+    :param sample_size: maximum number of rows to examine
+    :return: mapping between column names and names in COLUMN_TYPES
+    """
+    seen: Dict[KEYNAME, Set[Optional[str]]] = {}
+    for n, row in enumerate(rows):
+        if n >= sample_size:
+            break
+        for k, v in row.items():
+            types = seen.setdefault(k, set())
+            for x in v if isinstance(v, list) else [v]:
+                if x is not None:
+                    types.add(_infer_type(x))
+    column_types = {}
+    for k, types in seen.items():
+        if types == {"int", "float"}:
+            types = {"float"}
+        if len(types) == 1:
+            (t,) = types
+            if t is not None:
+                column_types[k] = t
+    return column_types
+
+
+def _column_parser(
+    column: KEYNAME, column_types: Dict[KEYNAME, str], guess: Callable
+) -> Callable[[str], Any]:
+    type_name = column_types.get(column, None)
+    if type_name is None:
+        return guess
+    if type_name not in COLUMN_TYPES:
+        raise ValueError(
+            f"Unknown type {type_name} for column {column}; must be one of {list(COLUMN_TYPES)}"
+        )
+    parse = COLUMN_TYPES[type_name]
+
+    def _parse(x: str) -> Optional[Any]:
+        if x == "":
+            return None
+        return parse(x)
+
+    return _parse
+
+
 def _serialized_field_name(
-    field: KEYNAME, sep: str, serializer: Serializer
+    field: KEYNAME, sep: str, serializer: SERIALIZER
 ) -> str:
-    return f"{field}{sep}{serializer.name}"
+    return f"{field}{sep}{serializer_name(serializer)}"
+
+
+def _yaml_dump(obj: Any) -> str:
+    return yaml.dump(obj, Dumper=YAML_DUMPER)
+
+
+def _yaml_flow_dump(obj: Any) -> str:
+    # a single line, e.g. {name: JRR Tolkein, from_country: England}
+    return yaml.dump(
+        obj,
+        Dumper=YAML_DUMPER,
+        default_flow_style=True,
+        width=YAML_FLOW_WIDTH,
+    ).rstrip("\n")
+
+
+def _yaml_load(serialized: str) -> Any:
+    return yaml.load(serialized, Loader=YAML_LOADER)  # noqa: S506
+
+
+def _json_compact_dumps(obj: Any) -> str:
+    return json.dumps(obj, separators=(",", ":"))
+
+
+@dataclass
+class SerializerFunctions:
+    """Functions implementing a serializer."""
+
+    dumps: Callable[[Any], Any]
+    """Serialize a value as a str, or as bytes for binary serializers"""
+
+    loads: Optional[Callable[[Any], Any]] = None
+    """Parse a serialized value; None if serialization is one way"""
+
+    binary: bool = False
+    """If set, dumps produces bytes, which are encoded as text for tables"""
+
+
+SERIALIZERS: Dict[str, SerializerFunctions] = {
+    Serializer.yaml.value: SerializerFunctions(_yaml_dump, _yaml_load),
+    Serializer.yaml_flow.value: SerializerFunctions(_yaml_flow_dump, _yaml_load),
+    Serializer.json.value: SerializerFunctions(json.dumps, json.loads),
+    Serializer.pickle.value: SerializerFunctions(
+        pickle.dumps, pickle.loads, binary=True
+    ),
+    Serializer.as_str.value: SerializerFunctions(str),
+    "json_compact": SerializerFunctions(_json_compact_dumps, json.loads),
+}
+"""All available serializers, keyed by name"""
+
+BINARY_ENCODINGS: Dict[str, Tuple[Callable, Callable]] = {
+    "base64": (base64.b64encode, base64.b64decode),
+}
+"""Encoders and decoders used to store the output of binary serializers as text"""
+
+
+def register_serializer(
+    name: str,
+    dumps: Callable[[Any], Any],
+    loads: Optional[Callable[[Any], Any]] = None,
+    binary: bool = False,
+):
+    """
+    Register a serializer, which can then be used by name in a KeyConfig.
+
+    :param name: name of serializer; serialized fields are suffixed with this
+    :param dumps: function serializing a value
+    :param loads: function reversing dumps, if the serialization is reversible
+    :param binary: set if dumps returns bytes rather than str
+    :return:
+    """
+    SERIALIZERS[name] = SerializerFunctions(dumps, loads, binary=binary)
+
+
+if msgpack is not None:
+    register_serializer("msgpack", msgpack.packb, msgpack.unpackb, binary=True)
+if cbor2 is not None:
+    register_serializer("cbor", cbor2.dumps, cbor2.loads, binary=True)
+
+
+def serializer_name(serializer: SERIALIZER) -> str:
+    """
+    Name of a serializer, as used in the registry and in serialized field names.
+
+    :param serializer:
+    :return:
+    """
+    if isinstance(serializer, Serializer):
+        return serializer.value
+    return serializer
+
+
+def as_serializer(serializer: SERIALIZER) -> SERIALIZER:
+    """
+    Normalize a serializer, using the Serializer enum for built-in serializers.
+
+    :param serializer: a Serializer, or the name of a registered serializer
+    :raises ValueError: if the serializer is not known
+    :return:
+    """
+    if isinstance(serializer, Serializer):
+        return serializer
+    if serializer in Serializer.list():
+        return Serializer(serializer)
+    if serializer in SERIALIZERS:
+        return serializer
+    raise ValueError(
+        f"unknown serializer: {serializer}; must be one of {list(SERIALIZERS)}"
+    )
+
+
+def _bind_serializer(
+    serializer: SERIALIZER, config: GlobalConfig, json_backend: JSONBackend
+) -> Tuple[Callable[[Any], Any], Optional[Callable[[Any], Any]]]:
+    name = serializer_name(serializer)
+    if name not in SERIALIZERS:
+        raise NotImplementedError(f"unknown serializer: {serializer}")
+    functions = SERIALIZERS[name]
+    dumps, loads = functions.dumps, functions.loads
+    if name == Serializer.json.value:
+        dumps, loads = json_backend.dumps, json_backend.loads
+    if functions.binary:
+        return _encode_binary(dumps, loads, config.binary_encoding)
+    return dumps, loads
+
+
+def _encode_binary(
+    dumps: Callable[[Any], bytes],
+    loads: Optional[Callable[[bytes], Any]],
+    encoding: str,
+) -> Tuple[Callable[[Any], str], Optional[Callable[[Any], Any]]]:
+    if encoding not in BINARY_ENCODINGS:
+        raise ValueError(
+            f"unknown binary encoding: {encoding}; must be one of {list(BINARY_ENCODINGS)}"
+        )
+    encode, decode = BINARY_ENCODINGS[encoding]
+
+    def encoded_dumps(obj: Any) -> str:
+        return encode(dumps(obj)).decode("ascii")
+
+    if loads is None:
+        return encoded_dumps, None
+    binary_loads = loads
+
+    def decoded_loads(serialized: Union[str, bytes]) -> Any:
+        # unencoded bytes are accepted, e.g. rows flattened in memory
+        if isinstance(serialized, str):
+            return binary_loads(decode(serialized))
+        return binary_loads(serialized)
+
+    return encoded_dumps, decoded_loads
+
+
+OPERATION = Callable[[Dict[KEYNAME, Any]], None]
+KEY_OPERATION = Callable[[KeyState, Dict[KEYNAME, Any]], None]
+"""An operation on a record, given the state of the key it applies to"""
+
+
+class FlattenPlan:
+    """
+    A configuration compiled into a fixed sequence of per-record operations.
+
+    All decisions that depend only on the configuration (which serializer
+    function to call, which fields are flattened or melted, the names of
+    injected fields) are made once, when the plan is built. Applying the
+    plan to a record then just runs each operation in turn.
+
+    Plans are created with :meth:`GlobalConfig.compile`, and can be passed
+    anywhere a configuration is accepted by :func:`flatten` and
+    :func:`unflatten` and their streaming counterparts. A plan is a snapshot:
+    recompile if the configuration is subsequently changed.
+
+    Columns injected while flattening (e.g. ``creator_name``) are recorded
+    in the plan's state, and looked up there when unflattening. By default
+    this is the configuration itself; compile with a :class:`FlattenState`,
+    or use :meth:`with_state`, to leave the configuration unchanged.
+    """
+
+    def __init__(
+        self, config: GlobalConfig, state: Optional[FlattenState] = None
+    ):
+        """Compile a configuration."""
+        self.config = config
+        if state is None:
+            state = FlattenState._of_config(config)
+        else:
+            state._seed(config)
+        self.state = state
+        json_backend = get_json_backend(config.json_backend)
+        # serializer functions are looked up once, when compiling
+        dumpers = {}
+        loaders = {}
+        for key_config in config.key_configs.values():
+            for serializer in key_config.serializers:
+                dumps, loads = _bind_serializer(serializer, config, json_backend)
+                dumpers[serializer] = dumps
+                if loads is not None:
+                    loaders[serializer] = loads
+        self._key_flatten_operations: List[Tuple[KEYNAME, KEY_OPERATION]] = []
+        self._key_unflatten_operations: List[Tuple[KEYNAME, KEY_OPERATION]] = []
+        self.child_keys: List[KEYNAME] = []
+        """Keys whose list elements are written to child tables"""
+        for field_name, key_config in config.key_configs.items():
+            if key_config.child_table:
+                self.child_keys.append(field_name)
+                continue
+            for operation in _compile_flatten(
+                field_name, key_config, config, dumpers
+            ):
+                self._key_flatten_operations.append((field_name, operation))
+            for operation in _compile_unflatten(
+                field_name, key_config, config, loaders
+            ):
+                self._key_unflatten_operations.append((field_name, operation))
+        self._bind()
+
+    def _bind(self):
+        # operations are bound to the state of their key once, rather
+        # than looking it up for every record
+        key_states = self.state.key_states
+        self.flatten_operations: List[OPERATION] = [
+            partial(operation, key_states[k])
+            for k, operation in self._key_flatten_operations
+        ]
+        self.unflatten_operations: List[OPERATION] = [
+            partial(operation, key_states[k])
+            for k, operation in self._key_unflatten_operations
+        ]
+
+    def with_state(self, state: FlattenState) -> "FlattenPlan":
+        """
+        Get a copy of this plan that records columns in another state.
+
+        The compiled operations are shared, so this is cheap, e.g. to give
+        each thread a state of its own.
+
+        :param state: state of the new run
+        :return:
+        """
+        plan = copy(self)
+        state._seed(self.config)
+        plan.state = state
+        plan._bind()
+        return plan
+
+    def flatten_object(self, obj: OBJECT) -> ROW:
+        """
+        Flatten a single object.
+
+        :param obj: object to be flattened; this is not modified
+        :return: flattened copy of obj
+        """
+        row = obj.copy()
+        for operation in self.flatten_operations:
+            operation(row)
+        return row
+
+    def unflatten_row(self, row: ROW) -> OBJECT:
+        """
+        Unflatten a single row.
+
+        :param row: row to be unflattened; this is not modified
+        :return: unflattened copy of row
+        """
+        obj = row.copy()
+        for operation in self.unflatten_operations:
+            operation(obj)
+        return obj
+
+    def flatten_object_tables(
+        self, obj: OBJECT, row_number: int
+    ) -> Tuple[ROW, Dict[KEYNAME, List[ROW]]]:
+        """
+        Flatten a single object, moving list elements of child keys to child rows.
+
+        The parent row is numbered in the row column, and the number of
+        elements of each child key is recorded (e.g. as ``books_count``), so
+        that empty lists can be distinguished from missing values.
+
+        :param obj: object to be flattened; this is not modified
+        :param row_number: number of the parent row, referenced by child rows
+        :return: flattened copy of obj, and child rows for each child key
+        """
+        if not self.child_keys:
+            return self.flatten_object(obj), {}
+        config = self.config
+        row: ROW = {config.row_column: row_number}
+        row.update(obj)
+        children: Dict[KEYNAME, List[ROW]] = {}
+        for k in self.child_keys:
+            elements = row.get(k, None)
+            if isinstance(elements, list):
+                del row[k]
+                row[_child_count_field(k, config.sep)] = len(elements)
+                children[k] = [
+                    _child_row(k, row_number, i, element, config)
+                    for i, element in enumerate(elements)
+                ]
+        for operation in self.flatten_operations:
+            operation(row)
+        return row, children
+
+    def unflatten_row_tables(
+        self, row: ROW, children: Dict[KEYNAME, List[ROW]]
+    ) -> OBJECT:
+        """
+        Unflatten a single row, with its child rows.
+
+        :param row: row to be unflattened; this is not modified
+        :param children: child rows referencing row, for each child key
+        :return: unflattened copy of row
+        """
+        obj = self.unflatten_row(row)
+        if not self.child_keys:
+            return obj
+        config = self.config
+        obj.pop(config.row_column, None)
+        for k in self.child_keys:
+            if obj.pop(_child_count_field(k, config.sep), None) is not None:
+                obj[k] = [
+                    _child_element(k, child_row, config)
+                    for child_row in children.get(k, [])
+                ]
+        return obj
+
+
+def _child_count_field(field_name: KEYNAME, sep: str) -> KEYNAME:
+    return f"{field_name}{sep}count"
+
+
+def _child_row(
+    field_name: KEYNAME,
+    row_number: int,
+    position: int,
+    element: Any,
+    config: GlobalConfig,
+) -> ROW:
+    child_row: ROW = {
+        config.row_column: row_number,
+        config.position_column: position,
+    }
+    if isinstance(element, dict):
+        child_row.update(element)
+    else:
+        # e.g. a list of strings
+        child_row[field_name] = element
+    return child_row
+
+
+def _child_element(field_name: KEYNAME, child_row: ROW, config: GlobalConfig) -> Any:
+    element = {
+        k: v
+        for k, v in child_row.items()
+        if k != config.row_column and k != config.position_column
+    }
+    if len(element) == 1 and field_name in element:
+        return element[field_name]
+    return element
+
+
+def _compile_flatten(
+    field_name: KEYNAME,
+    key_config: KeyConfig,
+    config: GlobalConfig,
+    dumpers: Dict[SERIALIZER, Callable[[Any], Any]],
+) -> List[KEY_OPERATION]:
+    sep = config.sep
+    operations = []
+    # Serializers: some fields may be serialized as json/yaml blobs
+    for serializer in key_config.serializers:
+        operations.append(
+            _serialize_operation(
+                field_name,
+                # typically a field `foo` holding an object will be mapped to `foo_json` or `foo_yaml`
+                _serialized_field_name(field_name, sep, serializer),
+                dumpers[serializer],
+            )
+        )
+
+    # injected field names are built once per inner key, e.g. book_name,
+    # and recorded in the mappings of the state
+    def _injected_field(
+        field_map: Dict[KEYNAME, KEYNAME], k: KEYNAME
+    ) -> KEYNAME:
+        injected_field = field_map.get(k)
+        if injected_field is None:
+            injected_field = field_map[k] = f"{field_name}{sep}{k}"
+        return injected_field
+
+    # flattening non-list objects
+    if key_config.flatten and not key_config.is_list:
+        max_depth = key_config.max_depth
+        if max_depth is None:
+            max_depth = config.max_depth
+
+        def _check_inner(obj: OBJECT) -> OBJECT:
+            inner_obj = obj[field_name]
+            if not isinstance(inner_obj, dict):
+                # inner object is assumed to be a complex object
+                raise Exception(
+                    f"Value of {field_name} = {obj}, which is not a dict. Consider configuring {field_name} to be a list"
+                )
+            return inner_obj
+
+        def _flatten_inner(key_state: KeyState, obj: OBJECT):
+            field_map = key_state.mappings
+            for k, v in _check_inner(obj).items():
+                injected_field = field_map.get(k)
+                if injected_field is None:
+                    injected_field = _injected_field(field_map, k)
+                obj[injected_field] = v  # e.g. book_name = "..."
+
+        path_fields: Dict[Tuple[KEYNAME, ...], KEYNAME] = {}
+
+        def _path_field(path: Tuple[KEYNAME, ...]) -> KEYNAME:
+            injected_field = path_fields.get(path)
+            if injected_field is None:
+                injected_field = sep.join([field_name] + [str(k) for k in path])
+                path_fields[path] = injected_field
+            return injected_field
+
+        def _flatten_nested(key_state: KeyState, obj: OBJECT):
+            field_map = key_state.mappings
+            paths = key_state.paths
+            # walk nested objects depth-first with an explicit stack,
+            # so that columns appear in the order of the original keys
+            stack: List[Tuple[Tuple[KEYNAME, ...], Iterator[Tuple[str, Any]]]] = [
+                ((), iter(_check_inner(obj).items()))
+            ]
+            while stack:
+                path, items = stack[-1]
+                for k, v in items:
+                    if (
+                        isinstance(v, dict)
+                        and v
+                        and (max_depth == 0 or len(path) + 1 < max_depth)
+                    ):
+                        stack.append((path + (k,), iter(v.items())))
+                        break
+                    if path:
+                        injected_field = _path_field(path + (k,))
+                        obj[injected_field] = v  # e.g. book_author_name
+                        if injected_field not in paths:
+                            paths[injected_field] = list(path + (k,))
+                    else:
+                        obj[_injected_field(field_map, k)] = v
+                else:
+                    stack.pop()
+
+        if max_depth == 1:
+            operations.append(_flatten_inner)
+        else:
+            operations.append(_flatten_nested)
+    # flattening lists of objects
+    if key_config.flatten and key_config.is_list:
+        melt = key_config.melt_list_elements
+
+        def _flatten_list(key_state: KeyState, obj: OBJECT):
+            field_map = key_state.mappings
+            inner_objs = obj.get(field_name, [])
+            inner_fields = set()
+            for inner_obj in inner_objs:
+                inner_fields.update(inner_obj.keys())
+            injected_field_map: Dict[KEYNAME, List[Any]] = {}
+            for k in inner_fields:
+                injected_field_map[k] = obj[_injected_field(field_map, k)] = []
+            for inner_obj in inner_objs:
+                for k, values in injected_field_map.items():
+                    v = inner_obj.get(k, None)
+                    values.append(v)
+                    if v is not None and melt:
+                        obj[v] = True
+
+        operations.append(_flatten_list)
+    if key_config.melt_list_elements and not (
+        key_config.flatten and key_config.is_list
+    ):
+
+        def _melt(key_state: KeyState, obj: OBJECT):
+            inner_objs = obj.get(field_name, [])
+            if key_state.distinct_values is None:
+                key_state.distinct_values = set()
+            key_state.distinct_values.update(inner_objs)
+            for inner_obj in inner_objs:
+                obj[inner_obj] = True
+
+        operations.append(_melt)
+    if key_config.delete:
+
+        def _delete(key_state: KeyState, obj: OBJECT):
+            obj.pop(field_name, None)
+
+        operations.append(_delete)
+    return operations
+
+
+def _serialize_operation(
+    field_name: KEYNAME, injected_field: KEYNAME, dump: Callable[[Any], Any]
+) -> KEY_OPERATION:
+    def _serialize(key_state: KeyState, obj: OBJECT):
+        if field_name in obj:
+            obj[injected_field] = dump(obj[field_name])
+
+    return _serialize
+
+
+def _compile_unflatten(
+    field: KEYNAME,
+    key_config: KeyConfig,
+    config: GlobalConfig,
+    loaders: Dict[SERIALIZER, Callable[[Any], Any]],
+) -> List[KEY_OPERATION]:
+    sep = config.sep
+    operations = []
+    # unflatten from fields foo_json ==> foo
+    for serializer in key_config.serializers:
+        operations.append(
+            _deserialize_operation(
+                field,
+                _serialized_field_name(field, sep, serializer),
+                serializer,
+                loaders.get(serializer),
+            )
+        )
+    # mappings are looked up in the state when the operation runs, as they
+    # are populated by flattening after the plan is compiled
+    # non-list objects: unflatten foo_bar == "..." --> foo.bar
+    if key_config.flatten and not key_config.is_list:
+
+        def _unflatten_inner(key_state: KeyState, obj: OBJECT):
+            field_map = key_state.mappings
+            inner_obj: OBJECT = {}
+            logging.info(
+                "field=%s, obj=%s using fmap=%s", field, obj, field_map
+            )
+            for k, injected_field in field_map.items():
+                if injected_field in obj:
+                    inner_obj[k] = obj.pop(injected_field)
+            # objects nested more than one level deep
+            for injected_field, path in key_state.paths.items():
+                if injected_field in obj:
+                    target = inner_obj
+                    for k in path[:-1]:
+                        target = target.setdefault(k, {})
+                    target[path[-1]] = obj.pop(injected_field)
+            if field not in obj:
+                obj[field] = inner_obj
+
+        operations.append(_unflatten_inner)
+    # list objects: unflatten foo_bar == [...] --> foo = [bar1, ...]
+    if key_config.flatten and key_config.is_list:
+
+        def _unflatten_list(key_state: KeyState, obj: OBJECT):
+            field_map = key_state.mappings
+            logging.info("field_map = %s", field_map)
+            # ignore null values or empty lists
+            fmap_actual = {
+                k: obj[injected_field]
+                for k, injected_field in field_map.items()
+                if injected_field in obj
+                and obj[injected_field] is not None
+                and len(obj[injected_field]) > 0
+            }
+            if fmap_actual:
+                # seed inner objects, using an arbitrary column for the length
+                inner_objs: List[OBJECT] = [
+                    {} for _ in next(iter(fmap_actual.values()))
+                ]
+                for k, values in fmap_actual.items():
+                    for inner_obj, v in zip(inner_objs, values):
+                        if v is not None:
+                            inner_obj[k] = v
+                if field not in obj:
+                    obj[field] = inner_objs
+            for injected_field in field_map.values():
+                obj.pop(injected_field, None)
+
+        operations.append(_unflatten_list)
+    return operations
+
+
+def _deserialize_operation(
+    field: KEYNAME,
+    injected_field: KEYNAME,
+    serializer: SERIALIZER,
+    load: Optional[Callable[[Any], Any]],
+) -> KEY_OPERATION:
+    def _deserialize(key_state: KeyState, obj: ROW):
+        if injected_field in obj:
+            serialized_v = obj[injected_field]
+            if serialized_v is not None:
+                if load is None:
+                    raise NotImplementedError(f"unknown serializer: {serializer}")
+                obj[field] = load(serialized_v)
+            del obj[injected_field]
+        else:
+            logging.error(f"Expected: {injected_field} in {obj}")
+
+    return _deserialize
+
+
+def _as_plan(config: Union[GlobalConfig, FlattenPlan, None]) -> FlattenPlan:
+    if config is None:
+        config = GlobalConfig()
+    if isinstance(config, FlattenPlan):
+        return config
+    return config.compile()
+
+
+DEFAULT_CHUNK_SIZE = 1000
+"""Number of objects or rows sent to a worker process at a time"""
+
+# the plan of a worker process, compiled once from the configuration
+# shipped when the process is started
+_worker_plan: Optional[FlattenPlan] = None
+
+
+def _init_worker(config: GlobalConfig):
+    global _worker_plan
+    _worker_plan = config.compile(FlattenState())
+
+
+def _get_worker_plan() -> FlattenPlan:
+    if _worker_plan is None:
+        raise ValueError("Worker process was not initialized")
+    return _worker_plan
+
+
+def _iter_chunks(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    it = iter(items)
+    chunk = list(islice(it, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(it, size))
+
+
+def _iter_parallel(
+    function: Callable[[Any], Any],
+    chunks: Iterable[Any],
+    plan: FlattenPlan,
+    workers: int,
+) -> Iterator[Any]:
+    """
+    Apply function to each chunk in a pool of worker processes.
+
+    The configuration, with the columns learned so far, is sent to each
+    process once, when it is started. Results are yielded in order, with a
+    bounded number of chunks in flight, so that chunks can be read lazily
+    from a large input.
+    """
+    config = plan.state.to_config(plan.config)
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(config,)
+    ) as executor:
+        pending: Deque[Future] = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(function, chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _flatten_chunk(
+    chunk: Tuple[Optional[int], List[OBJECT]]
+) -> Tuple[list, FlattenState]:
+    # runs in a worker; rows are numbered from start, if not None, with
+    # list elements of child keys as child rows
+    start, objs = chunk
+    plan = _get_worker_plan().with_state(FlattenState())
+    results: List[Any]
+    if start is None:
+        results = [plan.flatten_object(obj) for obj in objs]
+    else:
+        results = [
+            plan.flatten_object_tables(obj, start + i)
+            for i, obj in enumerate(objs)
+        ]
+    return results, plan.state
+
+
+def _iter_flatten_parallel(
+    objs: Iterable[OBJECT],
+    plan: FlattenPlan,
+    workers: int,
+    chunk_size: int,
+    tables: bool,
+) -> Iterator[Any]:
+    def _chunks():
+        start = 0
+        for chunk in _iter_chunks(objs, chunk_size):
+            yield (start if tables else None), chunk
+            start += len(chunk)
+
+    # states are merged in input order, so columns are in the same order
+    # as if the objects had been flattened in a single process
+    for results, state in _iter_parallel(
+        _flatten_chunk, _chunks(), plan, workers
+    ):
+        plan.state.merge(state)
+        yield from results
+
+
+def _unflatten_chunk(rows: List[ROW]) -> List[OBJECT]:
+    # runs in a worker
+    return [_get_worker_plan().unflatten_row(row) for row in rows]
+
+
+def iter_flatten(
+    objs: Iterable[OBJECT],
+    config: Optional[Union[GlobalConfig, FlattenPlan]] = None,
+    workers: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[ROW]:
+    """
+    Flattens objects one at a time, yielding each denormalized row.
+
+    Unlike :func:`flatten`, the input can be any iterable (e.g. a generator
+    reading records from a file), and only a single object is held in
+    memory at any time.
+
+    If workers is set, objects are flattened in chunks by a pool of worker
+    processes, and rows are yielded in input order. Columns discovered by
+    the workers are merged into the configuration as each chunk is
+    returned. Workers must be able to import any registered serializers.
+
+    :param objs: an iterable of dicts to be flattened
+    :param config: mapping configuration, or a plan compiled from one
+    :param workers: number of worker processes, if more than one
+    :param chunk_size: number of objects sent to a worker at a time
+    :raises NotImplementedError:
+    :raises ValueError: if any keys are written to child tables; see
+        iter_flatten_tables
+    :return: iterator over flattened dicts
+    """
+    plan = _as_plan(config)
+    if plan.child_keys:
+        raise ValueError(f"Child tables are not supported: {plan.child_keys}")
+    if workers is not None and workers > 1:
+        yield from _iter_flatten_parallel(objs, plan, workers, chunk_size, False)
+        return
+    flatten_object = plan.flatten_object
+    for obj in objs:
+        yield flatten_object(obj)
+
+
+TABLE_ROWS = Tuple[ROW, Dict[KEYNAME, List[ROW]]]
+
+
+def iter_flatten_tables(
+    objs: Iterable[OBJECT],
+    config: Optional[Union[GlobalConfig, FlattenPlan]] = None,
+    workers: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[TABLE_ROWS]:
+    """
+    Flattens objects one at a time, with list elements of child_table keys as child rows.
+
+    Each child row references its parent by row number, and records its
+    position in the list, so row width stays bounded for large lists.
+
+    :param objs: an iterable of dicts to be flattened
+    :param config: mapping configuration, or a plan compiled from one
+    :param workers: number of worker processes, if more than one; see iter_flatten
+    :param chunk_size: number of objects sent to a worker at a time
+    :return: iterator over flattened dicts, each with child rows for each child key
+    """
+    plan = _as_plan(config)
+    if workers is not None and workers > 1:
+        yield from _iter_flatten_parallel(objs, plan, workers, chunk_size, True)
+        return
+    flatten_object_tables = plan.flatten_object_tables
+    for row_number, obj in enumerate(objs):
+        yield flatten_object_tables(obj, row_number)
+
+
+def flatten_tables(
+    objs: Iterable[OBJECT],
+    config: Optional[Union[GlobalConfig, FlattenPlan]] = None,
+) -> Tuple[List[ROW], Dict[KEYNAME, List[ROW]]]:
+    """
+    Flattens objects into a parent table, and a child table for each child_table key.
+
+    :param objs: an iterable of dicts to be flattened
+    :param config: mapping configuration, or a plan compiled from one
+    :return: parent rows, and child rows for each child key
+    """
+    plan = _as_plan(config)
+    rows: List[ROW] = []
+    child_tables: Dict[KEYNAME, List[ROW]] = {k: [] for k in plan.child_keys}
+    for row, children in iter_flatten_tables(objs, plan):
+        rows.append(row)
+        for k, child_rows in children.items():
+            child_tables[k].extend(child_rows)
+    return rows, child_tables
 
 
 def flatten(
-    objs: List[OBJECT], config: GlobalConfig = GlobalConfig()
+    objs: List[OBJECT],
+    config: Optional[Union[GlobalConfig, FlattenPlan]] = None,
+    workers: Optional[int] = None,
 ) -> List[ROW]:
     """
     Flattens a list of dicts into a denormalized representation.
 
     :param objs: a list of dicts to be flattened
-    :param config: mapping configuration
+    :param config: mapping configuration, or a plan compiled from one
+    :param workers: number of worker processes, if more than one; see iter_flatten
     :raises NotImplementedError:
+    :raises ValueError: if any keys are written to child tables
     :return: list of flattened dicts
     """
-    sep = config.sep
-    configmap = config.key_configs
-    objs2 = [obj.copy() for obj in objs]
-    # outer loop is based on keys, with inner loops for object lists, this is more efficient
-    for field_name, config in configmap.items():
-        field_map = config.mappings
-        # Serializers: some fields may be serialized as json/yaml blobs
-        serializers = config.serializers
-        for serializer in serializers:
-            # typically a field `foo` holding an object will be mapped to `foo_json` or `foo_yaml`
-            injected_field = _serialized_field_name(field_name, sep, serializer)
-            for obj in objs2:
-                if field_name in obj:
-                    if serializer == Serializer.yaml:
-                        dumpstr = yaml.dump(obj[field_name])
-                    elif serializer == Serializer.json:
-                        dumpstr = json.dumps(obj[field_name])
-                    elif serializer == Serializer.pickle:
-                        import pickle
-
-                        dumpstr = pickle.dumps(obj[field_name])
-                    elif serializer == Serializer.as_str:
-                        dumpstr = str(obj[field_name])
-                    else:
-                        raise NotImplementedError(f"unknown serializer: {serializer}")
-                    obj[injected_field] = dumpstr
-        if config.melt_list_elements:
-            if config.distinct_values is None:
-                config.distinct_values = set()
-        # flattening non-list objects
-        if config.flatten and not config.is_list:
-            for obj in objs2:
-                inner_obj = obj[field_name]
-                if not isinstance(inner_obj, dict):
-                    # inner object is assumed to be a complex object
-                    raise Exception(
-                        f"Value of {field_name} = {obj}, which is not a dict. Consider configuring {field_name} to be a list"
-                    )
-                for k, v in inner_obj.items():
-                    # flatten inner object. TODO: recursively expand
-                    injected_field = f"{field_name}{sep}{k}"
-                    obj[injected_field] = v  # e.g. book_name = "..."
-                    field_map[k] = injected_field
-        # flattening lists of objects
-        if config.flatten and config.is_list:
-            for obj in objs2:
-                inner_objs = obj.get(field_name, [])
-                inner_fields = set()
-                for inner_obj in inner_objs:
-                    inner_fields.update(inner_obj.keys())
-                injected_field_map: Dict[KEYNAME, KEYNAME] = {}
-                for k in inner_fields:
-                    injected_field_map[
-                        k
-                    ] = f"{field_name}{sep}{k}"  # e.g book_price
-                    obj[injected_field_map[k]] = []
-                for inner_obj in inner_objs:
-                    for k, injected_field in injected_field_map.items():
-                        v = inner_obj.get(k, None)
-                        obj[injected_field].append(v)
-                        if v is not None and config.melt_list_elements:
-                            obj[v] = True
-                        field_map[k] = injected_field
-        if config.melt_list_elements and not (
-            config.flatten and config.is_list
-        ):
-            for obj in objs2:
-                inner_objs = obj.get(field_name, [])
-                if config.melt_list_elements:
-                    config.distinct_values.update(inner_objs)
-                for inner_obj in inner_objs:
-                    if config.melt_list_elements:
-                        obj[inner_obj] = True
-        if config.delete:
-            for obj in objs2:
-                if field_name in obj:
-                    del obj[field_name]
-    return objs2
+    return list(iter_flatten(objs, config, workers))
+
+
+def iter_unflatten(
+    objs: Iterable[ROW],
+    config: Optional[Union[GlobalConfig, FlattenPlan]] = None,
+    workers: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    **params,
+) -> Iterator[OBJECT]:
+    """
+    Reverses the flatten operation one row at a time.
+
+    If workers is set, rows are unflattened in chunks by a pool of worker
+    processes, and objects are yielded in input order.
+
+    :param objs: an iterable of dicts to be unflattened
+    :param config: mapping configuration, or a plan compiled from one
+    :param workers: number of worker processes, if more than one
+    :param chunk_size: number of rows sent to a worker at a time
+    :param params:
+    :raises NotImplementedError:
+    :raises ValueError: if any keys are written to child tables; see
+        iter_unflatten_tables
+    :return: iterator over unflattened dicts
+    """
+    plan = _as_plan(config)
+    if plan.child_keys:
+        raise ValueError(f"Child tables are not supported: {plan.child_keys}")
+    if workers is not None and workers > 1:
+        chunks = _iter_chunks(objs, chunk_size)
+        for objs in _iter_parallel(_unflatten_chunk, chunks, plan, workers):
+            yield from objs
+        return
+    unflatten_row = plan.unflatten_row
+    for obj in objs:
+        yield unflatten_row(obj)
+
+
+def iter_unflatten_tables(
+    rows: Iterable[ROW],
+    child_tables: Mapping[KEYNAME, Iterable[ROW]],
+    config: Optional[Union[GlobalConfig, FlattenPlan]] = None,
+) -> Iterator[OBJECT]:
+    """
+    Reverses iter_flatten_tables, merging child rows into their parents.
+
+    Parent rows and child rows must both be in order of row number, as they
+    are written, so that tables can be merged as they are streamed.
+
+    :param rows: parent rows
+    :param child_tables: child rows for each child key
+    :param config: mapping configuration, or a plan compiled from one
+    :return: iterator over unflattened dicts
+    """
+    plan = _as_plan(config)
+    row_column = plan.config.row_column
+    child_iterators = {k: iter(child_rows) for k, child_rows in child_tables.items()}
+    # the next child row of each table, not yet merged
+    pending = {k: next(it, None) for k, it in child_iterators.items()}
+    for row in rows:
+        row_number: Any = row.get(row_column, None)
+        children: Dict[KEYNAME, List[ROW]] = {}
+        if row_number is None:
+            # e.g. a row written without child tables
+            yield plan.unflatten_row_tables(row, children)
+            continue
+        for k, it in child_iterators.items():
+            child_rows = children[k] = []
+            child_row = pending[k]
+            while child_row is not None and child_row[row_column] <= row_number:
+                if child_row[row_column] == row_number:
+                    child_rows.append(child_row)
+                child_row = next(it, None)
+            pending[k] = child_row
+        yield plan.unflatten_row_tables(row, children)
 
 
 def unflatten(
-    objs: List[ROW], config: GlobalConfig = GlobalConfig(), **params
+    objs: List[ROW],
+    config: Optional[Union[GlobalConfig, FlattenPlan]] = None,
+    **params,
 ) -> List[OBJECT]:
     """
     Reverses the flatten operation
 
     :param objs: list of dicts to be unflattened
-    :param config:
-    :param params:
+    :param config: mapping configuration, or a plan compiled from one
+    :param params: e.g. workers; see iter_unflatten
     :raises NotImplementedError:
+    :raises ValueError: if any keys are written to child tables
     :return:
     """
-    sep = config.sep
-    configmap = config.key_configs
-    objs2 = [obj.copy() for obj in objs]
-    for field, config in configmap.items():
-        field_map = config.mappings
-        serializers = config.serializers
-        # unflatten from fields foo_json ==> foo
-        for serializer in serializers:
-            injected_field = _serialized_field_name(field, sep, serializer)
-            for obj in objs2:
-                if injected_field in obj:
-                    serialized_v = obj[injected_field]
-                    if serialized_v is not None:
-                        if serializer == Serializer.yaml:
-                            nu_obj = yaml.safe_load(serialized_v)
-                        elif serializer == Serializer.json:
-                            nu_obj = json.loads(serialized_v)
-                        elif serializer == Serializer.pickle:
-                            import pickle
-
-                            nu_obj = pickle.loads(serialized_v)
-                        else:
-                            raise NotImplementedError(f"unknown serializer: {serializer}")
-                        obj[field] = nu_obj
-                    del obj[injected_field]
-                else:
-                    logging.error(f"Expected: {injected_field} in {obj}")
-        # non-list objects: unflatten foo_bar == "..." --> foo.bar
-        if config.flatten and not config.is_list:
-            for obj in objs2:
-                inner_obj = {}
-                logging.info(f"field={field}, obj={obj} using fmap={field_map}")
-                for k, injected_field in field_map.items():
-                    if injected_field in obj:
-                        inner_obj[k] = obj[injected_field]
-                        del obj[injected_field]
-                if field not in obj:
-                    obj[field] = inner_obj
-        # list objects: unflatten foo_bar == [...] --> foo = [bar1, ...]
-        if config.flatten and config.is_list:
-            logging.info(f"field_map = {field_map}")
-            for obj in objs2:
-                # ignore null values or empty lists
-                fmap_actual = {
-                    k: injected_field
-                    for k, injected_field in field_map.items()
-                    if injected_field in obj
-                    and obj[injected_field] is not None
-                    and len(obj[injected_field]) > 0
-                }
-                if len(fmap_actual.values()) > 0:
-                    injected_field = list(fmap_actual.values())[
-                        0
-                    ]  # pick arbitrary
-                    inner_objs = [
-                        {} for x in obj[injected_field]
-                    ]  # seed inner objects
-                    for i in range(0, len(inner_objs)):
-                        inner_obj = inner_objs[i]
-                        for k, injected_field in fmap_actual.items():
-                            if obj[injected_field][i] is not None:
-                                inner_obj[k] = obj[injected_field][i]
-                    if field not in obj:
-                        obj[field] = inner_objs
-                for injected_field in field_map.values():
-                    if injected_field in obj:
-                        del obj[injected_field]
-    return objs2
+    return list(iter_unflatten(objs, config, **params))
 
 
 def flatten_to_csv(
-    objs: List[OBJECT],
+    objs: Iterable[OBJECT],
     outstream,
-    config: GlobalConfig = None,
+    config: Optional[Union[GlobalConfig, FlattenPlan]] = None,
+    fieldnames: Optional[Union[List[KEYNAME], ColumnSchema]] = None,
+    two_pass: bool = False,
+    child_outstreams: Optional[Mapping[KEYNAME, TextIO]] = None,
+    workers: Optional[int] = None,
     **params,
-):
+) -> ColumnSchema:
     """
     Serialize a list of objects as a CSV
 
+    By default all rows are flattened up front, in order to determine the
+    header. If the columns are known in advance, rows are instead written
+    as they are produced, so memory does not grow with the number of rows.
+    The columns can be known in one of three ways:
+
+    - passed in directly, using ``fieldnames``
+    - set on the configuration, using ``config.csv_fieldnames``
+    - discovered by a first flattening pass, if ``two_pass`` is set;
+      in this case ``objs`` must be re-iterable (e.g. a list, not a generator)
+
+    List elements of ``child_table`` keys are written to separate CSVs, one
+    per key. The columns of these are always discovered: in a first pass
+    if ``two_pass`` is set, or else up front.
+
     :param objs:
-    :param config:
+    :param outstream:
+    :param config: mapping configuration, or a plan compiled from one
+    :param fieldnames: columns to write, in order
+    :param two_pass: discover columns in a separate pass over objs
+    :param child_outstreams: streams for the child table of each child key
+    :param workers: number of processes flattening objects, if more than
+        one; rows are written in input order
     :param params:
-    :return:
+    :raises ValueError: if two_pass is set and objs is a one-shot iterator,
+        or if a child key has no stream
+    :return: the columns written, which can be reused as fieldnames
     """
-    if config is None:
-        config = GlobalConfig()
-    delimiter = config.csv_delimiter
+    plan = _as_plan(config)
+    config = plan.config
+    tables, schema, child_schemas = _flattened_tables(
+        objs, plan, fieldnames, two_pass, workers=workers
+    )
+    if child_outstreams is None:
+        child_outstreams = {}
+    missing = [k for k in plan.child_keys if k not in child_outstreams]
+    if missing:
+        raise ValueError(f"No output streams for child tables of {missing}")
+    write_rows = _csv_rows_writer(outstream, schema, config)
+    child_writers = {
+        k: _csv_rows_writer(child_outstreams[k], child_schemas[k], config)
+        for k in plan.child_keys
+    }
+
+    def _rows() -> Iterator[ROW]:
+        for row, children in tables:
+            yield row
+            for k, child_rows in children.items():
+                child_writers[k](child_rows)
+
+    write_rows(_rows())
+    return schema
+
+
+def _flattened_tables(
+    objs: Iterable[OBJECT],
+    plan: FlattenPlan,
+    fieldnames: Optional[Union[Iterable[KEYNAME], ColumnSchema]] = None,
+    two_pass: bool = False,
+    observe: Optional[Callable[[Optional[KEYNAME], List[ROW]], None]] = None,
+    workers: Optional[int] = None,
+) -> Tuple[Iterable[TABLE_ROWS], ColumnSchema, Dict[KEYNAME, ColumnSchema]]:
+    """
+    Flatten objects for writing, discovering the columns of each table.
+
+    Columns of the parent table may be known in advance; otherwise, and
+    for child tables, they are discovered either in a first pass over a
+    re-iterable source, or by flattening all objects up front.
+
+    :param objs:
+    :param plan:
+    :param fieldnames: columns of the parent table, if known
+    :param two_pass: discover columns in a separate pass over objs
+    :param observe: called with the rows of each table (None for the
+        parent table) as they are discovered, e.g. to infer types
+    :param workers: number of processes flattening objects, if more than one
+    :raises ValueError: if two_pass is set and objs is a one-shot iterator
+    :return: flattened rows with child rows, and the columns of the parent
+        table and of each child table
+    """
+    if fieldnames is None:
+        fieldnames = plan.config.csv_fieldnames
+    tables: Iterable[Tuple[ROW, Dict[KEYNAME, List[ROW]]]]
+    if fieldnames is not None and not plan.child_keys:
+        tables = iter_flatten_tables(objs, plan, workers)
+        return tables, ColumnSchema(fieldnames), {}
+    if two_pass:
+        if iter(objs) is objs:
+            raise ValueError(
+                "two_pass requires a re-iterable source, not a one-shot iterator"
+            )
+        tables = iter_flatten_tables(objs, plan, workers)
+    else:
+        tables = list(iter_flatten_tables(objs, plan, workers))
+    schema = ColumnSchema()
+    child_schemas = {k: ColumnSchema() for k in plan.child_keys}
+    for row, children in tables:
+        schema.add_row(row)
+        if observe is not None:
+            observe(None, [row])
+        for k, child_rows in children.items():
+            child_schemas[k].update(child_rows)
+            if observe is not None:
+                observe(k, child_rows)
+    if fieldnames is not None:
+        schema = ColumnSchema(fieldnames)
+    if two_pass:
+        tables = iter_flatten_tables(objs, plan, workers)
+    return tables, schema, child_schemas
+
+
+# characters in str() of any int, float or bool; an inner delimiter with
+# any other character cannot occur in these, nor can a backslash, so they
+# need no escaping
+_NUMBER_CHARS = frozenset("0123456789+-.aefilnrsuFT")
+
+CSV_WRITE_BATCH_SIZE = 1000
+
+
+def _csv_rows_writer(
+    outstream: TextIO, schema: ColumnSchema, config: GlobalConfig
+) -> Callable[[Iterable[ROW]], None]:
+    # writes the header, and returns a function writing rows; output is
+    # identical to a csv.DictWriter writing each row with lists packed and
+    # backslashes and inner delimiters escaped, but rows are encoded as
+    # lists in column order and written with writerows, a batch at a time
+    columns = schema.columns
     internal_delimiter = config.csv_inner_delimiter
-    list_parens = config.csv_list_markers
     internal_delimiter_esc = f"\\{internal_delimiter}"
-    lo, lc = list_parens
-
-    def _serialize_as_str(x: Optional[Any]) -> str:
-        if x is None:
-            return ""
-        else:
-            return str(x).replace(internal_delimiter, internal_delimiter_esc)
-
-    flat_objs = flatten(objs, config, **params)
-    fieldnames = []
-    for obj in flat_objs:
-        for k in obj.keys():
-            if k not in fieldnames:
-                fieldnames.append(k)
-    w = csv.DictWriter(
+    lo, lc = config.csv_list_markers
+    strict = config.strict
+    known_columns = set(columns)
+    w = csv.writer(
         outstream,
-        delimiter=delimiter,
-        fieldnames=fieldnames,
+        delimiter=config.csv_delimiter,
         quoting=csv.QUOTE_NONE,
         escapechar="\\",
         lineterminator="\n",
     )
-    w.writeheader()
-    for obj in flat_objs:
-        nu_obj = {}
-        for k, v in obj.items():
-            if isinstance(v, list):
-                v = internal_delimiter.join([_serialize_as_str(x) for x in v])
-                v = f"{lo}{v}{lc}"
-            else:
-                v = _serialize_as_str(v)
-            nu_obj[k] = v
-        w.writerow(nu_obj)
+    w.writerow(columns)
+
+    def _escape(x: Any) -> str:
+        return (
+            str(x)
+            .replace("\\", "\\\\")
+            .replace(internal_delimiter, internal_delimiter_esc)
+        )
+
+    _number: Callable[..., str]
+    if set(internal_delimiter) <= _NUMBER_CHARS:
+        _number = _escape
+    else:
+        _number = str
+
+    def _none(x: None) -> str:
+        return ""
+
+    def _list(v: List[Any]) -> str:
+        # as a list element, lists are not packed
+        cells = [
+            x
+            if type(x) is str and internal_delimiter not in x and "\\" not in x
+            else get_atom_encoder(type(x), _escape)(x)
+            for x in v
+        ]
+        return f"{lo}{internal_delimiter.join(cells)}{lc}"
+
+    def _other(v: Any) -> str:
+        if isinstance(v, list):
+            return _list(v)
+        return _escape(v)
+
+    atom_encoders = {
+        type(None): _none,
+        int: _number,
+        float: _number,
+        bool: _number,
+    }
+    encoders = {**atom_encoders, list: _list}
+    get_atom_encoder = atom_encoders.get
+    get_encoder = encoders.get
+
+    def _encode(row: ROW) -> List[str]:
+        if strict and not known_columns.issuperset(row):
+            extra = ", ".join([repr(k) for k in row.keys() - known_columns])
+            raise ValueError(f"dict contains fields not in fieldnames: {extra}")
+        return [
+            v
+            if type(v) is str and internal_delimiter not in v and "\\" not in v
+            else get_encoder(type(v), _other)(v)
+            for v in map(row.get, columns)
+        ]
+
+    def _write_rows(rows: Iterable[ROW]):
+        batch = []
+        try:
+            for row in rows:
+                batch.append(_encode(row))
+                if len(batch) >= CSV_WRITE_BATCH_SIZE:
+                    full, batch = batch, []
+                    w.writerows(full)
+        finally:
+            # rows before an error are written, as they would be singly
+            w.writerows(batch)
+
+    return _write_rows
 
 
 def unflatten_from_csv(
-    source: TextIO, config: GlobalConfig = GlobalConfig(), **params
+    source: Union[str, TextIO],
+    config: Optional[Union[GlobalConfig, FlattenPlan]] = None,
+    **params,
 ) -> List[OBJECT]:
     """
     Read serialized objects from a CSV file
 
-    :param source: file-like object
-    :param config:
+    :param source: file-like object, or path to file
+    :param config: mapping configuration, or a plan compiled from one
     :param params:
     :return:
     """
-    delimiter = config.csv_delimiter
-    internal_delimiter = config.csv_inner_delimiter
-    list_parens = config.csv_list_markers
-    if isinstance(source, str):
-        instream = open(source)
-    else:
-        instream = source
-    r = csv.DictReader(
-        instream, delimiter=delimiter, quoting=csv.QUOTE_NONE, escapechar="\\"
-    )
-    lo, lc = list_parens
+    return list(iter_unflatten_from_csv(source, config, **params))
 
-    def _getval(x: str) -> Optional[Any]:
-        if x == "":
-            return None
+
+def iter_unflatten_from_csv(
+    source: Union[str, TextIO],
+    config: Optional[Union[GlobalConfig, FlattenPlan]] = None,
+    batch_size: Optional[int] = None,
+    child_sources: Optional[Mapping[KEYNAME, Union[str, TextIO]]] = None,
+    workers: Optional[int] = None,
+    **params,
+) -> Iterator[OBJECT]:
+    """
+    Read serialized objects from a CSV file, one row at a time.
+
+    Each object is yielded as soon as its row has been read, so memory does
+    not grow with the size of the file.
+
+    If batch_size is set, rows are read in batches and each column is
+    parsed as a whole (see iter_csv_columns); this is faster for numeric
+    tables, and gives the same objects.
+
+    If workers is set, the file is split into chunks of rows at line
+    boundaries, and each chunk is parsed and unflattened by a pool of
+    worker processes. Objects are yielded in the order of the rows.
+
+    :param source: file-like object, or path to file
+    :param config: mapping configuration, or a plan compiled from one
+    :param batch_size: number of rows to parse at a time, if set
+    :param child_sources: child tables written for each child key; these
+        are merged into their parent objects as they are read
+    :param workers: number of worker processes, if more than one
+    :param params:
+    :raises ValueError: if workers is set, and there are child tables
+    :return: iterator over unflattened objects
+    """
+    plan = _as_plan(config)
+    if child_sources is None:
+        child_sources = {}
+    if workers is not None and workers > 1 and plan.child_keys:
+        raise ValueError("Child tables cannot be read by worker processes")
+    with ExitStack() as stack:
+
+        def _rows(src: Union[str, TextIO]) -> Iterator[ROW]:
+            if isinstance(src, str):
+                src = stack.enter_context(open(src))
+            return _iter_csv_source_rows(src, plan.config, batch_size)
+
+        if workers is not None and workers > 1:
+            if isinstance(source, str):
+                source = stack.enter_context(open(source))
+            chunks = (
+                (text, batch_size)
+                for text in _iter_csv_text_chunks(source, DEFAULT_CHUNK_SIZE)
+            )
+            for objs in _iter_parallel(
+                _unflatten_csv_chunk, chunks, plan, workers
+            ):
+                yield from objs
+            return
+        rows = _rows(source)
+        if plan.child_keys:
+            child_tables = {k: _rows(src) for k, src in child_sources.items()}
+            yield from iter_unflatten_tables(rows, child_tables, plan)
         else:
-            try:
-                return int(x)
-            except ValueError:
-                try:
-                    return float(x)
-                except ValueError:
-                    return x
+            yield from iter_unflatten(rows, plan, **params)
+
 
+def _escapes_newline(line: str) -> bool:
+    # a record continues on the next line if its newline is escaped,
+    # i.e. preceded by an odd number of backslashes
+    if not line.endswith("\\\n"):
+        return False
+    content = line[:-1]
+    return (len(content) - len(content.rstrip("\\"))) % 2 == 1
+
+
+def _iter_csv_records(instream: TextIO) -> Iterator[str]:
+    lines = []
+    for line in instream:
+        if _escapes_newline(line):
+            lines.append(line)
+            continue
+        if lines:
+            lines.append(line)
+            line = "".join(lines)
+            lines = []
+        yield line
+    if lines:
+        yield "".join(lines)
+
+
+def _iter_csv_text_chunks(instream: TextIO, chunk_size: int) -> Iterator[str]:
+    # each chunk is parsed separately, so is prefixed with the header
+    records = _iter_csv_records(instream)
+    header = next(records, None)
+    if header is None:
+        return
+    for chunk in _iter_chunks(records, chunk_size):
+        yield header + "".join(chunk)
+
+
+def _unflatten_csv_text(
+    plan: FlattenPlan, text: str, batch_size: Optional[int]
+) -> List[OBJECT]:
+    # text is a header followed by complete records
+    rows = _iter_csv_source_rows(io.StringIO(text), plan.config, batch_size)
+    return [plan.unflatten_row(row) for row in rows]
+
+
+def _unflatten_csv_chunk(chunk: Tuple[str, Optional[int]]) -> List[OBJECT]:
+    # runs in a worker
+    text, batch_size = chunk
+    return _unflatten_csv_text(_get_worker_plan(), text, batch_size)
+
+
+def _iter_csv_source_rows(
+    instream: TextIO, config: GlobalConfig, batch_size: Optional[int]
+) -> Iterator[ROW]:
+    if batch_size is None:
+        return _iter_csv_rows(instream, config)
+    return _iter_csv_rows_batched(instream, config, batch_size)
+
+
+# int() accepts only (Unicode) digits and whitespace, signs and
+# underscores; float() also accepts decimal points, exponents, and the
+# words inf, infinity and nan. Strings with other characters are neither.
+_NON_INT_CHAR = re.compile(r"[^\d\s+\-_]")
+_NON_NUMERIC_CHAR = re.compile(r"[^\d\s+\-_.eEiInNfFtTyYaA]")
+
+
+def _guess_value(x: str) -> Optional[Any]:
+    if x == "":
+        return None
+    m = _NON_INT_CHAR.search(x)
+    if m is not None:
+        if _NON_NUMERIC_CHAR.search(x, m.start()) is not None:
+            return x
+        try:
+            return float(x)
+        except ValueError:
+            return x
+    try:
+        return int(x)
+    except ValueError:
+        try:
+            return float(x)
+        except ValueError:
+            return x
+
+
+def _serialized_fields(config: GlobalConfig) -> Set[KEYNAME]:
     # check which fields are serialized
     serialized_fields = set()
     gconfig = config.key_configs
@@ -444,50 +1822,381 @@ def unflatten_from_csv(
                 field, config.sep, serializer
             )
             serialized_fields.add(injected_field)
+    return serialized_fields
+
+
+def _cell_unescaper(internal_delimiter: str) -> Callable[[str], str]:
+    # removes escapes of backslashes and inner delimiters from a cell, and
+    # reads \n and \t as a newline and a tab; escaped backslashes are split
+    # off first, so that no other escape can start with their backslash
+    internal_delimiter_esc = f"\\{internal_delimiter}"
+
+    def _unescape_part(v: str) -> str:
+        return (
+            v.replace("\\n", "\n")
+            .replace("\\t", "\t")
+            .replace(internal_delimiter_esc, internal_delimiter)
+        )
+
+    def _unescape(v: str) -> str:
+        if "\\\\" not in v:
+            return _unescape_part(v)
+        return "\\".join(map(_unescape_part, v.split("\\\\")))
+
+    return _unescape
+
+
+def _inner_delimiter_splitter(
+    internal_delimiter: str,
+) -> Callable[[str], List[str]]:
+    # splits a list cell on inner delimiters not escaped by a backslash, and
+    # removes the escapes as _cell_unescaper does; between escaped
+    # backslashes, an inner delimiter is escaped if a backslash precedes it
+    pattern = re.compile(rf"(?<!\\){re.escape(internal_delimiter)}")
+    unescape = _cell_unescaper(internal_delimiter)
+
+    def _split(v: str) -> List[str]:
+        if "\\" not in v:
+            return v.split(internal_delimiter)
+        if "\\\\" not in v:
+            return [unescape(x) for x in pattern.split(v)]
+        elements = [""]
+        for i, part in enumerate(v.split("\\\\")):
+            pieces = [unescape(x) for x in pattern.split(part)]
+            if i > 0:
+                elements[-1] += "\\"
+            elements[-1] += pieces[0]
+            elements.extend(pieces[1:])
+        return elements
+
+    return _split
+
+
+def _csv_cell_decoder(
+    k: KEYNAME,
+    config: GlobalConfig,
+    column_types: Dict[KEYNAME, str],
+    serialized_fields: Set[KEYNAME],
+    escaped: bool = False,
+) -> Callable[[str], Any]:
+    # decides once per column how its (unescaped) cells are parsed: as a
+    # declared list, as a list if demarcated by list markers, or directly;
+    # decoders of escaped cells also remove escapes (see _cell_unescaper)
+    lo, lc = config.csv_list_markers
+    internal_delimiter = config.csv_inner_delimiter
+    parse = _column_parser(k, column_types, _guess_value)
+    key_config = config.key_configs.get(k, None)
+    parse_cell: Callable[[str], Any]
+    if escaped:
+        unescape = _cell_unescaper(internal_delimiter)
+        split = _inner_delimiter_splitter(internal_delimiter)
+
+        def _parse_escaped(v: str) -> Any:
+            return parse(unescape(v))
+
+        parse_cell = _parse_escaped
+    else:
+        split = methodcaller("split", internal_delimiter)
+        parse_cell = parse
+    if k in serialized_fields:
+        return parse_cell
+
+    def _parse_list(v: str) -> List[Any]:
+        if lo != "":
+            v = v.replace(lo, "", 1)
+        if lc != "":
+            v = v[0 : -len(lc)]
+        return [parse(x) for x in split(v)]
 
-    objs = []
+    if key_config is not None and key_config.is_list:
+
+        def _decode_list(v: str) -> List[Any]:
+            if lo != "" and not v.startswith(lo):
+                raise Exception(
+                    f"Expected start-of-list marker {lo} in {k}={v}"
+                )
+            if lc != "" and not v.endswith(lc):
+                raise Exception(f"Expected end-of-list marker {lc} in {k}={v}")
+            return _parse_list(v)
+
+        return _decode_list
+    if lo == "" or lc == "":
+        return parse_cell
+
+    def _decode(v: str) -> Any:
+        if v.startswith(lo) and v.endswith(lc):
+            return _parse_list(v)
+        return parse_cell(v)
+
+    return _decode
+
+
+def _iter_csv_rows(instream: TextIO, config: GlobalConfig) -> Iterator[ROW]:
+    r = csv.reader(
+        instream,
+        delimiter=config.csv_delimiter,
+        quoting=csv.QUOTE_NONE,
+        escapechar="\\",
+    )
+    header = next(r, None)
+    if header is None:
+        return
+    n_columns = len(header)
+    # declared columns are parsed directly; others are guessed
+    column_types = config.get_column_types()
+    serialized_fields = _serialized_fields(config)
+    # cells with backslashes may have escapes, and are decoded separately
+    columns = [
+        (
+            k,
+            _csv_cell_decoder(k, config, column_types, serialized_fields),
+            _csv_cell_decoder(k, config, column_types, serialized_fields, True),
+        )
+        for k in header
+    ]
     for row in r:
+        if not row:
+            continue
+        if len(row) > n_columns:
+            # as reported by csv.DictReader
+            dict_row: Dict[Any, Any] = dict(zip(header, row))
+            dict_row[None] = row[n_columns:]
+            raise MissingColumnError(dict_row, row[n_columns:])
         nu_obj = {}
-        for k, v in row.items():
-            if k is None:
-                raise MissingColumnError(row, v)
-            key_config = config.key_configs.get(k, None)
-            v = v.replace("\\n", "\n").replace("\\t", "\t")
-            # lists are demarcated by list markers
-            is_direct_list = False
-            if key_config is not None and key_config.is_list:
-                is_direct_list = True
-            if not is_direct_list:
-                if (
-                    lo != ""
-                    and lc != ""
-                    and v.startswith(lo)
-                    and v.endswith(lc)
-                ):
-                    is_direct_list = True
-            if k in serialized_fields:
-                is_direct_list = False
-            # if (lo != '' or lc != '') and v.startswith(lo) and v.endswith(lc) and not k.endswith('_json') and not k.endswith('_yaml'):
-            if is_direct_list:
-                if lo != "":
-                    if v.startswith(lo):
-                        v = v.replace(lo, "", 1)
-                    else:
-                        raise Exception(
-                            f"Expected start-of-list marker {lo} in {k}={v}"
-                        )
-                if lc != "":
-                    if v.endswith(lc):
-                        v = v[0 : -len(lc)]
-                    else:
-                        raise Exception(
-                            f"Expected end-of-list marker {lc} in {k}={v}"
-                        )
-                # TODO: escaping
-                v = [_getval(x) for x in v.split(internal_delimiter)]
+        for (k, decode, decode_escaped), v in zip(columns, row):
+            if "\\" in v:
+                v = decode_escaped(v)
             else:
-                v = _getval(v)
+                v = decode(v)
             if v is not None:
                 nu_obj[k] = v
-        objs.append(nu_obj)
-    return unflatten(objs, config, **params)
+        yield nu_obj
+
+
+DEFAULT_BATCH_SIZE = 65536
+"""Number of rows converted at a time by the columnar reader"""
+
+COLUMNS = Dict[KEYNAME, List[Optional[CELL_VALUE]]]
+
+# characters that may appear in a float, but never in an int
+_FLOAT_ONLY_CHARS = (".", "e", "E", "n", "N")
+
+
+def iter_csv_columns(
+    source: Union[str, TextIO],
+    config: Optional[Union[GlobalConfig, FlattenPlan]] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> Iterator[COLUMNS]:
+    """
+    Read a CSV file in batches of rows, parsing each column as a whole.
+
+    Cells are parsed to the same values as unflatten_from_csv would give
+    them, with None for empty cells. Numeric columns are converted in a
+    single step, using NumPy if it is installed.
+
+    :param source: file-like object, or path to file
+    :param config: mapping configuration, or a plan compiled from one
+    :param batch_size: maximum number of rows per batch
+    :return: iterator over batches, each mapping column names to values
+    """
+    plan = _as_plan(config)
+    if isinstance(source, str):
+        with open(source) as instream:
+            yield from _iter_csv_columns(instream, plan.config, batch_size)
+    else:
+        yield from _iter_csv_columns(source, plan.config, batch_size)
+
+
+def _iter_csv_columns(
+    instream: TextIO, config: GlobalConfig, batch_size: int
+) -> Iterator[COLUMNS]:
+    r = csv.reader(
+        instream,
+        delimiter=config.csv_delimiter,
+        quoting=csv.QUOTE_NONE,
+        escapechar="\\",
+    )
+    header = next(r, None)
+    if header is None:
+        return
+    column_types = config.get_column_types()
+    serialized_fields = _serialized_fields(config)
+    while True:
+        batch = list(islice(r, batch_size))
+        if not batch:
+            return
+        if max(map(len, batch)) > len(header):
+            row = next(row for row in batch if len(row) > len(header))
+            raise MissingColumnError(dict(zip(header, row)), row[len(header) :])
+        # transpose, padding short rows with empty cells
+        cells_by_column = list(zip_longest(*batch, fillvalue=""))
+        columns = {}
+        for i, k in enumerate(header):
+            if i < len(cells_by_column):
+                cells = cells_by_column[i]
+            else:
+                cells = ("",) * len(batch)
+            key_config = config.key_configs.get(k, None)
+            is_list = key_config is not None and key_config.is_list
+            columns[k] = _parse_csv_column(
+                k,
+                cells,
+                config,
+                column_types.get(k, None),
+                is_list and k not in serialized_fields,
+                k in serialized_fields,
+            )
+        yield columns
+
+
+def _parse_csv_column(
+    k: KEYNAME,
+    cells: Iterable[str],
+    config: GlobalConfig,
+    type_name: Optional[str],
+    is_list: bool,
+    is_serialized: bool,
+) -> List[Optional[CELL_VALUE]]:
+    lo, lc = config.csv_list_markers
+    internal_delimiter = config.csv_inner_delimiter
+    joined = "".join(cells)
+    escaped = "\\" in joined
+    if escaped:
+        unescape = _cell_unescaper(internal_delimiter)
+        split = _inner_delimiter_splitter(internal_delimiter)
+    else:
+        split = methodcaller("split", internal_delimiter)
+    if is_serialized or (
+        not is_list and (lo == "" or lc == "" or lo not in joined)
+    ):
+        # no cell can be a list
+        if escaped:
+            cells = [unescape(v) for v in cells]
+        return _parse_values(k, list(cells), type_name)
+    # each cell contributes either a single value (a length of None) or
+    # the elements of a list; all values are then parsed together
+    values = []
+    lengths: List[Optional[int]] = []
+    for v in cells:
+        if is_list:
+            is_direct_list = True
+            if lo != "" and not v.startswith(lo):
+                raise Exception(
+                    f"Expected start-of-list marker {lo} in {k}={v}"
+                )
+            if lc != "" and not v.endswith(lc):
+                raise Exception(f"Expected end-of-list marker {lc} in {k}={v}")
+        else:
+            is_direct_list = (
+                lo != "" and lc != "" and v.startswith(lo) and v.endswith(lc)
+            )
+        if is_direct_list:
+            if lo != "":
+                v = v.replace(lo, "", 1)
+            if lc != "":
+                v = v[0 : -len(lc)]
+            elements = split(v)
+            values.extend(elements)
+            lengths.append(len(elements))
+        else:
+            if escaped:
+                v = unescape(v)
+            values.append(v)
+            lengths.append(None)
+    parsed = _parse_values(k, values, type_name)
+    if all(n is None for n in lengths):
+        return parsed
+    column: List[Any] = []
+    pos = 0
+    for n in lengths:
+        if n is None:
+            column.append(parsed[pos])
+            pos += 1
+        else:
+            column.append(parsed[pos : pos + n])
+            pos += n
+    return column
+
+
+def _parse_values(
+    k: KEYNAME, values: List[str], type_name: Optional[str]
+) -> List[Optional[Any]]:
+    # empty strings are parsed as None; all others are parsed together
+    if "" not in values:
+        return _parse_non_empty(k, values, type_name)
+    positions = [i for i, x in enumerate(values) if x != ""]
+    parsed = [None] * len(values)
+    non_empty = _parse_non_empty(k, [values[i] for i in positions], type_name)
+    for i, x in zip(positions, non_empty):
+        parsed[i] = x
+    return parsed
+
+
+def _parse_non_empty(
+    k: KEYNAME, values: List[str], type_name: Optional[str]
+) -> List[Any]:
+    if not values:
+        return []
+    if type_name is None:
+        parsed = _parse_numeric(values, guess=True)
+        if parsed is None:
+            parsed = [_guess_value(x) for x in values]
+        return parsed
+    if type_name in ("int", "float"):
+        parsed = _parse_numeric(values, as_float=type_name == "float")
+        if parsed is not None:
+            return parsed
+    parse = _column_parser(k, {k: type_name}, _guess_value)
+    return [parse(x) for x in values]
+
+
+def _parse_numeric(
+    values: List[str], as_float: bool = False, guess: bool = False
+) -> Optional[List[Any]]:
+    """
+    Parse all values as ints, or all as floats, in a single step.
+
+    :param values: non-empty strings
+    :param as_float: parse as floats rather than ints
+    :param guess: parse as ints if possible, or else as floats if none of
+        the values is an int
+    :return: parsed values, or None if not all values could be parsed
+    """
+    if np is None:
+        # without numpy, only ints are tried; a single failure is
+        # cheaper than one per value
+        if as_float:
+            return None
+        try:
+            return [int(x) for x in values]
+        except ValueError:
+            return None
+    arr = np.array(values)
+    if not as_float:
+        try:
+            return arr.astype(np.int64).tolist()
+        except (ValueError, OverflowError):
+            if not guess:
+                return None
+    try:
+        floats = arr.astype(np.float64)
+    except ValueError:
+        return None
+    if guess:
+        # values without a decimal point, exponent, nan or inf would be
+        # guessed as ints, so can't be converted in bulk
+        is_float = np.zeros(len(arr), dtype=bool)
+        for c in _FLOAT_ONLY_CHARS:
+            is_float |= np.char.find(arr, c) >= 0
+        if not is_float.all():
+            return None
+    return floats.tolist()
+
+
+def _iter_csv_rows_batched(
+    instream: TextIO, config: GlobalConfig, batch_size: int
+) -> Iterator[ROW]:
+    for columns in _iter_csv_columns(instream, config, batch_size):
+        keys = list(columns)
+        for values in zip(*columns.values()):
+            yield {k: v for k, v in zip(keys, values) if v is not None}
@@ -0,0 +1,516 @@
+"""
+Readers and writers for streams of objects.
+
+These process one object at a time, so that they can be combined with
+:func:`json_flattener.iter_flatten` and :func:`json_flattener.iter_unflatten`
+without holding an entire file in memory.
+"""
+
+import io
+import json
+import re
+import textwrap
+from decimal import Decimal
+from typing import (
+    Any,
+    BinaryIO,
+    Iterable,
+    Iterator,
+    Match,
+    Optional,
+    TextIO,
+    Tuple,
+    Union,
+    cast,
+)
+
+import yaml
+from yaml.composer import Composer
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+from json_flattener.flattener import YAML_DUMPER, YAML_LOADER
+from json_flattener.json_backends import JSONBackend, get_json_backend
+
+OBJECT_STREAM = Iterator[dict]
+JSON_INDENT = " " * 4
+
+
+def iter_jsonl(
+    stream: TextIO, json_backend: Optional[JSONBackend] = None
+) -> OBJECT_STREAM:
+    """
+    Parse a JSON Lines stream, one object per line.
+
+    Blank lines are skipped.
+
+    :param stream: text stream
+    :param json_backend: JSON implementation; defaults to the standard library
+    :return: iterator over objects
+    """
+    if json_backend is None:
+        json_backend = get_json_backend()
+    loads = json_backend.loads
+    for line in stream:
+        if line.strip():
+            yield loads(line)
+
+
+def write_jsonl(
+    objs: Iterable[dict],
+    stream: TextIO,
+    json_backend: Optional[JSONBackend] = None,
+):
+    """
+    Write objects as JSON Lines, one object per line.
+
+    :param objs: objects to write
+    :param stream: text stream
+    :param json_backend: JSON implementation; defaults to the standard library
+    :return:
+    """
+    if json_backend is None:
+        json_backend = get_json_backend()
+    dumps = json_backend.dumps
+    for obj in objs:
+        stream.write(dumps(obj))
+        stream.write("\n")
+
+
+def write_json_array(
+    objs: Iterable[dict],
+    stream: TextIO,
+    json_backend: Optional[JSONBackend] = None,
+    key: Optional[str] = None,
+):
+    """
+    Write objects as an indented JSON list, one element at a time.
+
+    With the standard library backend, output is identical to dumping the
+    whole list with ``json.dump(objs, stream, indent=4, sort_keys=True)``.
+
+    :param objs: objects to write
+    :param stream: text stream
+    :param json_backend: JSON implementation; defaults to the standard library
+    :param key: if set, the list is written as the value of this key in a root object
+    :return:
+    """
+    if json_backend is None:
+        json_backend = get_json_backend()
+    outer_indent = ""
+    if key is not None:
+        outer_indent = JSON_INDENT
+        stream.write(f"{{\n{outer_indent}{json.dumps(key)}: ")
+    element_indent = outer_indent + JSON_INDENT
+    first = True
+    for obj in objs:
+        stream.write("[\n" if first else ",\n")
+        first = False
+        element = io.StringIO()
+        json_backend.dump_document(obj, element)
+        stream.write(textwrap.indent(element.getvalue(), element_indent))
+    if first:
+        stream.write("[]")
+    else:
+        stream.write(f"\n{outer_indent}]")
+    if key is not None:
+        stream.write("\n}")
+
+
+def write_yaml_list(
+    objs: Iterable[dict], stream: TextIO, key: Optional[str] = None
+):
+    """
+    Write objects as a YAML list, one element at a time.
+
+    Output is identical to dumping the whole list at once.
+
+    :param objs: objects to write
+    :param stream: text stream
+    :param key: if set, the list is written as the value of this key in a root object
+    :return:
+    """
+    first = True
+    for obj in objs:
+        if first and key is not None:
+            # the key as it would be written in the whole document, e.g. "books:"
+            header = yaml.dump({key: None}, Dumper=YAML_DUMPER)
+            stream.write(header[: -len(" null\n")] + "\n")
+        first = False
+        yaml.dump([obj], stream, Dumper=YAML_DUMPER)
+    if first:
+        empty = [] if key is None else {key: []}
+        yaml.dump(empty, stream, Dumper=YAML_DUMPER)
+
+
+def write_yaml_documents(objs: Iterable[dict], stream: TextIO):
+    """
+    Write objects as a YAML stream, with one document per object.
+
+    :param objs: objects to write
+    :param stream: text stream
+    :return:
+    """
+    yaml.dump_all(objs, stream, Dumper=YAML_DUMPER, explicit_start=True)
+
+
+class _JsonScanner:
+    """
+    Incremental reader of JSON values from a text stream.
+
+    Only a window of the stream is buffered; values are parsed with the
+    standard library decoder once they are completely buffered.
+    """
+
+    def __init__(self, stream: TextIO, chunk_size: int):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self):
+        # read at least as much as is buffered, so that large values
+        # are re-parsed a logarithmic number of times
+        chunk = self.stream.read(max(self.chunk_size, len(self.buf) - self.pos))
+        if chunk:
+            self.buf = self.buf[self.pos :] + chunk
+            self.pos = 0
+        else:
+            self.eof = True
+
+    def peek(self) -> str:
+        """Next non-whitespace character, or empty string at end of stream."""
+        while True:
+            self.pos = _skip_whitespace(self.buf, self.pos)
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos : self.pos + 1]
+            self.fill()
+
+    def expect(self, c: str):
+        actual = self.peek()
+        if actual != c:
+            raise ValueError(
+                f"Expected {c} in JSON, got {actual or 'end of input'}"
+            )
+        self.pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self.fill()
+                continue
+            # a value at the end of the buffer may be truncated, e.g. 12 of 123
+            if _skip_whitespace(self.buf, end) < len(self.buf) or self.eof:
+                self.pos = end
+                return obj
+            self.fill()
+
+    def skip(self):
+        """Skip over a value without parsing it."""
+        if self.peek() not in ("[", "{"):
+            self.value()
+            return
+        depth = 0
+        pattern = _STRUCTURAL
+        while True:
+            m = pattern.search(self.buf, self.pos)
+            if m is None:
+                if self.eof:
+                    raise ValueError("Unexpected end of JSON input")
+                self.pos = len(self.buf)
+                self.fill()
+                continue
+            self.pos = m.end()
+            c = m.group()
+            if pattern is _IN_STRING:
+                if c == '"':
+                    pattern = _STRUCTURAL
+                elif self.pos == len(self.buf):
+                    # escape at end of buffer; read more before skipping it
+                    self.pos -= 1
+                    self.fill()
+                else:
+                    self.pos += 1
+            elif c == '"':
+                pattern = _IN_STRING
+            elif c in "[{":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def items(self) -> Iterator[Any]:
+        """Elements of an array."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            c = self.peek()
+            self.pos += 1
+            if c == "]":
+                return
+            if c != ",":
+                raise ValueError(f"Expected , or ] in JSON array, got {c}")
+
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_STRUCTURAL = re.compile(r'["\[\]{}]')
+_IN_STRING = re.compile(r'["\\]')
+
+
+def _skip_whitespace(s: str, pos: int) -> int:
+    return cast(Match[str], _WHITESPACE.match(s, pos)).end()
+
+
+def _iter_json_items_scanner(
+    stream: TextIO, key: Optional[str] = None, chunk_size: int = 2**16
+) -> OBJECT_STREAM:
+    scanner = _JsonScanner(stream, chunk_size)
+    if key is None:
+        yield from scanner.items()
+        return
+    scanner.expect("{")
+    while scanner.peek() != "}":
+        k = scanner.value()
+        scanner.expect(":")
+        if k == key:
+            if scanner.peek() != "[":
+                raise ValueError(f"Value of {key} is not a list")
+            yield from scanner.items()
+            return
+        scanner.skip()
+        if scanner.peek() == ",":
+            scanner.pos += 1
+    raise KeyError(key)
+
+
+def _ijson_events(stream: BinaryIO) -> Iterator[Tuple[str, Any]]:
+    # ints are parsed exactly, however wide; other numbers are parsed as
+    # Decimals, and converted to floats, as the json module would give
+    for event, value in ijson.basic_parse(stream, use_float=False):
+        if event == "number" and isinstance(value, Decimal):
+            value = float(value)
+        yield event, value
+
+
+def _build_ijson_value(event: str, value: Any, events: Iterator) -> Any:
+    builder = ijson.ObjectBuilder()
+    depth = 0
+    while True:
+        builder.event(event, value)
+        if event in ("start_map", "start_array"):
+            depth += 1
+        elif event in ("end_map", "end_array"):
+            depth -= 1
+        if depth == 0:
+            return builder.value
+        event, value = next(events)
+
+
+def _iter_ijson_array(events: Iterator) -> OBJECT_STREAM:
+    # elements of an array, whose start has been read
+    for event, value in events:
+        if event == "end_array":
+            return
+        yield _build_ijson_value(event, value, events)
+
+
+def _iter_json_items_ijson(
+    stream: BinaryIO, key: Optional[str] = None
+) -> OBJECT_STREAM:
+    # as _iter_json_items_scanner, from parser events
+    events = _ijson_events(stream)
+    event, _ = next(events, ("end of input", None))
+    if key is None:
+        if event != "start_array":
+            raise ValueError(f"Expected [ in JSON, got {event}")
+        yield from _iter_ijson_array(events)
+        return
+    if event != "start_map":
+        raise ValueError(f"Expected {{ in JSON, got {event}")
+    for event, value in events:
+        if event == "end_map":
+            break
+        # event is map_key
+        event, v = next(events)
+        if value == key:
+            if event != "start_array":
+                raise ValueError(f"Value of {key} is not a list")
+            yield from _iter_ijson_array(events)
+            return
+        _build_ijson_value(event, v, events)
+    raise KeyError(key)
+
+
+def iter_json_items(
+    stream: Union[TextIO, BinaryIO], key: Optional[str] = None
+) -> OBJECT_STREAM:
+    """
+    Incrementally parse the elements of a list in a JSON document.
+
+    Elements are parsed one at a time, so memory is bounded by the size of
+    the largest element rather than the whole document. Other values in the
+    root object are skipped over without being parsed.
+
+    ijson is used for binary streams if it is installed.
+
+    :param stream: text or binary stream
+    :param key: key in the root object holding the list; if None, the root must be a list
+    :raises KeyError: if the key is not present in the root object
+    :raises ValueError: if the stream is not JSON, or the value of the key
+        is not a list
+    :return: iterator over list elements
+    """
+    if isinstance(stream.read(0), bytes):
+        binary = cast(BinaryIO, stream)
+        if ijson is not None:
+            yield from _iter_json_items_ijson(binary, key)
+            return
+        stream = io.TextIOWrapper(binary, encoding="utf-8")
+    yield from _iter_json_items_scanner(cast(TextIO, stream), key)
+
+
+class _YAMLEventLoader(YAML_LOADER, Composer):  # type: ignore
+    # the C loader composes whole documents only; composing single nodes
+    # from its events keeps its faster scanning and parsing
+    def __init__(self, stream):
+        YAML_LOADER.__init__(self, stream)
+        Composer.__init__(self)
+
+
+def _skip_yaml_node(loader: _YAMLEventLoader):
+    event = loader.get_event()
+    depth = 0
+    while True:
+        if isinstance(event, (yaml.SequenceStartEvent, yaml.MappingStartEvent)):
+            depth += 1
+        elif isinstance(event, (yaml.SequenceEndEvent, yaml.MappingEndEvent)):
+            depth -= 1
+        if depth == 0:
+            return
+        event = loader.get_event()
+
+
+def _construct_yaml_node(loader: _YAMLEventLoader) -> Any:
+    return loader.construct_document(loader.compose_node(None, None))
+
+
+def _iter_yaml_sequence(loader: _YAMLEventLoader) -> OBJECT_STREAM:
+    loader.get_event()
+    while not loader.check_event(yaml.SequenceEndEvent):
+        yield _construct_yaml_node(loader)
+    loader.get_event()
+
+
+def iter_yaml_items(stream: TextIO, key: Optional[str] = None) -> OBJECT_STREAM:
+    """
+    Incrementally parse the elements of lists in a YAML stream.
+
+    The stream is processed as a sequence of parser events; each element is
+    constructed as soon as it has been read, and other values are skipped
+    without being constructed. The stream may contain multiple documents.
+
+    :param stream: text stream
+    :param key: key in the root object of each document holding the list;
+        if None, the elements of root lists are yielded, and any other root
+        value is yielded as a single object
+    :raises KeyError: if the key is not present in a document
+    :raises ValueError: if a document is not a mapping, or its value for
+        the key is not a list
+    :return: iterator over list elements
+    """
+    loader = _YAMLEventLoader(stream)
+    try:
+        loader.get_event()  # stream start
+        while not loader.check_event(yaml.StreamEndEvent):
+            loader.get_event()  # document start
+            if key is None:
+                if loader.check_event(yaml.SequenceStartEvent):
+                    yield from _iter_yaml_sequence(loader)
+                else:
+                    yield _construct_yaml_node(loader)
+            else:
+                if not loader.check_event(yaml.MappingStartEvent):
+                    raise ValueError(f"Expected a mapping with key {key}")
+                loader.get_event()
+                found = False
+                while not loader.check_event(yaml.MappingEndEvent):
+                    k = _construct_yaml_node(loader)
+                    if k != key:
+                        _skip_yaml_node(loader)
+                    elif loader.check_event(yaml.SequenceStartEvent):
+                        found = True
+                        yield from _iter_yaml_sequence(loader)
+                    else:
+                        raise ValueError(f"Expected a list for key {key}")
+                loader.get_event()
+                if not found:
+                    raise KeyError(key)
+            loader.get_event()  # document end
+            loader.anchors = {}
+    finally:
+        loader.dispose()
+
+
+class ObjectFile:
+    """
+    A file of objects that can be iterated over more than once.
+
+    Objects are parsed incrementally, one at a time. Each iteration re-reads
+    the file, so it can be used as the source for two-pass streaming, e.g.
+    ``flatten_to_csv(ObjectFile(path, "json", "books"), out, two_pass=True)``.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        input_format: str,
+        key: Optional[str] = None,
+        json_backend: Optional[JSONBackend] = None,
+    ):
+        """
+        Initialize with path to file.
+
+        :param path:
+        :param input_format: one of jsonl, json or yaml
+        :param key: for json and yaml, key in the root object holding the objects
+        :param json_backend: for jsonl, JSON implementation
+        """
+        if input_format not in ("jsonl", "json", "yaml"):
+            raise ValueError(f"Cannot incrementally parse {input_format}")
+        self.path = path
+        self.input_format = input_format
+        self.key = key
+        self.json_backend = json_backend
+
+    def __iter__(self) -> OBJECT_STREAM:
+        if self.input_format == "json":
+            with open(self.path, "rb") as stream:
+                yield from iter_json_items(stream, self.key)
+        else:
+            with open(self.path) as stream:
+                if self.input_format == "yaml":
+                    yield from iter_yaml_items(stream, self.key)
+                else:
+                    yield from iter_jsonl(stream, self.json_backend)
+
+
+class JsonLinesFile(ObjectFile):
+    """A JSON Lines file that can be iterated over more than once."""
+
+    def __init__(self, path: str, json_backend: Optional[JSONBackend] = None):
+        """Initialize with path to file."""
+        super().__init__(path, "jsonl", json_backend=json_backend)
@@ -0,0 +1,230 @@
+"""
+Pluggable JSON implementations.
+
+The standard library :mod:`json` module is always available. Faster
+implementations (orjson, ujson, simdjson) are used if they are installed
+and selected, either by name or with ``auto``, which picks the fastest
+one available.
+
+Backends parse to the same python objects as the standard library;
+serialized output may differ in formatting (e.g. whitespace and indentation).
+"""
+
+import json
+import logging
+import math
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, TextIO, Union
+
+DEFAULT_JSON_BACKEND = "json"
+AUTO_JSON_BACKEND = "auto"
+
+
+@dataclass
+class JSONBackend:
+    """A JSON implementation, for both individual cells and whole documents."""
+
+    name: str
+    """Name used to select the backend"""
+
+    dumps: Callable[[Any], str]
+    """Serialize an object compactly, e.g. as a cell value"""
+
+    loads: Callable[[Union[str, bytes]], Any]
+    """Parse a string, e.g. a cell value"""
+
+    dump_document: Callable[[Any, TextIO], None]
+    """Write an object to a stream, indented with sorted keys"""
+
+    load_document: Callable[[TextIO], Any]
+    """Parse an entire stream"""
+
+
+def _stdlib_backend() -> JSONBackend:
+    return JSONBackend(
+        name="json",
+        dumps=json.dumps,
+        loads=json.loads,
+        dump_document=lambda obj, stream: json.dump(
+            obj, stream, indent=4, sort_keys=True
+        ),
+        load_document=json.load,
+    )
+
+
+def _has_non_finite(obj: Any) -> bool:
+    # whether obj contains NaN or an infinity, at any depth; only exact
+    # types are checked, as orjson rejects subclasses, e.g. of float
+    t = type(obj)
+    if t is float:
+        return not math.isfinite(obj)
+    if t is dict:
+        obj = obj.values()
+    elif t is not list and t is not tuple:
+        return False
+    for v in obj:
+        t = type(v)
+        if t is float:
+            if not math.isfinite(v):
+                return True
+        elif (t is dict or t is list or t is tuple) and _has_non_finite(v):
+            return True
+    return False
+
+
+def _orjson_backend() -> JSONBackend:
+    import orjson
+
+    # orjson differs from json for integers wider than 64 bits, which it
+    # cannot serialize and parses as floats, and for NaN and Infinity,
+    # which it serializes as null and cannot parse; json is used instead
+    # for these. Objects are only searched for NaN and Infinity if their
+    # output has a null, and input is checked for integers of 19 or more
+    # digits by mapping all digits to 0, which costs far less than parsing
+    stdlib = _stdlib_backend()
+    digits_to_zero = bytes.maketrans(b"123456789", b"000000000")
+    long_number = b"0" * 19
+
+    def _dumps(obj: Any) -> str:
+        try:
+            s = orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            return stdlib.dumps(obj)
+        if b"null" in s and _has_non_finite(obj):
+            return stdlib.dumps(obj)
+        return s.decode("utf-8")
+
+    def _loads(s: Union[str, bytes]) -> Any:
+        b = s.encode("utf-8") if isinstance(s, str) else s
+        if long_number in b.translate(digits_to_zero):
+            return stdlib.loads(s)
+        try:
+            return orjson.loads(b)
+        except orjson.JSONDecodeError:
+            return stdlib.loads(s)
+
+    def _dump_document(obj: Any, stream: TextIO):
+        option = (
+            orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+        )
+        try:
+            s = orjson.dumps(obj, option=option)
+        except TypeError:
+            stdlib.dump_document(obj, stream)
+            return
+        if b"null" in s and _has_non_finite(obj):
+            stdlib.dump_document(obj, stream)
+            return
+        stream.write(s.decode("utf-8"))
+
+    return JSONBackend(
+        name="orjson",
+        dumps=_dumps,
+        loads=_loads,
+        dump_document=_dump_document,
+        load_document=lambda stream: _loads(stream.read()),
+    )
+
+
+def _ujson_backend() -> JSONBackend:
+    import ujson
+
+    return JSONBackend(
+        name="ujson",
+        dumps=lambda obj: ujson.dumps(obj, escape_forward_slashes=False),
+        loads=ujson.loads,
+        dump_document=lambda obj, stream: ujson.dump(
+            obj,
+            stream,
+            indent=4,
+            sort_keys=True,
+            escape_forward_slashes=False,
+        ),
+        load_document=ujson.load,
+    )
+
+
+def _simdjson_backend() -> JSONBackend:
+    import simdjson
+
+    # simdjson only parses; serialization uses the standard library
+    stdlib = _stdlib_backend()
+    return JSONBackend(
+        name="simdjson",
+        dumps=stdlib.dumps,
+        loads=simdjson.loads,
+        dump_document=stdlib.dump_document,
+        load_document=simdjson.load,
+    )
+
+
+JSON_BACKENDS: Dict[str, Callable[[], JSONBackend]] = {
+    "json": _stdlib_backend,
+    "orjson": _orjson_backend,
+    "ujson": _ujson_backend,
+    "simdjson": _simdjson_backend,
+}
+"""Factories for each backend, keyed by name; factories raise ImportError if unavailable"""
+
+AUTO_PREFERENCE = ["orjson", "simdjson", "ujson", "json"]
+"""Order in which backends are tried when ``auto`` is selected"""
+
+_cache: Dict[str, JSONBackend] = {}
+
+
+def register_json_backend(name: str, factory: Callable[[], JSONBackend]):
+    """
+    Register an additional JSON implementation.
+
+    :param name: name used to select the backend
+    :param factory: function returning the backend; may raise ImportError
+    :return:
+    """
+    JSON_BACKENDS[name] = factory
+    _cache.pop(name, None)
+
+
+def available_json_backends() -> List[str]:
+    """
+    List the names of all backends that can be loaded in this environment.
+
+    :return:
+    """
+    return [name for name in JSON_BACKENDS if _load(name) is not None]
+
+
+def _load(name: str) -> Optional[JSONBackend]:
+    if name not in _cache:
+        try:
+            _cache[name] = JSON_BACKENDS[name]()
+        except ImportError:
+            return None
+    return _cache[name]
+
+
+def get_json_backend(name: Optional[str] = None) -> JSONBackend:
+    """
+    Get a JSON implementation by name.
+
+    If the named backend is not installed, the standard library is used.
+
+    :param name: name of backend, ``auto`` for the fastest available, or None for the standard library
+    :raises ValueError: if the name is not registered
+    :return:
+    """
+    if name is None:
+        name = DEFAULT_JSON_BACKEND
+    if name == AUTO_JSON_BACKEND:
+        for candidate in AUTO_PREFERENCE:
+            backend = _load(candidate)
+            if backend is not None:
+                return backend
+    if name not in JSON_BACKENDS:
+        raise ValueError(
+            f"Unknown JSON backend: {name}; must be one of {list(JSON_BACKENDS)} or {AUTO_JSON_BACKEND}"
+        )
+    backend = _load(name)
+    if backend is None:
+        logging.warning(f"JSON backend {name} is not installed; using json")
+        return _stdlib_backend()
+    return backend
@@ -0,0 +1,455 @@
+"""
+Export flattened objects to SQLite tables, and import them back.
+
+Each flattened row becomes a row of the table. List (and other nested)
+values are stored as JSON text, in columns declared with type ``JSON TEXT``;
+bool, date and datetime values are converted back when read, using the
+declared column types.
+"""
+
+import json
+import re
+import sqlite3
+from contextlib import ExitStack, closing
+from datetime import date, datetime
+from itertools import islice
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+    cast,
+)
+
+from json_flattener.flattener import (
+    DEFAULT_BATCH_SIZE,
+    KEYNAME,
+    OBJECT,
+    ROW,
+    TABLE_ROWS,
+    ColumnSchema,
+    FlattenPlan,
+    GlobalConfig,
+    _as_plan,
+    _flattened_tables,
+    _infer_type,
+    iter_unflatten,
+    iter_unflatten_tables,
+)
+
+CONNECTION = Union[str, sqlite3.Connection]
+
+DEFAULT_TABLE = "objects"
+
+SQL_TYPES = {
+    "str": "TEXT",
+    "int": "INTEGER",
+    "float": "REAL",
+    "bool": "BOOLEAN",
+    "date": "DATE",
+    "datetime": "DATETIME",
+}
+"""SQLite column types for names in COLUMN_TYPES"""
+
+JSON_SQL_TYPE = "JSON TEXT"
+"""Declared type of columns of JSON text; its TEXT affinity keeps e.g. 1.0 as
+written, where SQLite would store it as the integer 1 in a JSON column"""
+
+_SQL_WRITERS: Dict[str, Callable[[Any], Any]] = {
+    "DATE": lambda v: v.isoformat() if isinstance(v, date) else v,
+    "DATETIME": lambda v: v.isoformat() if isinstance(v, date) else v,
+    JSON_SQL_TYPE: json.dumps,
+}
+
+_SQL_READERS: Dict[str, Callable[[Any], Any]] = {
+    "BOOLEAN": bool,
+    "DATE": date.fromisoformat,
+    "DATETIME": datetime.fromisoformat,
+    JSON_SQL_TYPE: json.loads,
+}
+
+_PRAGMA_VALUE = re.compile(r"^[\w.+-]+$")
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _connect(conn_or_path: CONNECTION) -> sqlite3.Connection:
+    if isinstance(conn_or_path, sqlite3.Connection):
+        return conn_or_path
+    return sqlite3.connect(conn_or_path)
+
+
+class _SQLTypeDiscovery:
+    """Collects the types of the values in each column of each table."""
+
+    def __init__(self):
+        self.seen: Dict[
+            Optional[KEYNAME], Dict[KEYNAME, Set[Optional[str]]]
+        ] = {}
+
+    def observe(self, table_key: Optional[KEYNAME], rows: Iterable[ROW]):
+        seen = self.seen.setdefault(table_key, {})
+        for row in rows:
+            for k, v in row.items():
+                types = seen.setdefault(k, set())
+                if isinstance(v, (list, dict)):
+                    types.add(JSON_SQL_TYPE)
+                elif v is not None:
+                    types.add(_infer_type(v))
+
+    def sql_types(
+        self,
+        table_key: Optional[KEYNAME],
+        schema: ColumnSchema,
+        config: GlobalConfig,
+    ) -> Dict[KEYNAME, Optional[str]]:
+        # nested values take precedence, then declared types, then inferred types
+        seen = self.seen.get(table_key, {})
+        declared = config.get_column_types()
+        sql_types: Dict[KEYNAME, Optional[str]] = {}
+        for k in schema:
+            types = seen.get(k, set())
+            if JSON_SQL_TYPE in types:
+                sql_types[k] = JSON_SQL_TYPE
+                continue
+            # columns of both ints and floats are left without a type, as a
+            # numeric type would convert one to the other when stored
+            type_name: Optional[str] = declared.get(k, None)
+            if type_name is None and len(types) == 1 and None not in types:
+                type_name = next(iter(types))
+            if type_name is not None:
+                sql_types[k] = SQL_TYPES.get(type_name, None)
+            else:
+                sql_types[k] = None
+        return sql_types
+
+
+def _set_pragmas(conn: sqlite3.Connection, pragmas: Dict[str, Any]):
+    for k, v in pragmas.items():
+        if not k.isidentifier() or not _PRAGMA_VALUE.match(str(v)):
+            raise ValueError(f"Invalid pragma: {k}={v}")
+        conn.execute(f"PRAGMA {k} = {v}")
+
+
+def flatten_to_sqlite(
+    objs: Iterable[OBJECT],
+    conn_or_path: CONNECTION,
+    table: str = DEFAULT_TABLE,
+    config: Optional[Union[GlobalConfig, FlattenPlan]] = None,
+    fieldnames: Optional[Iterable[KEYNAME]] = None,
+    two_pass: bool = False,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    if_exists: str = "replace",
+    wal: bool = False,
+    pragmas: Optional[Dict[str, Any]] = None,
+    workers: Optional[int] = None,
+) -> ColumnSchema:
+    """
+    Flatten objects to a SQLite table.
+
+    The table is created from the discovered columns. Rows are inserted
+    with executemany, committing a transaction every batch_size rows. As
+    with flatten_to_csv, rows are only inserted as they are produced if
+    the columns are known in advance (from ``fieldnames``,
+    ``config.csv_fieldnames`` or a first pass if ``two_pass`` is set);
+    otherwise all rows are flattened first.
+
+    List elements of ``child_table`` keys are inserted into a child table
+    for each key, named ``{table}_{key}`` (see child_table_name).
+
+    Column types are inferred from the values, unless declared in the
+    configuration. When streaming with ``fieldnames``, types are inferred
+    from the first batch.
+
+    :param objs:
+    :param conn_or_path: connection, or path to database file
+    :param table: name of table to create
+    :param config: mapping configuration, or a plan compiled from one
+    :param fieldnames: columns to write, in order
+    :param two_pass: discover columns and types in a separate pass over objs
+    :param batch_size: number of rows inserted in each transaction
+    :param if_exists: if the table exists, ``replace`` it, ``append`` to
+        it, or ``fail``
+    :param wal: use write-ahead logging (journal_mode=wal)
+    :param pragmas: other pragmas to set on the connection, e.g.
+        ``{"synchronous": "off"}``
+    :param workers: number of processes flattening objects, if more than one
+    :raises ValueError: if two_pass is set and objs is a one-shot iterator,
+        or if a list is found in a column not declared as JSON
+    :return: the columns written
+    """
+    if if_exists not in ("replace", "append", "fail"):
+        raise ValueError(
+            f"if_exists must be replace, append or fail, not {if_exists}"
+        )
+    plan = _as_plan(config)
+    config = plan.config
+    discovery = _SQLTypeDiscovery()
+    tables, schema, child_schemas = _flattened_tables(
+        objs, plan, fieldnames, two_pass, discovery.observe, workers
+    )
+    pragmas = dict(pragmas or {})
+    if wal:
+        pragmas["journal_mode"] = "wal"
+    conn = _connect(conn_or_path)
+    try:
+        _set_pragmas(conn, pragmas)
+        tables = iter(tables)
+        batch = list(islice(tables, batch_size))
+        if not discovery.seen:
+            # streaming: infer types from the first batch
+            discovery.observe(None, [row for row, _ in batch])
+        names: Dict[Optional[KEYNAME], str] = {None: table}
+        schemas: Dict[Optional[KEYNAME], ColumnSchema] = {None: schema}
+        for k in plan.child_keys:
+            names[k] = child_table_name(table, k)
+            schemas[k] = child_schemas[k]
+        if if_exists == "append" and plan.child_keys:
+            offset = _next_row_number(conn, table, config.row_column)
+            if offset:
+                tables = _offset_row_numbers(tables, offset, config)
+                batch = list(_offset_row_numbers(batch, offset, config))
+        inserts = {}
+        for table_key, name in names.items():
+            sql_types = discovery.sql_types(
+                table_key, schemas[table_key], config
+            )
+            _create_table(conn, name, sql_types, if_exists)
+            inserts[table_key] = _insert_statement(
+                name, list(schemas[table_key]), sql_types
+            )
+        while batch:
+            try:
+                with conn:
+                    for table_key, statement in inserts.items():
+                        insert, columns, writers = statement
+                        if table_key is None:
+                            rows = [row for row, _ in batch]
+                        else:
+                            rows = [
+                                r
+                                for _, children in batch
+                                for r in children.get(table_key, ())
+                            ]
+                        values = _iter_values(rows, columns, writers)
+                        conn.executemany(insert, values)
+            except (sqlite3.InterfaceError, sqlite3.ProgrammingError) as e:
+                # e.g. a list in a column not declared as JSON
+                raise ValueError(
+                    f"Rows do not match the types of earlier rows ({e}); "
+                    "declare column types, or discover them in a first pass"
+                )
+            batch = list(islice(tables, batch_size))
+    finally:
+        if conn is not conn_or_path:
+            conn.close()
+    return schema
+
+
+def child_table_name(table: str, key: KEYNAME) -> str:
+    """
+    Name of the table holding the list elements of a child_table key.
+
+    :param table: name of the parent table
+    :param key: child key
+    :return:
+    """
+    return f"{table}_{key}"
+
+
+def _insert_statement(
+    table: str, columns: List[KEYNAME], sql_types: Dict[KEYNAME, Optional[str]]
+) -> Tuple[str, List[KEYNAME], List[tuple]]:
+    # returns the statement, with the columns and value writers it expects
+    placeholders = ", ".join("?" for _ in columns)
+    insert = (
+        f"INSERT INTO {_quote(table)} ({', '.join(map(_quote, columns))})"
+        f" VALUES ({placeholders})"
+    )
+    writers = []
+    for i, k in enumerate(columns):
+        sql_type = sql_types[k]
+        if sql_type is not None and sql_type in _SQL_WRITERS:
+            writers.append((i, _SQL_WRITERS[sql_type]))
+    return insert, columns, writers
+
+
+def _next_row_number(
+    conn: sqlite3.Connection, table: str, row_column: KEYNAME
+) -> int:
+    # row numbers continue from those of an existing table, when appending
+    info = conn.execute(f"PRAGMA table_info({_quote(table)})").fetchall()
+    if row_column not in [name for _, name, *_ in info]:
+        return 0
+    (last,) = conn.execute(
+        f"SELECT MAX({_quote(row_column)}) FROM {_quote(table)}"
+    ).fetchone()
+    return 0 if last is None else last + 1
+
+
+def _offset_row_numbers(
+    tables: Iterable[TABLE_ROWS], offset: int, config: GlobalConfig
+) -> Iterator[TABLE_ROWS]:
+    row_column = config.row_column
+    for row, children in tables:
+        row[row_column] = cast(int, row[row_column]) + offset
+        for child_rows in children.values():
+            for child_row in child_rows:
+                child_row[row_column] = (
+                    cast(int, child_row[row_column]) + offset
+                )
+        yield row, children
+
+
+def _create_table(
+    conn: sqlite3.Connection,
+    table: str,
+    sql_types: Dict[KEYNAME, Optional[str]],
+    if_exists: str,
+):
+    column_defs = []
+    for k, sql_type in sql_types.items():
+        column_defs.append(
+            _quote(k) if sql_type is None else f"{_quote(k)} {sql_type}"
+        )
+    with conn:
+        if if_exists == "replace":
+            conn.execute(f"DROP TABLE IF EXISTS {_quote(table)}")
+        if_not_exists = "IF NOT EXISTS " if if_exists == "append" else ""
+        conn.execute(
+            f"CREATE TABLE {if_not_exists}{_quote(table)} ({', '.join(column_defs)})"
+        )
+
+
+def _iter_values(
+    rows: List[ROW],
+    columns: List[KEYNAME],
+    writers: List[tuple],
+) -> Iterator[List[Any]]:
+    for row in rows:
+        values = [row.get(k, None) for k in columns]
+        for i, write in writers:
+            if values[i] is not None:
+                values[i] = write(values[i])
+        yield values
+
+
+def iter_unflatten_from_sqlite(
+    conn_or_path: CONNECTION,
+    table: str = DEFAULT_TABLE,
+    config: Optional[Union[GlobalConfig, FlattenPlan]] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    workers: Optional[int] = None,
+) -> Iterator[OBJECT]:
+    """
+    Read objects from a SQLite table, fetching batch_size rows at a time.
+
+    Child tables of ``child_table`` keys, as written by flatten_to_sqlite,
+    are merged into their parent objects as they are read.
+
+    :param conn_or_path: connection, or path to database file
+    :param table: name of table to read
+    :param config: mapping configuration, or a plan compiled from one
+    :param batch_size: number of rows fetched at a time
+    :param workers: number of processes unflattening rows, if more than one
+    :raises ValueError: if workers is set, and there are child tables
+    :return: iterator over unflattened objects
+    """
+    plan = _as_plan(config)
+    if workers is not None and workers > 1 and plan.child_keys:
+        raise ValueError("Child tables cannot be read by worker processes")
+    conn = _connect(conn_or_path)
+    try:
+        if plan.child_keys:
+            row_column = plan.config.row_column
+            order = (
+                f"{_quote(row_column)}, {_quote(plan.config.position_column)}"
+            )
+            with ExitStack() as stack:
+                rows = _iter_table(
+                    conn, table, batch_size, stack, _quote(row_column)
+                )
+                child_tables = {
+                    k: _iter_table(
+                        conn,
+                        child_table_name(table, k),
+                        batch_size,
+                        stack,
+                        order,
+                    )
+                    for k in plan.child_keys
+                }
+                yield from iter_unflatten_tables(rows, child_tables, plan)
+        else:
+            with ExitStack() as stack:
+                rows = _iter_table(conn, table, batch_size, stack)
+                yield from iter_unflatten(rows, plan, workers)
+    finally:
+        if conn is not conn_or_path:
+            conn.close()
+
+
+def _iter_table(
+    conn: sqlite3.Connection,
+    table: str,
+    batch_size: int,
+    stack: ExitStack,
+    order_by: Optional[str] = None,
+) -> Iterator[ROW]:
+    info = conn.execute(f"PRAGMA table_info({_quote(table)})").fetchall()
+    if not info:
+        raise ValueError(f"No such table: {table}")
+    # table_info rows are (cid, name, type, notnull, default, pk)
+    readers = {
+        name: _SQL_READERS[sql_type.upper()]
+        for _, name, sql_type, *_ in info
+        if sql_type.upper() in _SQL_READERS
+    }
+    query = f"SELECT * FROM {_quote(table)}"
+    if order_by is not None:
+        query += f" ORDER BY {order_by}"
+    cursor = stack.enter_context(closing(conn.execute(query)))
+    keys = [d[0] for d in cursor.description]
+    return _iter_rows(cursor, keys, readers, batch_size)
+
+
+def _iter_rows(
+    cursor: sqlite3.Cursor,
+    keys: List[KEYNAME],
+    readers: Dict[KEYNAME, Callable[[Any], Any]],
+    batch_size: int,
+) -> Iterator[ROW]:
+    while True:
+        batch = cursor.fetchmany(batch_size)
+        if not batch:
+            return
+        for values in batch:
+            row = {k: v for k, v in zip(keys, values) if v is not None}
+            for k, read in readers.items():
+                if k in row:
+                    row[k] = read(row[k])
+            yield row
+
+
+def unflatten_from_sqlite(
+    conn_or_path: CONNECTION,
+    table: str = DEFAULT_TABLE,
+    config: Optional[Union[GlobalConfig, FlattenPlan]] = None,
+) -> List[OBJECT]:
+    """
+    Read objects from a SQLite table.
+
+    :param conn_or_path: connection, or path to database file
+    :param table: name of table to read
+    :param config: mapping configuration, or a plan compiled from one
+    :return:
+    """
+    return list(iter_unflatten_from_sqlite(conn_or_path, table, config))
@@ -1,7 +1,27 @@
 import os
 
+from json_flattener import GlobalConfig, KeyConfig
+
 ROOT = os.path.abspath(os.path.dirname(__file__))
 INPUT_DIR = os.path.join(ROOT, "inputs")
 INPUT = os.path.join(INPUT_DIR, "books1.yaml")
 OUTPUT_DIR = os.path.join(ROOT, "output")
 
+
+def books_config(serialize_creator: bool = False) -> GlobalConfig:
+    """
+    Configuration for the book series in INPUT, with books flattened.
+
+    :param serialize_creator: if True, the creator is serialized as YAML, else flattened
+    :return:
+    """
+    if serialize_creator:
+        creator = KeyConfig(delete=True, serializers=["yaml"])
+    else:
+        creator = KeyConfig(delete=True, flatten=True)
+    return GlobalConfig(
+        key_configs={
+            "creator": creator,
+            "books": KeyConfig(delete=True, is_list=True, flatten=True),
+        }
+    )
@@ -0,0 +1,146 @@
+"""Tests the asyncio API."""
+
+import io
+import unittest
+
+import yaml
+
+from json_flattener import (
+    GlobalConfig,
+    KeyConfig,
+    aflatten,
+    aflatten_to_csv,
+    aunflatten,
+    aunflatten_from_csv,
+    awrite_jsonl,
+    flatten,
+    flatten_to_csv,
+)
+from json_flattener.aio import _aiter_batches
+from tests import INPUT, books_config
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+
+class CoroutineSink:
+    """Sink whose write is a coroutine, as in aiofiles."""
+
+    def __init__(self):
+        self.parts = []
+
+    async def write(self, text):
+        self.parts.append(text)
+
+
+class StreamSink:
+    """Sink with a plain write and a drain coroutine, as in asyncio."""
+
+    def __init__(self):
+        self.parts = []
+        self.drained = 0
+
+    def write(self, text):
+        self.parts.append(text)
+
+    async def drain(self):
+        self.drained += 1
+
+
+class TestAio(unittest.IsolatedAsyncioTestCase):
+    """Tests flattening from asynchronous sources to asynchronous sinks."""
+
+    def setUp(self) -> None:
+        with open(INPUT) as stream:
+            objs = yaml.safe_load(stream)["all_book_series"]
+        # enough objects for several batches, some with escaped newlines
+        self.objs = [
+            dict(obj, id=f"{obj['id']}-{i}", name=f"{obj['name']}\n{i}\\")
+            for i in range(20)
+            for obj in objs
+        ]
+
+    async def test_aflatten(self):
+        """Async flatten and unflatten give the same rows as flatten."""
+        config = books_config(serialize_creator=True)
+        rows = [r async for r in aflatten(_aiter(self.objs), config, 7)]
+        self.assertEqual(
+            flatten(self.objs, books_config(serialize_creator=True)), rows
+        )
+        objs = [o async for o in aunflatten(_aiter(rows), config, 7)]
+        self.assertEqual(self.objs, objs)
+        config = GlobalConfig(
+            key_configs={"books": KeyConfig(child_table=True)}
+        )
+        with self.assertRaises(ValueError):
+            [r async for r in aflatten(_aiter(self.objs), config)]
+        with self.assertRaises(ValueError):
+            [o async for o in aunflatten(_aiter(rows), config)]
+
+    async def test_aflatten_to_csv(self):
+        """Async CSV output is identical to flatten_to_csv."""
+        expected = io.StringIO()
+        schema = flatten_to_csv(
+            self.objs, expected, books_config(serialize_creator=True)
+        )
+        sink = StreamSink()
+        await aflatten_to_csv(
+            _aiter(self.objs),
+            sink,
+            books_config(serialize_creator=True),
+            batch_size=7,
+        )
+        self.assertEqual(expected.getvalue(), "".join(sink.parts))
+        self.assertGreater(sink.drained, 1)
+        # streamed, a batch at a time, when the columns are known
+        sink = CoroutineSink()
+        await aflatten_to_csv(
+            _aiter(self.objs),
+            sink,
+            books_config(serialize_creator=True),
+            schema,
+            batch_size=7,
+        )
+        self.assertEqual(expected.getvalue(), "".join(sink.parts))
+        self.assertGreater(len(sink.parts), len(self.objs) // 7)
+        with self.assertRaises(ValueError):
+            config = GlobalConfig(
+                key_configs={"books": KeyConfig(child_table=True)}
+            )
+            await aflatten_to_csv(_aiter(self.objs), sink, config)
+
+    async def test_aunflatten_from_csv(self):
+        """Reads objects from async lines, as str or bytes."""
+        config = books_config(serialize_creator=True)
+        output = io.StringIO()
+        flatten_to_csv(self.objs, output, config)
+        lines = io.StringIO(output.getvalue()).readlines()
+        for source in [lines, [line.encode("utf-8") for line in lines]]:
+            objs = [
+                o async for o in aunflatten_from_csv(_aiter(source), config, 5)
+            ]
+            self.assertEqual(self.objs, objs)
+
+    async def test_awrite_jsonl(self):
+        """Writes one JSON object per line."""
+        sink = CoroutineSink()
+        await awrite_jsonl(_aiter(self.objs[:3]), sink)
+        lines = "".join(sink.parts).splitlines()
+        self.assertEqual(3, len(lines))
+        self.assertEqual(self.objs[0], yaml.safe_load(lines[0]))
+
+    async def test_source_errors(self):
+        """Errors from the source are raised after the items before them."""
+
+        async def failing():
+            yield 1
+            yield 2
+            raise RuntimeError("source failed")
+
+        items = []
+        with self.assertRaises(RuntimeError):
+            async for batch in _aiter_batches(failing(), 10):
+                items.extend(batch)
+        self.assertEqual([1, 2], items)
@@ -5,9 +5,11 @@ import unittest
 from pathlib import Path
 from typing import Optional
 
+import yaml
 from click.testing import CliRunner
 
 from json_flattener.cli import main
+from json_flattener.columnar import pa
 from tests import INPUT, OUTPUT_DIR
 
 FLATTEN = "flatten"
@@ -102,3 +104,249 @@ class TestCommandLineInterface(unittest.TestCase):
                 },
                 obj1,
             )
+
+    def test_json_backends(self):
+        """Tests selecting a JSON implementation."""
+        opts = ["-C", "creator=json", "-C", "books=json"]
+        out_file = str(Path(OUTPUT_DIR) / "out-json.tsv")
+        conf_file = str(Path(OUTPUT_DIR) / "conf-json.yaml")
+        with open(INPUT) as stream:
+            expected = yaml.safe_load(stream)["all_book_series"]
+        for backend in ["json", "auto"]:
+            result = self.runner.invoke(
+                main,
+                [FLATTEN, "-i", INPUT, "-o", out_file, "-O", conf_file]
+                + opts
+                + ["--json-backend", backend],
+            )
+            self.assertEqual(0, result.exit_code)
+            with open(out_file) as file:
+                self.assertIn("creator_json", file.readline())
+            out_file2 = str(Path(OUTPUT_DIR) / "out-json.json")
+            result = self.runner.invoke(
+                main,
+                [UNFLATTEN, "-i", out_file, "-o", out_file2, "-c", conf_file]
+                + ["--json-backend", backend],
+            )
+            self.assertEqual(0, result.exit_code)
+            with open(out_file2) as file:
+                self.assertEqual(expected, json.load(file))
+
+    def test_jsonl(self):
+        """Tests streaming JSON Lines input and output."""
+        opts = ["-C", "creator=flat", "-C", "books=multivalued"]
+        with open(INPUT) as stream:
+            expected = yaml.safe_load(stream)["all_book_series"]
+        jsonl_file = str(Path(OUTPUT_DIR) / "books.ndjson")
+        with open(jsonl_file, "w") as stream:
+            for obj in expected:
+                stream.write(json.dumps(obj) + "\n")
+        out_file = str(Path(OUTPUT_DIR) / "out-jsonl.tsv")
+        out_file_from_yaml = str(Path(OUTPUT_DIR) / "out-yaml.tsv")
+        conf_file = str(Path(OUTPUT_DIR) / "conf-jsonl.yaml")
+        result = self.runner.invoke(
+            main,
+            [FLATTEN, "-i", jsonl_file, "-o", out_file, "-O", conf_file] + opts,
+        )
+        self.assertEqual(0, result.exit_code)
+        result = self.runner.invoke(
+            main, [FLATTEN, "-i", INPUT, "-o", out_file_from_yaml] + opts
+        )
+        self.assertEqual(0, result.exit_code)
+        with open(out_file) as file, open(out_file_from_yaml) as file2:
+            self.assertEqual(file2.read(), file.read())
+        out_file2 = str(Path(OUTPUT_DIR) / "out2.jsonl")
+        result = self.runner.invoke(
+            main,
+            [UNFLATTEN, "-i", out_file, "-o", out_file2, "-c", conf_file]
+            + opts,
+        )
+        self.assertEqual(0, result.exit_code)
+        with open(out_file2) as file:
+            lines = file.readlines()
+        self.assertEqual(len(expected), len(lines))
+        self.assertEqual(expected, [json.loads(line) for line in lines])
+
+    def test_incremental(self):
+        """Tests incremental parsing of json and yaml input."""
+        opts = ["-C", "creator=flat", "-C", "books=multivalued"]
+        with open(INPUT) as stream:
+            shop = yaml.safe_load(stream)
+        json_file = str(Path(OUTPUT_DIR) / "books.json")
+        with open(json_file, "w") as stream:
+            json.dump(shop, stream)
+        expected_file = str(Path(OUTPUT_DIR) / "out-expected.tsv")
+        result = self.runner.invoke(
+            main, [FLATTEN, "-i", INPUT, "-o", expected_file] + opts
+        )
+        self.assertEqual(0, result.exit_code)
+        with open(expected_file) as file:
+            expected = file.read()
+        for input_file in [INPUT, json_file]:
+            out_file = str(Path(OUTPUT_DIR) / "out-incremental.tsv")
+            result = self.runner.invoke(
+                main,
+                [FLATTEN, "--incremental", "-k", "all_book_series"]
+                + ["-i", input_file, "-o", out_file]
+                + opts,
+            )
+            self.assertEqual(0, result.exit_code)
+            with open(out_file) as file:
+                self.assertEqual(expected, file.read())
+
+    def test_multi_document(self):
+        """Tests streaming unflatten to a YAML document per object."""
+        opts = ["-C", "creator=flat", "-C", "books=multivalued"]
+        with open(INPUT) as stream:
+            expected = yaml.safe_load(stream)["all_book_series"]
+        tsv_file = str(Path(OUTPUT_DIR) / "out-multidoc.tsv")
+        conf_file = str(Path(OUTPUT_DIR) / "conf-multidoc.yaml")
+        result = self.runner.invoke(
+            main,
+            [FLATTEN, "-k", "all_book_series", "-i", INPUT, "-o", tsv_file]
+            + ["-O", conf_file]
+            + opts,
+        )
+        self.assertEqual(0, result.exit_code)
+        out_file = str(Path(OUTPUT_DIR) / "out-multidoc.yaml")
+        result = self.runner.invoke(
+            main,
+            [UNFLATTEN, "--multi-document", "-i", tsv_file, "-o", out_file]
+            + ["-c", conf_file, "-t", "yaml"],
+        )
+        self.assertEqual(0, result.exit_code)
+        with open(out_file) as stream:
+            self.assertEqual(expected, list(yaml.safe_load_all(stream)))
+
+    def test_infer_types(self):
+        """Tests saving inferred column types in the configuration."""
+        opts = ["-C", "creator=flat", "-C", "books=multivalued"]
+        with open(INPUT) as stream:
+            expected = yaml.safe_load(stream)
+        tsv_file = str(Path(OUTPUT_DIR) / "out-typed.tsv")
+        conf_file = str(Path(OUTPUT_DIR) / "conf-typed.yaml")
+        result = self.runner.invoke(
+            main,
+            [FLATTEN, "--infer-types", "-k", "all_book_series"]
+            + ["-i", INPUT, "-o", tsv_file, "-O", conf_file]
+            + opts,
+        )
+        self.assertEqual(0, result.exit_code)
+        with open(conf_file) as stream:
+            column_types = yaml.safe_load(stream)["column_types"]
+        self.assertEqual("str", column_types["id"])
+        self.assertEqual("float", column_types["books_price"])
+        out_file = str(Path(OUTPUT_DIR) / "out-typed.json")
+        result = self.runner.invoke(
+            main,
+            [UNFLATTEN, "-k", "all_book_series", "-i", tsv_file, "-o", out_file]
+            + ["-c", conf_file],
+        )
+        self.assertEqual(0, result.exit_code)
+        with open(out_file) as stream:
+            self.assertEqual(expected, json.load(stream))
+
+    @unittest.skipIf(pa is None, "pyarrow is not installed")
+    def test_parquet(self):
+        """Tests flattening to and unflattening from Parquet."""
+        opts = ["-C", "creator=flat", "-C", "books=multivalued"]
+        with open(INPUT) as stream:
+            expected = yaml.safe_load(stream)
+        parquet_file = str(Path(OUTPUT_DIR) / "out.parquet")
+        conf_file = str(Path(OUTPUT_DIR) / "conf-parquet.yaml")
+        result = self.runner.invoke(
+            main,
+            [FLATTEN, "-k", "all_book_series", "-i", INPUT, "-o", parquet_file]
+            + ["-O", conf_file]
+            + opts,
+        )
+        self.assertEqual(0, result.exit_code)
+        out_file = str(Path(OUTPUT_DIR) / "out-parquet.yaml")
+        result = self.runner.invoke(
+            main,
+            [UNFLATTEN, "-k", "all_book_series", "-i", parquet_file]
+            + ["-o", out_file, "-c", conf_file],
+        )
+        self.assertEqual(0, result.exit_code)
+        with open(out_file) as stream:
+            self.assertEqual(expected, yaml.safe_load(stream))
+
+    def test_sqlite(self):
+        """Tests flattening to and unflattening from SQLite."""
+        opts = ["-C", "creator=flat", "-C", "books=multivalued"]
+        with open(INPUT) as stream:
+            expected = yaml.safe_load(stream)
+        db_file = str(Path(OUTPUT_DIR) / "out.db")
+        conf_file = str(Path(OUTPUT_DIR) / "conf-sqlite.yaml")
+        result = self.runner.invoke(
+            main,
+            [FLATTEN, "-k", "all_book_series", "-i", INPUT, "-o", db_file]
+            + ["-O", conf_file, "--table", "books"]
+            + opts,
+        )
+        self.assertEqual(0, result.exit_code)
+        out_file = str(Path(OUTPUT_DIR) / "out-sqlite.yaml")
+        result = self.runner.invoke(
+            main,
+            [UNFLATTEN, "-k", "all_book_series", "-i", db_file, "-o", out_file]
+            + ["-c", conf_file, "--table", "books"],
+        )
+        self.assertEqual(0, result.exit_code)
+        with open(out_file) as stream:
+            self.assertEqual(expected, yaml.safe_load(stream))
+
+    def test_child_tables(self):
+        """Tests writing list elements to child tables next to the output."""
+        opts = ["-C", "creator=flat", "-C", "books=child"]
+        with open(INPUT) as stream:
+            expected = yaml.safe_load(stream)
+        out_file = str(Path(OUTPUT_DIR) / "series.tsv")
+        conf_file = str(Path(OUTPUT_DIR) / "conf-series.yaml")
+        result = self.runner.invoke(
+            main,
+            [FLATTEN, "-k", "all_book_series", "-i", INPUT, "-o", out_file]
+            + ["-O", conf_file]
+            + opts,
+        )
+        self.assertEqual(0, result.exit_code)
+        with open(str(Path(OUTPUT_DIR) / "series_books.tsv")) as stream:
+            header = stream.readline().split("\t")
+            self.assertEqual(["_row", "_position", "id"], header[0:3])
+        yaml_file = str(Path(OUTPUT_DIR) / "series.yaml")
+        result = self.runner.invoke(
+            main,
+            [UNFLATTEN, "-k", "all_book_series", "-i", out_file]
+            + ["-o", yaml_file, "-c", conf_file],
+        )
+        self.assertEqual(0, result.exit_code)
+        with open(yaml_file) as stream:
+            self.assertEqual(expected, yaml.safe_load(stream))
+        # child tables cannot be written to stdout
+        result = self.runner.invoke(
+            main, [FLATTEN, "-k", "all_book_series", "-i", INPUT] + opts
+        )
+        self.assertNotEqual(0, result.exit_code)
+
+    def test_jobs(self):
+        """Tests flattening and unflattening in several processes."""
+        opts = ["-C", "creator=flat", "-C", "books=multivalued"]
+        with open(INPUT) as stream:
+            expected = yaml.safe_load(stream)
+        out_file = str(Path(OUTPUT_DIR) / "out-jobs.tsv")
+        conf_file = str(Path(OUTPUT_DIR) / "conf-jobs.yaml")
+        result = self.runner.invoke(
+            main,
+            [FLATTEN, "-k", "all_book_series", "-i", INPUT, "-o", out_file]
+            + ["-O", conf_file, "--jobs", "2"]
+            + opts,
+        )
+        self.assertEqual(0, result.exit_code)
+        yaml_file = str(Path(OUTPUT_DIR) / "out-jobs.yaml")
+        result = self.runner.invoke(
+            main,
+            [UNFLATTEN, "-k", "all_book_series", "-i", out_file]
+            + ["-o", yaml_file, "-c", conf_file, "-j", "2"],
+        )
+        self.assertEqual(0, result.exit_code)
+        with open(yaml_file) as stream:
+            self.assertEqual(expected, yaml.safe_load(stream))
@@ -0,0 +1,179 @@
+"""Tests column-major output."""
+
+import io
+import unittest
+from array import array
+from pathlib import Path
+
+import yaml
+
+from json_flattener import (
+    GlobalConfig,
+    KeyConfig,
+    flatten,
+    flatten_to_arrow,
+    flatten_to_columns,
+    flatten_to_parquet,
+    iter_unflatten_from_columns,
+    unflatten_from_parquet,
+)
+from json_flattener.columnar import pa, pq
+from tests import INPUT, OUTPUT_DIR, books_config
+
+
+class ColumnarCase(unittest.TestCase):
+    """Test flattening to columns."""
+
+    def setUp(self) -> None:
+        """Load example objects."""
+        with open(INPUT) as stream:
+            self.objs = yaml.safe_load(stream)["all_book_series"]
+
+    def test_columns(self):
+        """Tests flattening to lists and arrays."""
+        config = books_config()
+        columns = flatten_to_columns(self.objs, config)
+        rows = flatten(self.objs, books_config())
+        self.assertEqual(list(rows[0]), list(columns)[0 : len(rows[0])])
+        self.assertEqual([row["id"] for row in rows], columns["id"])
+        # list values are kept as lists
+        self.assertEqual(
+            ["Fellowship of the Ring", "The Two Towers", "Return of the King"],
+            columns["books_name"][0],
+        )
+        self.assertEqual(
+            [row.get("creator_genres") for row in rows],
+            columns["creator_genres"],
+        )
+        self.assertEqual(
+            list(iter_unflatten_from_columns(columns, config)), self.objs
+        )
+        objs = [{"id": "X1", "n": 1, "x": 1.5}, {"id": "X2", "n": 2, "x": 2}]
+        columns = flatten_to_columns(objs)
+        self.assertEqual(array("q", [1, 2]), columns["n"])
+        self.assertEqual(array("d", [1.5, 2.0]), columns["x"])
+        self.assertEqual(["X1", "X2"], columns["id"])
+        columns = flatten_to_columns(objs, typed_arrays=False)
+        self.assertEqual([1.5, 2], columns["x"])
+        # missing values can't be held in arrays
+        columns = flatten_to_columns(objs + [{"id": "X3"}])
+        self.assertEqual([1, 2, None], columns["n"])
+        # declared types take precedence
+        config = GlobalConfig(column_types={"n": "float", "x": "int"})
+        columns = flatten_to_columns(objs, config)
+        self.assertEqual(array("d", [1.0, 2.0]), columns["n"])
+        self.assertEqual([1.5, 2], columns["x"])
+        columns = flatten_to_columns(objs, fieldnames=["n", "id"])
+        self.assertEqual(["n", "id"], list(columns))
+
+    @unittest.skipIf(pa is None, "pyarrow is not installed")
+    def test_arrow(self):
+        """Tests flattening to an Arrow table."""
+        config = books_config()
+        table = flatten_to_arrow(self.objs, config)
+        self.assertEqual(len(self.objs), table.num_rows)
+        schema = table.schema
+        self.assertEqual(
+            pa.list_(pa.float64()), schema.field("books_price").type
+        )
+        self.assertEqual(pa.string(), schema.field("id").type)
+        self.assertEqual(
+            list(iter_unflatten_from_columns(table, config)), self.objs
+        )
+        for batch in table.to_batches():
+            self.assertEqual(
+                list(iter_unflatten_from_columns(batch, config)),
+                self.objs[0 : batch.num_rows],
+            )
+        # incompatible types are converted to strings
+        table = flatten_to_arrow([{"x": [1]}, {"x": [1, "b"]}, {"y": 1}])
+        self.assertEqual([["1"], ["1", "b"], None], table["x"].to_pylist())
+        table = flatten_to_arrow([{"x": 1}, {"x": "a"}, {"x": [1, "b"]}])
+        self.assertEqual(["1", "a", "[1, 'b']"], table["x"].to_pylist())
+
+    @unittest.skipIf(pa is None, "pyarrow is not installed")
+    def test_parquet(self):
+        """Tests writing and reading Parquet files in row groups."""
+        path = str(Path(OUTPUT_DIR) / "books.parquet")
+        config = books_config()
+        config.parquet_row_group_size = 2
+        schema = flatten_to_parquet(self.objs, path, config)
+        self.assertIn("books_price", schema)
+        parquet_file = pq.ParquetFile(path)
+        self.assertEqual(3, parquet_file.num_row_groups)
+        self.assertEqual(
+            pa.list_(pa.float64()),
+            parquet_file.schema_arrow.field("books_price").type,
+        )
+        self.assertEqual(self.objs, unflatten_from_parquet(path, config))
+        # streamed, with columns and types discovered in a first pass
+        flatten_to_parquet(self.objs, path, config, two_pass=True)
+        self.assertEqual(3, pq.ParquetFile(path).num_row_groups)
+        self.assertEqual(self.objs, unflatten_from_parquet(path, config))
+        # streamed, with columns given; types are taken from the first row
+        # group, in which creator_genres has no values
+        with self.assertRaises(ValueError):
+            flatten_to_parquet(self.objs, path, config, fieldnames=schema)
+        config.parquet_row_group_size = 3
+        flatten_to_parquet(self.objs, path, config, fieldnames=schema)
+        self.assertEqual(2, pq.ParquetFile(path).num_row_groups)
+        self.assertEqual(self.objs, unflatten_from_parquet(path, config))
+        with self.assertRaises(ValueError):
+            flatten_to_parquet(iter(self.objs), path, config, two_pass=True)
+        # types are unified across row groups in a first pass
+        objs = [{"x": None}, {"x": None}, {"x": 1}, {"x": 2.5}, {"y": "a"}]
+        config = GlobalConfig(parquet_row_group_size=2)
+        flatten_to_parquet(objs, path, config, two_pass=True)
+        self.assertEqual(objs[2:4], unflatten_from_parquet(path)[2:4])
+        self.assertEqual(["x", "y"], pq.read_table(path).column_names)
+        # when streaming, later rows must match types of the first row group
+        with self.assertRaises(ValueError):
+            flatten_to_parquet(
+                [{"x": 1}, {"x": 2}, {"x": [3]}], path, config, fieldnames=["x"]
+            )
+        # declared types
+        objs = [{"id": "001", "n": 1}, {"id": "002", "n": 2}]
+        config = GlobalConfig(column_types={"n": "float"})
+        buffer = io.BytesIO()
+        flatten_to_parquet(objs, buffer, config, fieldnames=["id", "n"])
+        buffer.seek(0)
+        table = pq.read_table(buffer)
+        self.assertEqual(pa.float64(), table.schema.field("n").type)
+        self.assertEqual(["001", "002"], table["id"].to_pylist())
+        config = GlobalConfig(parquet_compression="zstd")
+        flatten_to_parquet(objs, path, config)
+        metadata = pq.ParquetFile(path).metadata
+        self.assertEqual("ZSTD", metadata.row_group(0).column(0).compression)
+
+    @unittest.skipIf(pa is None, "pyarrow is not installed")
+    def test_parquet_child_tables(self):
+        """Tests writing list elements of child keys to separate files."""
+        config = GlobalConfig(
+            key_configs={
+                "creator": KeyConfig(delete=True, flatten=True),
+                "books": KeyConfig(child_table=True),
+            },
+            parquet_row_group_size=2,
+        )
+        path = str(Path(OUTPUT_DIR) / "series.parquet")
+        books_path = str(Path(OUTPUT_DIR) / "series_books.parquet")
+        flatten_to_parquet(
+            self.objs, path, config, child_wheres={"books": books_path}
+        )
+        books = pq.read_table(books_path)
+        self.assertEqual(
+            ["_row", "_position", "id", "name"], books.column_names[0:4]
+        )
+        self.assertEqual(pa.float64(), books.schema.field("price").type)
+        self.assertNotIn("books_price", pq.read_table(path).column_names)
+        self.assertEqual(
+            self.objs,
+            unflatten_from_parquet(
+                path, config, child_sources={"books": books_path}
+            ),
+        )
+        with self.assertRaises(ValueError):
+            flatten_to_parquet(self.objs, path, config)
+        for convert in (flatten_to_columns, flatten_to_arrow):
+            with self.assertRaises(ValueError):
+                convert(self.objs, config)
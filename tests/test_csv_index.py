@@ -0,0 +1,107 @@
+"""Tests random access to flattened CSVs."""
+
+import os
+import unittest
+from pathlib import Path
+
+import yaml
+
+from json_flattener import (
+    CSVIndex,
+    csv_index,
+    flatten_to_csv,
+    unflatten_from_csv,
+)
+from tests import INPUT, OUTPUT_DIR, books_config
+
+
+class CSVIndexCase(unittest.TestCase):
+    """Test reading ranges of rows through an index."""
+
+    def setUp(self) -> None:
+        """Write example objects, some with escaped newlines."""
+        with open(INPUT) as stream:
+            objs = yaml.safe_load(stream)["all_book_series"]
+        self.objs = [
+            dict(obj, id=f"{obj['id']}-{i}", name=f"{obj['name']}\n{i}\\")
+            for i in range(50)
+            for obj in objs
+        ]
+        Path(OUTPUT_DIR).mkdir(parents=True, exist_ok=True)
+        self.path = os.path.join(OUTPUT_DIR, "books-indexed.tsv")
+        self.config = books_config(serialize_creator=True)
+        with open(self.path, "w") as stream:
+            flatten_to_csv(self.objs, stream, self.config)
+        if os.path.exists(f"{self.path}.idx"):
+            os.remove(f"{self.path}.idx")
+
+    def test_ranges(self):
+        """Tests that ranges give the same objects as reading the file."""
+        objs = self.objs
+        with CSVIndex(self.path, self.config) as index:
+            self.assertEqual(len(objs), len(index))
+            self.assertIn("books_price", index.columns)
+            self.assertEqual(objs, index.unflatten())
+            self.assertEqual(objs, unflatten_from_csv(self.path, self.config))
+            self.assertEqual(objs[10:20], index.unflatten(10, 20))
+            self.assertEqual(objs[-3:], index.unflatten(-3))
+            self.assertEqual([], index.unflatten(20, 10))
+            self.assertEqual(
+                objs[7:200], index.unflatten(7, 200, chunk_size=16)
+            )
+            self.assertEqual(
+                objs[7:200], index.unflatten(7, 200, batch_size=16)
+            )
+            self.assertEqual(
+                objs[7:200], index.unflatten(7, 200, workers=2, chunk_size=16)
+            )
+            rows = [5, -1, 0, 5]
+            self.assertEqual(
+                [objs[i] for i in rows], list(index.iter_unflatten_rows(rows))
+            )
+            with self.assertRaises(IndexError):
+                list(index.iter_unflatten_rows([len(objs)]))
+
+    def test_find(self):
+        """Tests finding rows by the text of a column."""
+        with CSVIndex(self.path, self.config) as index:
+            self.assertEqual([12], index.find("id", self.objs[12]["id"]))
+            self.assertEqual([], index.find("id", "nothing"))
+            with self.assertRaises(ValueError):
+                index.find("nothing", "x")
+
+    def test_saved_index(self):
+        """Tests that the index is saved, reused, and rebuilt if stale."""
+        index_path = f"{self.path}.idx"
+        with CSVIndex(self.path, self.config) as index:
+            offsets = index.offsets
+        self.assertTrue(os.path.exists(index_path))
+        self.assertEqual(
+            offsets,
+            csv_index._load_index(index_path, csv_index._file_stamp(self.path)),
+        )
+        with CSVIndex(self.path, self.config) as index:
+            self.assertEqual(offsets, index.offsets)
+        with open(self.path, "a") as stream:
+            stream.write("X\n")
+        with CSVIndex(self.path, self.config) as index:
+            self.assertEqual(len(self.objs) + 1, len(index))
+            self.assertEqual([{"id": "X"}], index.unflatten(-1))
+
+    def test_offsets(self):
+        """Tests finding records, with and without numpy."""
+        numpy = csv_index.np
+        try:
+            for np in [numpy, None]:
+                csv_index.np = np
+                for text, expected in [
+                    (b"", [0]),
+                    (b"a\tb", [0, 3]),
+                    (b"a\tb\n1\t2\n", [0, 4, 8]),
+                    # blank lines are skipped; escaped newlines continue
+                    (b"\na\n\r\n1\\\n2\n3\\\\\n4", [1, 5, 10, 14, 15]),
+                ]:
+                    offsets = csv_index._record_offsets(text)
+                    self.assertEqual(expected, offsets.tolist())
+        finally:
+            csv_index.np = numpy
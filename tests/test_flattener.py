@@ -4,22 +4,42 @@ import io
 import json
 import logging
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+from datetime import date
 from pathlib import Path
 from typing import Any, List
 
 import yaml
 
+import json_flattener.flattener as flattener
 from json_flattener import (
+    ColumnSchema,
+    FlattenPlan,
+    FlattenState,
     GlobalConfig,
     KeyConfig,
     Serializer,
     flatten,
+    flatten_tables,
     flatten_to_csv,
+    infer_column_types,
+    iter_csv_columns,
+    iter_flatten,
+    iter_unflatten,
+    iter_unflatten_from_csv,
+    iter_unflatten_tables,
+    register_serializer,
     unflatten,
     unflatten_from_csv,
 )
-from json_flattener.flattener import MissingColumnError
-from tests import INPUT, INPUT_DIR
+from json_flattener.flattener import (
+    SERIALIZERS,
+    YAML_DUMPER,
+    YAML_LOADER,
+    MissingColumnError,
+)
+from tests import INPUT, INPUT_DIR, OUTPUT_DIR
 
 
 def _json(obj) -> str:
@@ -366,6 +386,126 @@ class FlattenerCase(unittest.TestCase):
 
             self._roundtrip_to_tsv(objs, config=config)
 
+    def test_csv_cells(self):
+        """Tests encoding of cells of each type, and of inner delimiters."""
+        objs = [
+            {
+                "id": "a|b",
+                "n": 1,
+                "x": 1.5,
+                "b": True,
+                "e": None,
+                "l": ["p|q", None, 2, [3, "|"]],
+                "s": "t\tab\\",
+            },
+            {"id": "c", "l": [], "s": "nl\nx"},
+        ]
+        header = "id\tn\tx\tb\te\tl\ts\n"
+        expected = {
+            "|": (
+                "a\\\\|b\t1\t1.5\tTrue\t\t[p\\\\|q||2|[3, '\\\\|']]\tt\\\tab\\\\\\\\\n"
+                "c\t\t\t\t\t[]\tnl\\\nx\n"
+            ),
+            # numbers can contain this delimiter
+            "1": (
+                "a|b\t\\\\1\t\\\\1.5\tTrue\t\t[p|q1121[3, '|']]\tt\\\tab\\\\\\\\\n"
+                "c\t\t\t\t\t[]\tnl\\\nx\n"
+            ),
+        }
+        for inner_delimiter, rows in expected.items():
+            config = GlobalConfig(csv_inner_delimiter=inner_delimiter)
+            output = io.StringIO()
+            flatten_to_csv(objs, output, config)
+            self.assertEqual(header + rows, output.getvalue())
+        # in strict mode, rows are written up to a row with unknown columns
+        output = io.StringIO()
+        with self.assertRaises(ValueError):
+            flatten_to_csv(objs, output, GlobalConfig(), ["id", "l", "s"])
+        self.assertEqual("id\tl\ts\n", output.getvalue())
+        output = io.StringIO()
+        flatten_to_csv(objs[1:], output, GlobalConfig(strict=False), ["id"])
+        self.assertEqual("id\nc\n", output.getvalue())
+
+    def test_csv_cell_decoding(self):
+        """Tests decoding of declared lists, lists, serialized and plain cells."""
+        config = GlobalConfig(
+            key_configs={
+                "l": KeyConfig(is_list=True),
+                "s": KeyConfig(serializers=["json"]),
+            }
+        )
+        tsv = (
+            "id\tl\tp\ts_json\tn\n"
+            "a\t[1|x]\t[2|y]\t[1, 2]\t1_000\n"
+            "\n"
+            "b\t[3]\tInfinity\t[3]\t٣.٥\n"
+            "c\t[]\tx\\\\ty\t{}\t-1e3\n"
+        )
+        objs = list(iter_unflatten_from_csv(io.StringIO(tsv), config))
+        self.assertEqual(
+            [
+                {"id": "a", "l": [1, "x"], "p": [2, "y"], "n": 1000, "s": [1, 2]},
+                {"id": "b", "l": [3], "p": float("inf"), "n": 3.5, "s": [3]},
+                {"id": "c", "l": [None], "p": "x\ty", "n": -1000.0, "s": {}},
+            ],
+            objs,
+        )
+        with self.assertRaises(Exception):
+            list(iter_unflatten_from_csv(io.StringIO("id\tl\nd\t4\n"), config))
+        with self.assertRaises(MissingColumnError):
+            list(iter_unflatten_from_csv(io.StringIO("id\na\tb\n"), config))
+        # only strings that could be numbers are parsed as numbers
+        for x, expected in [
+            ("12", 12),
+            (" -1_2 ", -12),
+            ("1.5e3", 1500.0),
+            ("-inf", float("-inf")),
+            ("١٢", 12),
+            ("12a", "12a"),
+            ("info", "info"),
+            ("1-2", "1-2"),
+        ]:
+            self.assertEqual(expected, flattener._guess_value(x))
+
+    def test_escaped_inner_delimiters(self):
+        """Tests that inner delimiters in values survive a roundtrip."""
+        objs = [
+            {
+                "id": "a|b",
+                "l": ["x|y", "z", "w\\|v", "|", "", "1"],
+                "c": {"n": "p|q"},
+                "d": {"n": "r|s"},
+            },
+            {"id": "b", "l": ["1", "2"], "c": {"n": 1}, "d": {"n": 2}},
+            # backslashes are escaped too, so can end an element
+            {
+                "id": "c\\n",
+                "l": ["x\\", "[", 3, "\\\\|"],
+                "c": {"n": "\\|"},
+                "d": {"n": "t\\"},
+            },
+        ]
+        config = GlobalConfig(
+            key_configs={
+                "c": KeyConfig(delete=True, serializers=["json"]),
+                "d": KeyConfig(delete=True, serializers=["yaml"]),
+            }
+        )
+        output = io.StringIO()
+        flatten_to_csv(objs, output, config)
+        # empty elements are read as None, and numbers as numbers
+        objs[0]["l"] = ["x|y", "z", "w\\|v", "|", None, 1]
+        objs[1]["l"] = [1, 2]
+        for batch_size in [None, 1]:
+            self.assertEqual(
+                objs,
+                unflatten_from_csv(
+                    io.StringIO(output.getvalue()),
+                    config,
+                    batch_size=batch_size,
+                ),
+            )
+
     def test_roundtrip_from_file(self):
         """
         Tests core functionality.
@@ -394,6 +534,634 @@ class FlattenerCase(unittest.TestCase):
         logging.info(roundtrip_json)
         self._roundtrip_to_tsv(objs, config=config)
 
+    def test_iter_flatten(self):
+        """
+        Tests streaming flatten and unflatten.
+
+        Objects are pulled lazily from a generator, one at a time.
+        """
+        with open(INPUT) as stream:
+            objs = yaml.safe_load(stream)["all_book_series"]
+        kconfig = {
+            "creator": KeyConfig(delete=True, flatten=True),
+            "books": KeyConfig(delete=True, is_list=True, flatten=True),
+        }
+        config = GlobalConfig(key_configs=kconfig)
+        consumed = []
+
+        def _source():
+            for obj in objs:
+                consumed.append(obj)
+                yield obj
+
+        rows = iter_flatten(_source(), config)
+        first = next(rows)
+        self.assertEqual(1, len(consumed))
+        self.assertEqual("JRR Tolkein", first["creator_name"])
+        self.assertNotIn("creator", first)
+        flattened_objs = [first] + list(rows)
+        self.assertEqual(len(objs), len(consumed))
+        self.assertEqual(flatten(objs, config), flattened_objs)
+        roundtripped_objs = list(iter_unflatten(iter(flattened_objs), config))
+        self.assertEqual(unflatten(flattened_objs, config), roundtripped_objs)
+        self.assertEqual(objs, roundtripped_objs)
+
+    def test_streaming_csv(self):
+        """
+        Tests writing CSV rows as they are produced.
+
+        Output must be identical to the default materializing writer.
+        """
+        with open(INPUT) as stream:
+            objs = yaml.safe_load(stream)["all_book_series"]
+
+        def _config():
+            kconfig = {
+                "creator": KeyConfig(delete=True, flatten=True),
+                "books": KeyConfig(delete=True, is_list=True, flatten=True),
+            }
+            return GlobalConfig(key_configs=kconfig)
+
+        output = io.StringIO()
+        flatten_to_csv(objs, output, config=_config())
+        expected = output.getvalue()
+        header = expected.split("\n")[0].split("\t")
+        # caller-supplied columns; source is a one-shot generator
+        output = io.StringIO()
+        flatten_to_csv(
+            (obj for obj in objs), output, config=_config(), fieldnames=header
+        )
+        self.assertEqual(expected, output.getvalue())
+        # columns taken from the configuration
+        config = _config()
+        config.csv_fieldnames = header
+        output = io.StringIO()
+        flatten_to_csv(iter(objs), output, config=config)
+        self.assertEqual(expected, output.getvalue())
+        # columns discovered in a first pass over a re-iterable source
+        output = io.StringIO()
+        flatten_to_csv(objs, output, config=_config(), two_pass=True)
+        self.assertEqual(expected, output.getvalue())
+        with self.assertRaises(ValueError):
+            flatten_to_csv(iter(objs), io.StringIO(), _config(), two_pass=True)
+        # unknown columns are an error in strict mode, dropped otherwise
+        with self.assertRaises(ValueError):
+            flatten_to_csv(objs, io.StringIO(), _config(), fieldnames=["id"])
+        config = _config()
+        config.strict = False
+        output = io.StringIO()
+        flatten_to_csv(objs, output, config, fieldnames=["id"])
+        self.assertEqual(
+            ["id", "S001", "S002", "S003", "S004", "S005"],
+            output.getvalue().split(),
+        )
+
+    def test_streaming_unflatten_csv(self):
+        """
+        Tests reading objects from a CSV one row at a time.
+        """
+        with open(INPUT) as stream:
+            objs = yaml.safe_load(stream)["all_book_series"]
+        config = GlobalConfig(
+            key_configs={
+                "creator": KeyConfig(delete=True, flatten=True),
+                "books": KeyConfig(delete=True, is_list=True, flatten=True),
+            }
+        )
+        output = io.StringIO()
+        flatten_to_csv(objs, output, config=config)
+        output.seek(0)
+        it = iter_unflatten_from_csv(output, config)
+        self.assertEqual(objs[0], next(it))
+        self.assertEqual(objs[1:], list(it))
+        path = str(Path(OUTPUT_DIR) / "streaming-unflatten.tsv")
+        with open(path, "w") as stream:
+            stream.write(output.getvalue())
+        self.assertEqual(objs, list(iter_unflatten_from_csv(path, config)))
+
+    def test_column_types(self):
+        """
+        Tests declared column types.
+
+        Declared columns are parsed directly; others are guessed.
+        """
+        objs = [
+            {"id": "001", "n": 1, "x": 2.0, "ok": True, "tags": ["1", "b"]},
+            {"id": "002", "n": 3, "x": 4, "ok": False, "when": "2021-01-02"},
+        ]
+        tsv = "id\tn\tx\tok\ttags\twhen\n"
+        tsv += "001\t1\t2.0\tTrue\t[1|b]\t\n"
+        tsv += "002\t3\t4\tFalse\t\t2021-01-02\n"
+        # without declared types, numeric strings become numbers
+        guessed = unflatten_from_csv(io.StringIO(tsv), GlobalConfig())
+        self.assertEqual(1, guessed[0]["id"])
+        self.assertEqual("True", guessed[0]["ok"])
+        self.assertEqual([1, "b"], guessed[0]["tags"])
+        config = GlobalConfig(
+            column_types={"id": "str", "x": "float", "ok": "bool"},
+            key_configs={"tags": KeyConfig(typemap={"tags": "str"})},
+        )
+        self.assertEqual(
+            {"id": "str", "x": "float", "ok": "bool", "tags": "str"},
+            config.get_column_types(),
+        )
+        typed = unflatten_from_csv(io.StringIO(tsv), config)
+        self.assertEqual(objs, typed)
+        self.assertEqual(4.0, typed[1]["x"])
+        self.assertIsInstance(typed[1]["x"], float)
+        config.column_types["when"] = "date"
+        typed = unflatten_from_csv(io.StringIO(tsv), config)
+        self.assertEqual(date(2021, 1, 2), typed[1]["when"])
+        config.column_types["n"] = "bool"
+        with self.assertRaises(ValueError):
+            unflatten_from_csv(io.StringIO(tsv), config)
+        config.column_types["n"] = "decimal"
+        with self.assertRaises(ValueError):
+            unflatten_from_csv(io.StringIO(tsv), config)
+        # round trip through a saved configuration
+        saved = GlobalConfig(column_types={"id": "str"}).as_dict()
+        config = GlobalConfig.from_dict(**saved)
+        self.assertEqual({"id": "str"}, config.column_types)
+
+    def test_csv_columns(self):
+        """
+        Tests parsing a CSV in batches, a column at a time.
+
+        Values must be identical to parsing cell by cell, with or without numpy.
+        """
+        tsv = "id\tn\tx\tmixed\tbig\ttags\n"
+        tsv += "X1\t1\t1.5\t1\t99999999999999999999\t[1|2.5|a]\n"
+        tsv += "X2\t2\tnan\t2.5\t1\t\n"
+        tsv += "X3\t\t-1e3\tz\t\t[]\n"
+        expected_columns = {
+            "id": ["X1", "X2", "X3"],
+            "n": [1, 2, None],
+            "x": [1.5, float("inf"), -1000.0],
+            "mixed": [1, 2.5, "z"],
+            "big": [99999999999999999999, 1, None],
+            "tags": [[1, 2.5, "a"], None, [None]],
+        }
+        numpy = flattener.np
+        for np in [numpy, None]:
+            flattener.np = np
+            try:
+                for batch_size in [1, 2, 100]:
+                    expected = unflatten_from_csv(io.StringIO(tsv))
+                    objs = unflatten_from_csv(
+                        io.StringIO(tsv), batch_size=batch_size
+                    )
+                    self.assertEqual(repr(expected), repr(objs))
+                columns = list(iter_csv_columns(io.StringIO(tsv)))
+                self.assertEqual(1, len(columns))
+                columns = columns[0]
+                columns["x"][1] = float("inf")  # nan != nan
+                self.assertEqual(expected_columns, columns)
+                self.assertIsInstance(columns["x"][2], float)
+                # declared types
+                config = GlobalConfig(column_types={"n": "float"})
+                columns = next(iter_csv_columns(io.StringIO(tsv), config))
+                self.assertEqual([1.0, 2.0, None], columns["n"])
+                self.assertIsInstance(columns["n"][0], float)
+                config.column_types["x"] = "int"
+                with self.assertRaises(ValueError):
+                    list(iter_csv_columns(io.StringIO(tsv), config))
+            finally:
+                flattener.np = numpy
+        with self.assertRaises(MissingColumnError):
+            list(iter_csv_columns(io.StringIO("a\tb\n1\t2\t3\n")))
+        with open(INPUT) as stream:
+            objs = yaml.safe_load(stream)["all_book_series"]
+        config = GlobalConfig(
+            key_configs={
+                "creator": KeyConfig(delete=True, flatten=True),
+                "books": KeyConfig(delete=True, is_list=True, flatten=True),
+            }
+        )
+        output = io.StringIO()
+        flatten_to_csv(objs, output, config=config)
+        output.seek(0)
+        self.assertEqual(objs, unflatten_from_csv(output, config, batch_size=2))
+
+    def test_infer_column_types(self):
+        """
+        Tests inferring column types from flattened rows.
+        """
+        rows = [
+            {"id": "X1", "n": 1, "x": 1, "mixed": "a", "tags": ["a", "b"]},
+            {"id": "X2", "n": 2, "x": 1.5, "mixed": 1, "flag": True},
+            {"id": "X3", "n": None, "when": date(2021, 1, 2)},
+        ]
+        self.assertEqual(
+            {
+                "id": "str",
+                "n": "int",
+                "x": "float",
+                "tags": "str",
+                "flag": "bool",
+                "when": "date",
+            },
+            infer_column_types(rows),
+        )
+        self.assertEqual(
+            {"id": "str", "n": "int", "x": "int", "mixed": "str", "tags": "str"},
+            infer_column_types(rows, sample_size=1),
+        )
+        with open(INPUT) as stream:
+            objs = yaml.safe_load(stream)["all_book_series"]
+        config = GlobalConfig(
+            key_configs={
+                "creator": KeyConfig(delete=True, flatten=True),
+                "books": KeyConfig(delete=True, is_list=True, flatten=True),
+            }
+        )
+        config.column_types = infer_column_types(flatten(objs, config))
+        self.assertEqual("float", config.column_types["books_price"])
+        output = io.StringIO()
+        flatten_to_csv(objs, output, config=config)
+        output.seek(0)
+        self.assertEqual(objs, unflatten_from_csv(output, config))
+
+    def test_column_schema(self):
+        """
+        Tests column discovery.
+
+        Columns are reported in first-seen order, and can be reused.
+        """
+        rows = [
+            {"id": "X1", "a": 1},
+            {"id": "X2", "b": 2, "a": 3},
+            {"c": 4, "id": "X3"},
+        ]
+        schema = ColumnSchema.from_rows(rows)
+        self.assertEqual(["id", "a", "b", "c"], schema.columns)
+        self.assertEqual(4, len(schema))
+        self.assertIn("b", schema)
+        self.assertNotIn("d", schema)
+        schema.add_row({"d": 5, "a": 6})
+        self.assertEqual(["id", "a", "b", "c", "d"], list(schema))
+        # wide melted rows: one column per distinct value
+        objs = [
+            {"id": f"X{i}", "tags": [f"t{j}" for j in range(i, i + 50)]}
+            for i in range(0, 200)
+        ]
+        kconfig = {"tags": KeyConfig(delete=True, melt_list_elements=True)}
+        config = GlobalConfig(key_configs=kconfig)
+        output = io.StringIO()
+        schema = flatten_to_csv(objs, output, config)
+        self.assertEqual(["id", "t0", "t1"], schema.columns[0:3])
+        self.assertEqual(250, len(schema))
+        self.assertEqual(
+            "\t".join(schema.columns), output.getvalue().split("\n")[0]
+        )
+        output2 = io.StringIO()
+        schema2 = flatten_to_csv(objs, output2, config, fieldnames=schema)
+        self.assertEqual(schema, schema2)
+        self.assertEqual(output.getvalue(), output2.getvalue())
+
+    def test_child_tables(self):
+        """
+        Tests writing list elements to child tables.
+
+        Child rows reference their parent by row number, so that the
+        parent table has one column per key, however long the lists.
+        """
+        with open(INPUT) as stream:
+            objs = yaml.safe_load(stream)["all_book_series"]
+        creator = objs[0]["creator"]
+        objs.append(
+            {"id": "S006", "creator": creator, "books": [], "genres": []}
+        )
+        objs.append({"id": "S007", "creator": creator})
+        config = GlobalConfig(
+            key_configs={
+                "creator": KeyConfig(delete=True, flatten=True),
+                "books": KeyConfig(child_table=True),
+                "genres": KeyConfig(child_table=True),
+            }
+        )
+        rows, child_tables = flatten_tables(objs, config)
+        self.assertEqual(0, rows[0]["_row"])
+        self.assertEqual(3, rows[0]["books_count"])
+        self.assertNotIn("books", rows[0])
+        self.assertEqual(0, rows[5]["books_count"])
+        self.assertNotIn("books_count", rows[6])
+        book = child_tables["books"][1]
+        self.assertEqual(0, book["_row"])
+        self.assertEqual(1, book["_position"])
+        self.assertEqual("The Two Towers", book["name"])
+        # scalar elements are stored in a column named after the key
+        self.assertEqual(
+            {"_row": 0, "_position": 0, "genres": "fantasy"},
+            child_tables["genres"][0],
+        )
+        self.assertEqual(
+            objs, list(iter_unflatten_tables(rows, child_tables, config))
+        )
+        output = io.StringIO()
+        books = io.StringIO()
+        genres = io.StringIO()
+        flatten_to_csv(
+            objs,
+            output,
+            config,
+            child_outstreams={"books": books, "genres": genres},
+        )
+        self.assertEqual(
+            ["_row", "id", "name", "books_count", "genres_count"],
+            output.getvalue().split("\n")[0].split("\t")[0:5],
+        )
+        self.assertEqual(
+            "_row\t_position\tid\tname\tprice\tsummary",
+            books.getvalue().split("\n")[0],
+        )
+        for stream in (output, books, genres):
+            stream.seek(0)
+        child_sources = {"books": books, "genres": genres}
+        objs2 = iter_unflatten_from_csv(
+            output, config, child_sources=child_sources
+        )
+        self.assertEqual(objs, list(objs2))
+        with self.assertRaises(ValueError):
+            flatten_to_csv(objs, io.StringIO(), config)
+        # without child tables, lists of child keys can't be written
+        for convert in (flatten, iter_flatten, unflatten, iter_unflatten):
+            with self.assertRaises(ValueError):
+                list(convert(objs, config))
+
+    def test_flatten_state(self):
+        """
+        Tests flattening with a state, leaving the configuration unchanged.
+
+        Threads share one configuration, each with a state of its own.
+        """
+        with open(INPUT) as stream:
+            objs = yaml.safe_load(stream)["all_book_series"]
+        config = GlobalConfig(
+            key_configs={
+                "creator": KeyConfig(delete=True, flatten=True),
+                "books": KeyConfig(delete=True, is_list=True, flatten=True),
+                "genres": KeyConfig(melt_list_elements=True),
+            }
+        )
+        original = deepcopy(config)
+        plan = config.compile(FlattenState())
+
+        def _flatten(obj):
+            obj_plan = plan.with_state(FlattenState())
+            return flatten([obj], obj_plan), obj_plan.state
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(_flatten, objs))
+        self.assertEqual(original, config)
+        rows = []
+        state = FlattenState()
+        for obj_rows, obj_state in results:
+            rows.extend(obj_rows)
+            state.merge(obj_state)
+        # the same columns, in the same order, as flattening in one run
+        expected_config = deepcopy(original)
+        self.assertEqual(rows, flatten(objs, expected_config))
+        merged_config = state.to_config(config)
+        self.assertEqual(original, config)
+        self.assertEqual(expected_config, merged_config)
+        self.assertEqual(
+            {"fantasy", "scifi"},
+            merged_config.key_configs["genres"].distinct_values,
+        )
+        config.key_configs.pop("genres")
+        plan = config.compile(FlattenState())
+        rows = flatten(objs, plan)
+        self.assertEqual({}, config.key_configs["books"].mappings)
+        self.assertEqual(objs, unflatten(rows, plan))
+        self.assertEqual(objs, unflatten(rows, plan.state.to_config(config)))
+
+    def test_workers(self):
+        """
+        Tests flattening and unflattening in worker processes.
+
+        Rows, columns and objects must be as if processed serially.
+        """
+        with open(INPUT) as stream:
+            objs = yaml.safe_load(stream)["all_book_series"]
+        objs = [
+            dict(obj, id=f"{obj['id']}.{i}") for i in range(3) for obj in objs
+        ]
+        objs[7]["name"] = "multi\nline \\"
+
+        def _config():
+            kconfig = {
+                "creator": KeyConfig(delete=True, flatten=True),
+                "books": KeyConfig(delete=True, is_list=True, flatten=True),
+                "genres": KeyConfig(serializers=[Serializer.yaml]),
+            }
+            return GlobalConfig(key_configs=kconfig)
+
+        config = _config()
+        expected = flatten(objs, config)
+        parallel_config = _config()
+        rows = list(
+            iter_flatten(objs, parallel_config, workers=2, chunk_size=4)
+        )
+        self.assertEqual(expected, rows)
+        for k, key_config in config.key_configs.items():
+            self.assertEqual(
+                list(key_config.mappings.items()),
+                list(parallel_config.key_configs[k].mappings.items()),
+            )
+        self.assertEqual(
+            objs, list(iter_unflatten(rows, config, workers=2, chunk_size=4))
+        )
+        output = io.StringIO()
+        flatten_to_csv(objs, output, _config())
+        parallel_output = io.StringIO()
+        flatten_to_csv(objs, parallel_output, parallel_config, workers=2)
+        self.assertEqual(output.getvalue(), parallel_output.getvalue())
+        parallel_output.seek(0)
+        self.assertEqual(
+            objs,
+            list(iter_unflatten_from_csv(parallel_output, config, workers=2)),
+        )
+
+    def test_compiled_plan(self):
+        """
+        Tests compiling a configuration once and reusing it.
+        """
+        with open(INPUT) as stream:
+            objs = yaml.safe_load(stream)["all_book_series"]
+        original_objs_json = _json(objs)
+        kconfig = {
+            "creator": KeyConfig(delete=True, flatten=True),
+            "books": KeyConfig(delete=True, is_list=True, flatten=True),
+            "genres": KeyConfig(serializers=[Serializer.json]),
+        }
+        config = GlobalConfig(key_configs=kconfig)
+        plan = config.compile()
+        self.assertIsInstance(plan, FlattenPlan)
+        self.assertIs(config, plan.config)
+        flattened_objs = [plan.flatten_object(obj) for obj in objs]
+        # inputs are not modified
+        self.assertEqual(original_objs_json, _json(objs))
+        self.assertEqual("England", flattened_objs[0]["creator_from_country"])
+        self.assertEqual('["fantasy"]', flattened_objs[0]["genres_json"])
+        self.assertEqual(
+            "creator_from_country",
+            config.key_configs["creator"].mappings["from_country"],
+        )
+        self.assertEqual(flattened_objs, flatten(objs, plan))
+        self.assertEqual(flattened_objs, flatten(objs, config))
+        roundtripped_objs = [plan.unflatten_row(row) for row in flattened_objs]
+        self.assertEqual(objs, roundtripped_objs)
+        self.assertEqual(objs, unflatten(flattened_objs, plan))
+        output = io.StringIO()
+        flatten_to_csv(objs, output, plan)
+        inp = io.StringIO(output.getvalue())
+        self.assertEqual(objs, unflatten_from_csv(inp, plan))
+
+    def test_nested(self):
+        """
+        Tests flattening objects nested more than one level deep.
+        """
+        objs = [
+            {
+                "id": "B1",
+                "book": {
+                    "name": "FOTR",
+                    "author": {
+                        "name": "JRR Tolkein",
+                        "address": {"city": "Oxford", "country": "England"},
+                    },
+                    "price": 5.99,
+                },
+            },
+            {
+                "id": "B2",
+                "book": {"name": "TTT", "author": {"name": "JRR Tolkein"}},
+            },
+        ]
+        original_objs_json = _json(objs)
+
+        def _config(**kwargs) -> GlobalConfig:
+            kconfig = {"book": KeyConfig(delete=True, flatten=True, **kwargs)}
+            return GlobalConfig(key_configs=kconfig)
+
+        # no depth limit
+        config = _config(max_depth=0)
+        flattened_objs = flatten(objs, config)
+        self.assertEqual(
+            [
+                "id",
+                "book_name",
+                "book_author_name",
+                "book_author_address_city",
+                "book_author_address_country",
+                "book_price",
+            ],
+            list(flattened_objs[0].keys()),
+        )
+        self.assertEqual("Oxford", flattened_objs[0]["book_author_address_city"])
+        self.assertEqual(
+            ["author", "address", "city"],
+            config.key_configs["book"].paths["book_author_address_city"],
+        )
+        self.assertEqual(objs, unflatten(flattened_objs, config))
+        self.assertEqual(original_objs_json, _json(objs))
+        self._roundtrip_to_tsv(objs, config=_config(max_depth=0))
+        # limited depth: deeper objects are left as values
+        config = _config(max_depth=2)
+        flattened_objs = flatten(objs, config)
+        self.assertEqual(
+            {"city": "Oxford", "country": "England"},
+            flattened_objs[0]["book_author_address"],
+        )
+        self.assertEqual(objs, unflatten(flattened_objs, config))
+        # depth can be set globally; keys default to a single level
+        config = _config()
+        config.max_depth = 0
+        self.assertIn("book_author_address_city", flatten(objs, config)[0])
+        config = _config()
+        self.assertEqual(
+            {"name": "JRR Tolkein"}, flatten(objs, config)[1]["book_author"]
+        )
+
+    def test_yaml_serializers(self):
+        """
+        Tests block and flow style YAML serialization.
+        """
+        if yaml.__with_libyaml__:
+            self.assertIs(yaml.CSafeLoader, YAML_LOADER)
+            self.assertIs(yaml.CSafeDumper, YAML_DUMPER)
+        else:
+            self.assertIs(yaml.SafeLoader, YAML_LOADER)
+            self.assertIs(yaml.SafeDumper, YAML_DUMPER)
+        with open(INPUT) as stream:
+            objs = yaml.safe_load(stream)["all_book_series"]
+        for serializer in [Serializer.yaml, Serializer.yaml_flow]:
+            kconfig = {
+                "creator": KeyConfig(delete=True, serializers=[serializer]),
+                "books": KeyConfig(delete=True, serializers=[serializer]),
+            }
+            config = GlobalConfig(key_configs=kconfig)
+            flattened_objs = flatten(objs, config)
+            creator_field = f"creator_{serializer.value}"
+            self.assertIn(creator_field, flattened_objs[0])
+            self.assertEqual(objs, unflatten(flattened_objs, config))
+            self._roundtrip_to_tsv(objs, config=config)
+        self.assertEqual(
+            "{from_country: England, name: JRR Tolkein}",
+            flattened_objs[0]["creator_yaml_flow"],
+        )
+        self.assertNotIn("\n", flattened_objs[0]["books_yaml_flow"])
+
+    def test_serializer_registry(self):
+        """
+        Tests binary and third party serializers.
+
+        Binary output is encoded as text so that it survives a TSV roundtrip.
+        """
+        with open(INPUT) as stream:
+            objs = yaml.safe_load(stream)["all_book_series"]
+        names = ["pickle", "msgpack", "json_compact"]
+        if "msgpack" not in SERIALIZERS:
+            names.remove("msgpack")
+        for name in names:
+            kconfig = {
+                "creator": KeyConfig(delete=True, serializers=[name]),
+                "books": KeyConfig(delete=True, serializers=name),
+            }
+            config = GlobalConfig(key_configs=kconfig)
+            flattened_objs = flatten(objs, config)
+            self.assertIsInstance(flattened_objs[0][f"books_{name}"], str)
+            self.assertEqual(objs, unflatten(flattened_objs, config))
+            self._roundtrip_to_tsv(objs, config=config)
+        self.assertEqual(
+            '{"name":"JRR Tolkein","from_country":"England"}',
+            flattened_objs[0]["creator_json_compact"],
+        )
+        # third party serializers
+        register_serializer(
+            "reversed",
+            lambda v: json.dumps(v)[::-1],
+            lambda s: json.loads(s[::-1]),
+        )
+        try:
+            kconfig = {
+                "creator": KeyConfig(delete=True, serializers="reversed"),
+                "books": KeyConfig(delete=True, serializers="reversed"),
+            }
+            config = GlobalConfig(key_configs=kconfig)
+            flattened_objs = flatten(objs, config)
+            self.assertEqual(
+                json.dumps(objs[0]["creator"])[::-1],
+                flattened_objs[0]["creator_reversed"],
+            )
+            self._roundtrip_to_tsv(objs, config=config)
+            config2 = GlobalConfig.from_dict(**config.as_dict())
+            self.assertEqual(objs, unflatten(flattened_objs, config2))
+        finally:
+            del SERIALIZERS["reversed"]
+        with self.assertRaises(ValueError):
+            KeyConfig(serializers=["no_such_serializer"])
+
     def test_badly_formatted(self):
         """
         Tests graceful failure on badly formatted TSV input.
@@ -0,0 +1,203 @@
+"""Tests streaming readers and writers."""
+
+import io
+import json
+import unittest
+from pathlib import Path
+
+import yaml
+
+from json_flattener import formats
+from json_flattener.flattener import YAML_DUMPER
+from json_flattener.formats import (
+    JsonLinesFile,
+    ObjectFile,
+    iter_json_items,
+    iter_jsonl,
+    iter_yaml_items,
+    write_json_array,
+    write_jsonl,
+    write_yaml_documents,
+    write_yaml_list,
+)
+from json_flattener.json_backends import get_json_backend
+from tests import INPUT, OUTPUT_DIR
+
+OBJS = [
+    {"id": "X1", "tags": ["a", "b"], "nested": {"n": 1}},
+    {"id": "X2", "name": "line\nbreak"},
+]
+
+
+class FormatsCase(unittest.TestCase):
+    """Tests reading and writing streams of objects."""
+
+    def setUp(self) -> None:
+        Path(OUTPUT_DIR).mkdir(parents=True, exist_ok=True)
+
+    def test_jsonl(self):
+        """Tests JSON Lines roundtrip."""
+        for backend in ["json", "auto"]:
+            json_backend = get_json_backend(backend)
+            output = io.StringIO()
+            write_jsonl(iter(OBJS), output, json_backend)
+            lines = output.getvalue().split("\n")
+            # one object per line, including values with newlines
+            self.assertEqual(3, len(lines))
+            self.assertEqual("", lines[2])
+            inp = io.StringIO(output.getvalue() + "\n\n")
+            objs = iter_jsonl(inp, json_backend)
+            self.assertEqual(OBJS[0], next(objs))
+            self.assertEqual(OBJS[1:], list(objs))
+
+    def test_jsonl_file(self):
+        """Tests a JSON Lines file can be iterated more than once."""
+        path = str(Path(OUTPUT_DIR) / "formats.jsonl")
+        with open(path, "w") as stream:
+            write_jsonl(OBJS, stream)
+        source = JsonLinesFile(path)
+        self.assertEqual(OBJS, list(source))
+        self.assertEqual(OBJS, list(source))
+
+    def test_json_items(self):
+        """Tests incremental parsing of lists in JSON documents."""
+        doc = {
+            "before": {"skip": ["me", "[", "{", '\\"}'], "n": 1.5e3},
+            "s": 'x\\y"z',
+            "objs": OBJS + [{"n": 12345, "f": -0.25, "t": True, "z": None}],
+            "after": [1, 2, 3],
+        }
+        text = json.dumps(doc)
+        for chunk_size in [1, 2, 3, 7, 64, 2**16]:
+            items = formats._iter_json_items_scanner(
+                io.StringIO(text), "objs", chunk_size=chunk_size
+            )
+            self.assertEqual(doc["objs"], list(items))
+            items = formats._iter_json_items_scanner(
+                io.StringIO(json.dumps(doc["objs"], indent=2)),
+                chunk_size=chunk_size,
+            )
+            self.assertEqual(doc["objs"], list(items))
+        self.assertEqual(
+            [], list(formats._iter_json_items_scanner(io.StringIO(" [ ] ")))
+        )
+        with self.assertRaises(KeyError):
+            list(iter_json_items(io.StringIO(text), "no_such_key"))
+        with self.assertRaises(ValueError):
+            list(iter_json_items(io.StringIO(text), "before"))
+        with self.assertRaises(ValueError):
+            list(iter_json_items(io.StringIO('[{"a": 1} {"b": 2}]')))
+        # binary streams are parsed with ijson if available
+        items = iter_json_items(io.BytesIO(text.encode("utf-8")), "objs")
+        self.assertEqual(doc["objs"], list(items))
+        if formats.ijson is not None:
+            items = formats._iter_json_items_ijson(
+                io.BytesIO(text.encode("utf-8")), "objs"
+            )
+            self.assertEqual(doc["objs"], list(items))
+
+    def test_json_items_binary(self):
+        """Tests that binary and text streams are parsed alike."""
+        doc = {
+            "a.b": [{"n": 2**70, "f": 0.1, "e": 1e300, "l": [-(2**64), 1.0]}],
+            "objs": [{"x": 1}],
+            "s": "x",
+        }
+        text = json.dumps(doc)
+        parsers = [iter_json_items]
+        if formats.ijson is not None:
+            parsers.append(formats._iter_json_items_ijson)
+        for parse in parsers:
+            for key in ["a.b", "objs"]:
+                items = list(parse(io.BytesIO(text.encode("utf-8")), key))
+                self.assertEqual(doc[key], items)
+            items = list(parse(io.BytesIO(json.dumps(doc["a.b"]).encode())))
+            self.assertEqual(doc["a.b"], items)
+            self.assertIs(int, type(items[0]["n"]))
+            self.assertIs(float, type(items[0]["l"][1]))
+            with self.assertRaises(KeyError):
+                list(parse(io.BytesIO(text.encode("utf-8")), "no_such_key"))
+            with self.assertRaises(KeyError):
+                list(parse(io.BytesIO(b"{}"), "objs"))
+            for key in ["s", None]:
+                with self.assertRaises(ValueError):
+                    list(parse(io.BytesIO(text.encode("utf-8")), key))
+            with self.assertRaises(ValueError):
+                list(parse(io.BytesIO(b"[1, 2]"), "objs"))
+
+    def test_yaml_items(self):
+        """Tests incremental parsing of lists in YAML documents."""
+        with open(INPUT) as stream:
+            expected = yaml.safe_load(stream)["all_book_series"]
+        with open(INPUT) as stream:
+            items = iter_yaml_items(stream, "all_book_series")
+            self.assertEqual(expected[0], next(items))
+            self.assertEqual(expected[1:], list(items))
+        # multiple documents, each a list, an object, or a keyed list
+        text = yaml.safe_dump_all([expected[0:2], expected[2]])
+        self.assertEqual(
+            expected[0:3], list(iter_yaml_items(io.StringIO(text)))
+        )
+        text = yaml.safe_dump_all(
+            [
+                {"x": {"skip": [1, {"a": 2}]}, "books": expected[0:2]},
+                {"books": expected[2:]},
+            ]
+        )
+        items = iter_yaml_items(io.StringIO(text), "books")
+        self.assertEqual(expected, list(items))
+        with self.assertRaises(KeyError):
+            list(iter_yaml_items(io.StringIO(text), "no_such_key"))
+        # as for JSON, a key whose value is not a list is an error
+        with self.assertRaises(ValueError):
+            list(iter_yaml_items(io.StringIO("books: {id: B1}\n"), "books"))
+        # anchors and aliases are resolved within a document
+        text = "books:\n- &b1 {id: B1}\n- *b1\n"
+        items = iter_yaml_items(io.StringIO(text), "books")
+        self.assertEqual([{"id": "B1"}, {"id": "B1"}], list(items))
+
+    def test_object_file(self):
+        """Tests re-iterable incremental sources."""
+        with open(INPUT) as stream:
+            expected = yaml.safe_load(stream)["all_book_series"]
+        path = str(Path(OUTPUT_DIR) / "formats.json")
+        with open(path, "w") as stream:
+            json.dump({"all_book_series": expected}, stream)
+        for input_format, p in [("json", path), ("yaml", INPUT)]:
+            source = ObjectFile(p, input_format, "all_book_series")
+            self.assertEqual(expected, list(source))
+            self.assertEqual(expected, list(source))
+        with self.assertRaises(ValueError):
+            ObjectFile(path, "tsv")
+
+    def test_write_lists(self):
+        """Tests writing lists one element at a time."""
+        with open(INPUT) as stream:
+            expected = yaml.safe_load(stream)["all_book_series"]
+        for objs in [expected, expected[0:1], []]:
+            for key in [None, "all_book_series"]:
+                doc = objs if key is None else {key: objs}
+                output = io.StringIO()
+                write_json_array(iter(objs), output, key=key)
+                self.assertEqual(
+                    json.dumps(doc, indent=4, sort_keys=True), output.getvalue()
+                )
+                output = io.StringIO()
+                write_json_array(
+                    iter(objs), output, get_json_backend("auto"), key
+                )
+                self.assertEqual(doc, json.loads(output.getvalue()))
+                output = io.StringIO()
+                write_yaml_list(iter(objs), output, key=key)
+                self.assertEqual(
+                    yaml.dump(doc, Dumper=YAML_DUMPER), output.getvalue()
+                )
+        output = io.StringIO()
+        write_yaml_documents(iter(expected), output)
+        self.assertEqual(
+            expected, list(yaml.safe_load_all(io.StringIO(output.getvalue())))
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
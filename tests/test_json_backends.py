@@ -0,0 +1,119 @@
+"""Tests pluggable JSON implementations."""
+
+import io
+import json
+import unittest
+
+from json_flattener import (
+    GlobalConfig,
+    KeyConfig,
+    Serializer,
+    flatten,
+    unflatten,
+)
+from json_flattener.json_backends import (
+    JSON_BACKENDS,
+    JSONBackend,
+    available_json_backends,
+    get_json_backend,
+    register_json_backend,
+)
+
+OBJ = {
+    "id": "X1",
+    "name": "café / bar",
+    "n": 5,
+    "price": 5.99,
+    "flags": [True, False, None],
+    "nested": {"z": [1, 2.5, "three"], "a": {}},
+    "by_n": {1: "one", 2: "two"},
+    "big": [2**70, -(2**64), -(2**63) - 1, 2**64 - 1, 10**19],
+    "special": [float("nan"), float("inf"), -float("inf"), None],
+}
+
+
+def _canonical(obj) -> str:
+    # NaN is not equal to itself, and int keys are read back as strings
+    return json.dumps(obj, sort_keys=True)
+
+
+class JSONBackendCase(unittest.TestCase):
+    """Test each available backend against the standard library."""
+
+    def test_available_backends(self):
+        """Tests all installed backends parse to the same objects as json."""
+        names = available_json_backends()
+        self.assertIn("json", names)
+        for name in names:
+            backend = get_json_backend(name)
+            self.assertEqual(name, backend.name)
+            s = backend.dumps(OBJ)
+            self.assertIsInstance(s, str)
+            self.assertEqual(_canonical(OBJ), _canonical(json.loads(s)))
+            for text in [json.dumps(OBJ), json.dumps(OBJ).encode("utf-8")]:
+                obj = backend.loads(text)
+                self.assertEqual(_canonical(OBJ), _canonical(obj))
+                self.assertIs(int, type(obj["big"][0]))
+            output = io.StringIO()
+            backend.dump_document(OBJ, output)
+            obj = json.loads(output.getvalue())
+            self.assertEqual(_canonical(OBJ), _canonical(obj))
+            doc = backend.load_document(io.StringIO(output.getvalue()))
+            self.assertEqual(_canonical(OBJ), _canonical(doc))
+
+    def test_selection(self):
+        """Tests defaults, auto selection and fallback."""
+        self.assertEqual("json", get_json_backend().name)
+        self.assertIn(get_json_backend("auto").name, available_json_backends())
+        with self.assertRaises(ValueError):
+            get_json_backend("no_such_backend")
+
+        def _missing() -> JSONBackend:
+            raise ImportError("not installed")
+
+        register_json_backend("missing", _missing)
+        try:
+            self.assertNotIn("missing", available_json_backends())
+            self.assertEqual("json", get_json_backend("missing").name)
+        finally:
+            del JSON_BACKENDS["missing"]
+
+    def test_flatten_with_backend(self):
+        """Tests the json serializer uses the configured backend."""
+        calls = []
+        stdlib = get_json_backend("json")
+
+        def _dumps(obj) -> str:
+            calls.append(obj)
+            return stdlib.dumps(obj)
+
+        register_json_backend(
+            "counting",
+            lambda: JSONBackend(
+                name="counting",
+                dumps=_dumps,
+                loads=stdlib.loads,
+                dump_document=stdlib.dump_document,
+                load_document=stdlib.load_document,
+            ),
+        )
+        try:
+            for name in available_json_backends():
+                kconfig = {
+                    "nested": KeyConfig(
+                        delete=True, serializers=[Serializer.json]
+                    )
+                }
+                config = GlobalConfig(key_configs=kconfig, json_backend=name)
+                flattened_objs = flatten([OBJ], config)
+                self.assertEqual(
+                    OBJ["nested"], json.loads(flattened_objs[0]["nested_json"])
+                )
+                self.assertEqual([OBJ], unflatten(flattened_objs, config))
+            self.assertEqual([OBJ["nested"]], calls)
+        finally:
+            del JSON_BACKENDS["counting"]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+"""Tests SQLite export and import."""
+
+import sqlite3
+import unittest
+from datetime import date
+from pathlib import Path
+
+import yaml
+
+from json_flattener import (
+    GlobalConfig,
+    KeyConfig,
+    flatten_to_sqlite,
+    iter_unflatten_from_sqlite,
+    unflatten_from_sqlite,
+)
+from tests import INPUT, OUTPUT_DIR, books_config
+
+
+class SQLiteCase(unittest.TestCase):
+    """Test flattening to and unflattening from SQLite tables."""
+
+    def setUp(self) -> None:
+        """Load example objects."""
+        with open(INPUT) as stream:
+            self.objs = yaml.safe_load(stream)["all_book_series"]
+
+    def test_roundtrip(self):
+        """Tests writing a table and reading it back."""
+        conn = sqlite3.connect(":memory:")
+        config = books_config()
+        schema = flatten_to_sqlite(self.objs, conn, "books", config)
+        self.assertIn("books_price", schema)
+        (sql,) = conn.execute("SELECT sql FROM sqlite_master").fetchone()
+        self.assertIn('"id" TEXT', sql)
+        self.assertIn('"books_price" JSON TEXT', sql)
+        (price,) = conn.execute(
+            "SELECT books_price FROM books WHERE id = 'S001'"
+        ).fetchone()
+        self.assertEqual("[5.99, 5.99, 6.99]", price)
+        self.assertEqual(
+            self.objs, unflatten_from_sqlite(conn, "books", config)
+        )
+        # streamed in small transactions, with columns from a first pass
+        path = str(Path(OUTPUT_DIR) / "books.db")
+        flatten_to_sqlite(
+            self.objs,
+            path,
+            "books",
+            config,
+            two_pass=True,
+            batch_size=2,
+            wal=True,
+        )
+        with sqlite3.connect(path) as conn2:
+            (mode,) = conn2.execute("PRAGMA journal_mode").fetchone()
+            self.assertEqual("wal", mode)
+        objs = iter_unflatten_from_sqlite(path, "books", config, batch_size=2)
+        self.assertEqual(self.objs, list(objs))
+        with self.assertRaises(ValueError):
+            flatten_to_sqlite(
+                iter(self.objs), path, "books", config, two_pass=True
+            )
+
+    def test_types(self):
+        """Tests values are read back with the same types."""
+        conn = sqlite3.connect(":memory:")
+        objs = [
+            {"id": "001", "ok": True, "d": date(2020, 1, 2), "n": 1, "x": 1.5},
+            {"id": "002", "ok": False, "xs": [1, "a"], "m": {"a": [1]}},
+            {"id": "003", "n": 2, "x": 3, "mixed": "a"},
+            {"id": "004", "mixed": 4},
+        ]
+        flatten_to_sqlite(objs, conn)
+        self.assertEqual(objs, unflatten_from_sqlite(conn))
+        info = conn.execute("PRAGMA table_info(objects)").fetchall()
+        self.assertEqual(
+            [
+                "TEXT",
+                "BOOLEAN",
+                "DATE",
+                "INTEGER",
+                "",
+                "JSON TEXT",
+                "JSON TEXT",
+                "",
+            ],
+            [row[2] for row in info],
+        )
+        # ints and floats in one column keep their types
+        self.assertEqual(
+            [float, int],
+            [
+                type(obj["x"])
+                for obj in unflatten_from_sqlite(conn)
+                if "x" in obj
+            ],
+        )
+        # declared types
+        config = GlobalConfig(column_types={"n": "float"})
+        flatten_to_sqlite(objs, conn, config=config)
+        self.assertEqual(
+            [1.0, None, 2.0, None],
+            [obj.get("n") for obj in unflatten_from_sqlite(conn)],
+        )
+        # numbers in JSON columns are kept as written, e.g. 1.0 as a float
+        objs = [{"id": "001", "v": [1.0]}, {"id": "002", "v": 1.0}]
+        flatten_to_sqlite(objs, conn, "floats")
+        self.assertEqual(objs, unflatten_from_sqlite(conn, "floats"))
+        self.assertIs(
+            float, type(unflatten_from_sqlite(conn, "floats")[1]["v"])
+        )
+
+    def test_if_exists(self):
+        """Tests replacing and appending to tables."""
+        conn = sqlite3.connect(":memory:")
+        objs = [{"id": "X1"}, {"id": "X2"}]
+        flatten_to_sqlite(objs, conn)
+        flatten_to_sqlite(objs, conn)
+        self.assertEqual(objs, unflatten_from_sqlite(conn))
+        flatten_to_sqlite(objs, conn, if_exists="append")
+        self.assertEqual(objs + objs, unflatten_from_sqlite(conn))
+        with self.assertRaises(sqlite3.OperationalError):
+            flatten_to_sqlite(objs, conn, if_exists="fail")
+        with self.assertRaises(ValueError):
+            flatten_to_sqlite(objs, conn, if_exists="ignore")
+        with self.assertRaises(ValueError):
+            flatten_to_sqlite(objs, conn, pragmas={"synchronous": "off; DROP"})
+        # lists are only allowed in columns known to hold them
+        with self.assertRaises(ValueError):
+            flatten_to_sqlite(
+                [{"x": 1}, {"x": [2]}],
+                conn,
+                "t",
+                fieldnames=["x"],
+                batch_size=1,
+            )
+        with self.assertRaises(ValueError):
+            unflatten_from_sqlite(conn, "no_such_table")
+
+    def test_child_tables(self):
+        """Tests writing list elements of child keys to child tables."""
+        conn = sqlite3.connect(":memory:")
+        config = GlobalConfig(
+            key_configs={
+                "creator": KeyConfig(delete=True, flatten=True),
+                "books": KeyConfig(child_table=True),
+            }
+        )
+        flatten_to_sqlite(self.objs, conn, "series", config, batch_size=2)
+        (n,) = conn.execute(
+            "SELECT COUNT(*) FROM series_books WHERE price > 6"
+        ).fetchone()
+        self.assertGreater(n, 0)
+        self.assertEqual(
+            self.objs, unflatten_from_sqlite(conn, "series", config)
+        )
+        # row numbers continue from those already in the table
+        flatten_to_sqlite(self.objs, conn, "series", config, if_exists="append")
+        self.assertEqual(
+            self.objs + self.objs, unflatten_from_sqlite(conn, "series", config)
+        )